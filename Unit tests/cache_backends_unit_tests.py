@@ -0,0 +1,274 @@
+import asyncio
+import fnmatch
+import time
+import unittest
+from cache_backends import CacheBackendError, DictBackend, RedisBackend, dump_value, load_value
+from tiered_caching import TieredCache
+
+
+class FakeRedisServer:
+    """
+    Minimal in-process server speaking the Redis protocol. Supports the commands used by RedisBackend.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.commands = []
+        self.server = None
+        self.port = None
+        # Seconds waited before each reply
+        self.reply_delay = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def get(self, key: bytes):
+        value, expires = self.items.get(key, (None, None))
+        if expires is not None and expires <= time.monotonic():
+            del self.items[key]
+            return None
+        return value
+
+    @staticmethod
+    def encode(reply) -> bytes:
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, str):
+            return f"+{reply}\r\n".encode()
+        if isinstance(reply, int):
+            return f":{reply}\r\n".encode()
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        return b"*%d\r\n" % len(reply) + b"".join(FakeRedisServer.encode(item) for item in reply)
+
+    def execute(self, command: str, args: list):
+        self.commands.append(command)
+        if command == "GET":
+            return self.get(args[0])
+        if command == "SET":
+            key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+            if b"NX" in options and self.get(key) is not None:
+                return None
+            expires = None
+            if b"PX" in options:
+                expires = time.monotonic() + int(options[options.index(b"PX") + 1]) / 1000
+            self.items[key] = (value, expires)
+            return "OK"
+        if command == "DEL":
+            return sum(self.items.pop(key, None) is not None for key in args)
+        if command == "SCAN":
+            pattern = args[args.index(b"MATCH") + 1].decode("latin-1")
+            return [b"0", [key for key in list(self.items) if self.get(key) is not None and
+                           fnmatch.fnmatchcase(key.decode("latin-1"), pattern)]]
+        if command in ("SELECT", "AUTH", "PING"):
+            return "OK"
+        return Exception(f"ERR unknown command '{command}'")
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = []
+                for _ in range(int(line[1:-2])):
+                    length = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                reply = self.execute(args[0].decode().upper(), args[1:])
+                if self.reply_delay:
+                    await asyncio.sleep(self.reply_delay)
+                if isinstance(reply, Exception):
+                    writer.write(f"-{reply}\r\n".encode())
+                else:
+                    writer.write(self.encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class CacheBackendTesting(unittest.TestCase):
+
+    def test_serialization(self):
+        for value in ["text", 1, None, {"a": [1, 2, 3]}, ("tuple", 2.5), "x" * 10000]:
+            self.assertEqual(load_value(dump_value(value)), value)
+
+        # Long values are compressed, short ones are not
+        self.assertLess(len(dump_value("x" * 10000)), 1000)
+        self.assertEqual(dump_value("text")[:1], b"\x00")
+        self.assertRaises(ValueError, load_value, b"\x80invalid")
+
+    def test_dict_backend(self):
+        async def run():
+            backend = DictBackend(item_lifetime=60)
+            await backend.set("a", 1)
+            await backend.set("b", 2, ttl=0.1)
+            self.assertEqual(await backend.get("a"), 1)
+            self.assertEqual(await backend.get("b"), 2)
+            await asyncio.sleep(0.2)
+            with self.assertRaises(KeyError):
+                await backend.get("b")
+            await backend.delete("a")
+            self.assertEqual(await backend.length(), 0)
+            self.assertTrue(await backend.try_lock("a", 1))
+
+        asyncio.run(run())
+
+    def test_redis_backend(self):
+        async def run():
+            server = FakeRedisServer()
+            await server.start()
+            backend = RedisBackend(f"redis://127.0.0.1:{server.port}/1", namespace="test", item_lifetime=60,
+                                   secret="secret")
+            other = RedisBackend(f"redis://127.0.0.1:{server.port}/1", namespace="other", secret="secret")
+
+            await backend.set("a", {"value": [1, 2, 3]})
+            await backend.set(("tuple", 1), "b", ttl=0.1)
+            await other.set("a", "other")
+            self.assertEqual(await backend.get("a"), {"value": [1, 2, 3]})
+            self.assertEqual(await backend.get(("tuple", 1)), "b")
+            self.assertEqual(await other.get("a"), "other")
+            self.assertEqual(await backend.length(), 2)
+            with self.assertRaises(KeyError):
+                await backend.get("missing")
+
+            # Lifetimes are native key expirations
+            await asyncio.sleep(0.2)
+            with self.assertRaises(KeyError):
+                await backend.get(("tuple", 1))
+
+            await backend.delete("a")
+            with self.assertRaises(KeyError):
+                await backend.get("a")
+
+            # Fetch locks are exclusive until released or expired
+            self.assertTrue(await backend.try_lock("a", 10))
+            self.assertFalse(await backend.try_lock("a", 10))
+            await backend.unlock("a")
+            self.assertTrue(await backend.try_lock("a", 0.1))
+            await asyncio.sleep(0.2)
+            self.assertTrue(await backend.try_lock("a", 10))
+
+            with self.assertRaises(CacheBackendError):
+                await backend.execute("UNKNOWN")
+            self.assertEqual(server.commands.count("SELECT"), 2)
+
+            await backend.close()
+            await other.close()
+            await server.stop()
+
+            # Operations fail cleanly when the server is not available
+            with self.assertRaises(CacheBackendError):
+                await backend.get("a")
+
+        asyncio.run(run())
+
+    def test_redis_signed_values(self):
+        async def run():
+            server = FakeRedisServer()
+            await server.start()
+            url = f"redis://127.0.0.1:{server.port}"
+            backend = RedisBackend(url, namespace="test", secret="secret")
+            await backend.set("a", "value a")
+            await backend.set("b", "value b")
+            stored = {key: value for key, (value, _) in server.items.items()}
+            key_a, key_b = sorted(stored)
+
+            # Values written without the secret are never unpickled
+            class Payload:
+                def __reduce__(self):
+                    return exec, ("raise AssertionError('Unpickled')",)
+
+            server.items[key_a] = (dump_value(Payload()), None)
+            with self.assertRaises(KeyError):
+                await backend.get("a")
+            server.items[key_a] = (b"\x00" * 40, None)
+            with self.assertRaises(KeyError):
+                await backend.get("a")
+            # Signed values can not be moved to another key
+            server.items[key_a] = (stored[key_b], None)
+            with self.assertRaises(KeyError):
+                await backend.get("a")
+            other = RedisBackend(url, namespace="test", secret="other")
+            with self.assertRaises(KeyError):
+                await other.get("b")
+            await other.close()
+            self.assertEqual(await backend.get("b"), "value b")
+
+            # Signed values that can not be loaded are misses too
+            backend_key = backend._RedisBackend__dump_key("c")
+            server.items[backend_key] = (backend._RedisBackend__sign(backend_key, b"\x02data") + b"\x02data", None)
+            with self.assertRaises(KeyError):
+                await backend.get("c")
+
+            with self.assertRaises(ValueError):
+                RedisBackend(url, secret="")
+            await backend.close()
+            await server.stop()
+
+        asyncio.run(run())
+
+    def test_redis_cancelled(self):
+        async def run():
+            server = FakeRedisServer()
+            await server.start()
+            backend = RedisBackend(f"redis://127.0.0.1:{server.port}", namespace="test", secret="secret")
+            await backend.set("a", "value a")
+            await backend.set("b", "value b")
+
+            # The reply to a cancelled command is not read by the next one
+            server.reply_delay = 0.2
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(backend.get("a"), 0.1)
+            server.reply_delay = 0
+            await asyncio.sleep(0.2)
+            self.assertEqual(await backend.get("b"), "value b")
+            await backend.close()
+            await server.stop()
+
+        asyncio.run(run())
+
+    def test_shared_tiered_cache(self):
+        calls = []
+
+        async def loader(value):
+            calls.append(value)
+            await asyncio.sleep(0.2)
+            return value
+
+        async def run():
+            server = FakeRedisServer()
+            await server.start()
+            url = f"redis://127.0.0.1:{server.port}"
+            first = TieredCache("first", RedisBackend(url, namespace="shared", secret="secret"),
+                                fetch_poll_interval=0.01)
+            second = TieredCache("second", RedisBackend(url, namespace="shared", secret="secret"),
+                                 fetch_poll_interval=0.01)
+
+            # Only one of the caches fetches the value, the other one waits for it in the shared backend
+            results = await asyncio.gather(first.get_or_fetch("a", lambda: loader("A")),
+                                           second.get_or_fetch("a", lambda: loader("B")))
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(results, [calls[0]] * 2)
+
+            third = TieredCache("third", RedisBackend(url, namespace="shared", secret="secret"))
+            self.assertEqual(await third.get_or_fetch("a", lambda: loader("C")), calls[0])
+            self.assertEqual(len(calls), 1)
+
+            # Without the server the caches fall back to fetching
+            for cache in (first, second, third):
+                await cache.close()
+            await server.stop()
+            self.assertEqual(await first.get_or_fetch("b", lambda: loader("D")), "D")
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
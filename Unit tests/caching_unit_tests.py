@@ -1,8 +1,37 @@
+import asyncio
 import random
 import string
 import unittest
 import time
-from caching import Cache, CacheItem
+import timeit
+import datetime
+import os
+import tempfile
+import tracemalloc
+import weakref
+from caching import Cache, CacheItem, EEvictionPolicy, EEvictionReason, estimate_size, registry, CacheJanitor, \
+    ShardedCache, cached
+from concurrent.futures import ThreadPoolExecutor
+
+# Timings depend on the machine, so the benchmarks only assert them when ASSERT_BENCHMARKS=1 is set
+ASSERT_BENCHMARKS = os.environ.get("ASSERT_BENCHMARKS") == "1"
+
+
+class LegacyCacheItem:
+    """
+    The original CacheItem implementation with a per-instance __dict__ and datetime bookkeeping. Used as a reference
+    for measuring the current implementation.
+    """
+
+    def __init__(self, key, value):
+        self.last_hit = datetime.datetime.utcnow()
+        self.key = key
+        self.value = value
+        self.total_hits = 0
+
+    def _hit(self):
+        self.last_hit = datetime.datetime.utcnow()
+        self.total_hits += 1
 
 
 class CacheTesting(unittest.TestCase):
@@ -173,6 +202,45 @@ class CacheTesting(unittest.TestCase):
         cache.delete_deprecated()
         self.assertTrue(len(cache) == 1)
 
+    def test_delete_deprecated_indexed(self):
+        cache = Cache()
+        cache.set_item_lifetime(seconds=1)
+
+        for i in range(1000):
+            cache[i] = i
+        # Replaced and deleted items leave stale entries into the expiry index, those must be skipped
+        for i in range(100):
+            cache[i] = -i
+        for i in range(100, 200):
+            del cache[i]
+
+        time.sleep(0.6)
+        for i in range(200, 300):
+            _ = cache[i]
+        time.sleep(0.6)
+
+        # Requested items must be preserved even though they were indexed with an older last hit
+        self.assertEqual(cache.delete_deprecated(), 800)
+        self.assertEqual(set(cache.keys()), set(range(200, 300)))
+        self.assertEqual(cache.delete_deprecated(), 0)
+
+        time.sleep(0.6)
+        self.assertEqual(cache.delete_deprecated(), 100)
+        self.assertEqual(len(cache), 0)
+
+    def test_lazy_expiry(self):
+        cache = Cache(lazy_expiry=True)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.assertEqual(cache["a"], 1)
+
+        cache.set_item_lifetime(seconds=1)
+        time.sleep(1.1)
+        self.assertRaises(KeyError, cache.__getitem__, "a")
+        self.assertFalse("a" in cache)
+        self.assertEqual(cache.get("b", -1), -1)
+        self.assertEqual(len(cache), 0)
+
     def test_delete_unpopular(self):
         cache = Cache()
 
@@ -205,6 +273,704 @@ class CacheTesting(unittest.TestCase):
             cond = key % 10 != 0 and value.value % 25 != 0
             self.assertTrue(cond)
 
+    def test_max_size(self):
+        cache = Cache(max_size=10)
+
+        for i in range(100):
+            cache[i] = i
+            self.assertTrue(len(cache) <= 10)
+
+        self.assertEqual(list(cache.keys()), list(range(90, 100)))
+        cache.set_max_size(5)
+        self.assertEqual(list(cache.keys()), list(range(95, 100)))
+        self.assertRaises(ValueError, cache.set_max_size, 0)
+
+        # Overwriting an existing key must not evict anything
+        cache[99] = "overwritten"
+        self.assertEqual(len(cache), 5)
+        self.assertTrue(95 in cache)
+
+        cache.reset_max_size()
+        for i in range(100):
+            cache[i] = i
+        self.assertEqual(len(cache), 100)
+
+    def test_evict_lru(self):
+        cache = Cache(max_size=3, eviction_policy=EEvictionPolicy.lru)
+        cache["a"] = 1
+        cache["b"] = 2
+        cache["c"] = 3
+
+        _ = cache["a"]
+        cache["d"] = 4
+        self.assertFalse("b" in cache)
+        self.assertTrue("a" in cache)
+
+        _ = cache.get("c")
+        cache["e"] = 5
+        self.assertEqual(set(cache.keys()), {"c", "d", "e"})
+
+    def test_evict_lfu(self):
+        cache = Cache(max_size=3, eviction_policy=EEvictionPolicy.lfu)
+        cache["a"] = 1
+        cache["b"] = 2
+        cache["c"] = 3
+
+        for _ in range(3):
+            _ = cache["a"]
+        _ = cache["b"]
+        _ = cache["c"]
+        _ = cache["c"]
+
+        # New items must not be evicted right after they are added even though they have no hits yet
+        cache["d"] = 4
+        self.assertEqual(set(cache.keys()), {"a", "c", "d"})
+        cache["e"] = 5
+        self.assertEqual(set(cache.keys()), {"a", "c", "e"})
+
+        # Ties are broken by the least recent use
+        _ = cache["e"]
+        _ = cache["e"]
+        cache["f"] = 6
+        self.assertEqual(set(cache.keys()), {"a", "e", "f"})
+
+        # Eviction indexes must survive deletions of all kinds
+        del cache["f"]
+        self.assertEqual(cache.pop("e"), 5)
+        cache.delete_unpopular(1)
+        self.assertEqual(set(cache.keys()), {"a"})
+        for key in "ghij":
+            cache[key] = key
+        self.assertEqual(len(cache), 3)
+        self.assertTrue("a" in cache)
+
+    def test_evict_fifo(self):
+        cache = Cache(max_size=3, eviction_policy=EEvictionPolicy.fifo)
+        cache["a"] = 1
+        cache["b"] = 2
+        cache["c"] = 3
+
+        for _ in range(5):
+            _ = cache["a"]
+        cache["d"] = 4
+        self.assertEqual(set(cache.keys()), {"b", "c", "d"})
+
+    def test_get_or_fetch(self):
+        cache = Cache()
+        calls = []
+
+        async def loader(value):
+            calls.append(value)
+            await asyncio.sleep(0.1)
+            return value
+
+        async def failing_loader():
+            calls.append(None)
+            await asyncio.sleep(0.1)
+            raise ValueError("Fetch failed")
+
+        async def run():
+            results = await asyncio.gather(*[cache.get_or_fetch("a", lambda: loader("A")) for _ in range(10)],
+                                           *[cache.get_or_fetch("b", lambda: loader("B")) for _ in range(10)])
+            self.assertEqual(results, ["A"] * 10 + ["B"] * 10)
+            self.assertEqual(sorted(calls), ["A", "B"])
+            self.assertEqual(cache["a"], "A")
+
+            # Cached items are returned without calling the loader
+            self.assertEqual(await cache.get_or_fetch("a", lambda: loader("C")), "A")
+            self.assertEqual(len(calls), 2)
+
+            calls.clear()
+            results = await asyncio.gather(*[cache.get_or_fetch("c", failing_loader) for _ in range(10)],
+                                           return_exceptions=True)
+            self.assertEqual(len(calls), 1)
+            self.assertTrue(all(isinstance(result, ValueError) for result in results))
+            self.assertFalse("c" in cache)
+
+            # Failures are not cached, so the next call fetches again
+            self.assertEqual(await cache.get_or_fetch("c", lambda: loader("C")), "C")
+            self.assertEqual(len(calls), 2)
+
+            # Cancelling one caller does not cancel the shared fetch
+            first = asyncio.ensure_future(cache.get_or_fetch("d", lambda: loader("D")))
+            second = asyncio.ensure_future(cache.get_or_fetch("d", lambda: loader("D")))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            self.assertEqual(await second, "D")
+            self.assertEqual(cache["d"], "D")
+
+        asyncio.run(run())
+
+    def test_max_age(self):
+        cache = Cache()
+        calls = []
+
+        async def loader(value):
+            calls.append(value)
+            await asyncio.sleep(0.1)
+            return value
+
+        async def run():
+            cache.set_max_age(seconds=1)
+            self.assertEqual(await cache.get_or_fetch("a", lambda: loader(1)), 1)
+            await asyncio.sleep(1)
+            # Outdated items are fetched again before returning
+            self.assertEqual(await cache.get_or_fetch("a", lambda: loader(2)), 2)
+            self.assertEqual(calls, [1, 2])
+
+            cache.set_max_age(seconds=1, stale_while_revalidate=True)
+            await asyncio.sleep(1)
+            # Outdated value is returned while it is refreshed in the background, only once for concurrent callers
+            results = await asyncio.gather(*[cache.get_or_fetch("a", lambda: loader(3)) for _ in range(5)])
+            self.assertEqual(results, [2] * 5)
+            await asyncio.sleep(0.2)
+            self.assertEqual(calls, [1, 2, 3])
+            self.assertEqual(await cache.get_or_fetch("a", lambda: loader(4)), 3)
+            # Refreshed items keep their hits
+            self.assertEqual(dict(cache.items())["a"].total_hits, 7)
+
+            # Failing background refreshes keep the old value
+            async def failing_loader():
+                raise ValueError("Refresh failed")
+            await asyncio.sleep(1)
+            self.assertEqual(await cache.get_or_fetch("a", failing_loader), 3)
+            await asyncio.sleep(0)
+            self.assertEqual(cache["a"], 3)
+
+            cache.reset_max_age()
+            self.assertEqual(await cache.get_or_fetch("a", lambda: loader(5)), 3)
+
+        asyncio.run(run())
+
+    def test_refresh_ahead(self):
+        cache = Cache()
+        calls = []
+
+        async def loader(value):
+            calls.append(value)
+            return value
+
+        async def run():
+            cache.set_max_age(seconds=1)
+            cache.set_refresh_ahead(hits_limit=3, seconds=0.5)
+            await cache.get_or_fetch("popular", lambda: loader(1))
+            await cache.get_or_fetch("unpopular", lambda: loader(1))
+            for _ in range(3):
+                await cache.get_or_fetch("popular", lambda: loader(2))
+            self.assertEqual(calls, [1, 1])
+
+            await asyncio.sleep(0.6)
+            # Popular item is refreshed in the background before it gets outdated, unpopular one is not
+            self.assertEqual(await cache.get_or_fetch("popular", lambda: loader(2)), 1)
+            self.assertEqual(await cache.get_or_fetch("unpopular", lambda: loader(2)), 1)
+            await asyncio.sleep(0)
+            self.assertEqual(calls, [1, 1, 2])
+            self.assertEqual(cache["popular"], 2)
+
+        asyncio.run(run())
+
+    def test_negative_results(self):
+        cache = Cache(max_size=5)
+        cache.set_negative_lifetime(seconds=1)
+        self.assertRaises(ValueError, cache.set_negative_lifetime, 0)
+
+        cache["a"] = 1
+        cache.add_negative("a")
+        cache.add_negative("b")
+        self.assertFalse("a" in cache)
+        self.assertTrue(cache.is_negative("a"))
+        self.assertTrue(cache.is_negative("b"))
+        self.assertFalse(cache.is_negative("c"))
+
+        # Adding an item removes the negative result
+        cache["b"] = 2
+        self.assertFalse(cache.is_negative("b"))
+        self.assertEqual(cache["b"], 2)
+
+        # Negative results are limited by the max size too
+        for i in range(10):
+            cache.add_negative(i)
+        self.assertFalse(cache.is_negative(0))
+        self.assertTrue(cache.is_negative(9))
+
+        time.sleep(1)
+        self.assertFalse(cache.is_negative(9))
+        cache.add_negative("d")
+        cache.delete_deprecated()
+        self.assertTrue(cache.is_negative("d"))
+        for i in range(5, 9):
+            self.assertFalse(cache.is_negative(i))
+
+    def test_snapshot_restore(self):
+        cache = Cache(eviction_policy=EEvictionPolicy.lfu)
+        for i in range(100):
+            cache[i] = {"value": self.generate_string()}
+        for _ in range(5):
+            _ = cache[50]
+        time.sleep(0.2)
+        _ = cache[60]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "test.cache")
+            self.assertEqual(cache.snapshot(path), 100)
+            self.assertFalse(os.path.exists(f"{path}.tmp"))
+
+            restored = Cache(eviction_policy=EEvictionPolicy.lfu)
+            self.assertEqual(restored.restore(path), 100)
+            self.assertEqual(list(restored.keys()), list(cache.keys()))
+            for cache_key, cache_item in cache.items():
+                restored_item = dict(restored.items())[cache_key]
+                self.assertEqual(restored_item.value, cache_item.value)
+                self.assertEqual(restored_item.total_hits, cache_item.total_hits)
+                self.assertTrue(abs(restored_item.age - cache_item.age) < 0.05)
+                self.assertTrue(abs((restored_item.last_hit - cache_item.last_hit).total_seconds()) < 0.05)
+
+            # Restored hits must be usable for eviction
+            restored.set_max_size(2)
+            self.assertEqual(set(restored.keys()), {50, 60})
+
+            with open(path, "r+b") as snapshot_file:
+                snapshot_file.seek(-1, os.SEEK_END)
+                last_byte = snapshot_file.read(1)
+                snapshot_file.seek(-1, os.SEEK_END)
+                snapshot_file.write(bytes([last_byte[0] ^ 0xFF]))
+            self.assertRaises(ValueError, Cache().restore, path)
+
+            with open(path, "wb") as snapshot_file:
+                snapshot_file.write(b"Not a snapshot at all")
+            self.assertRaises(ValueError, Cache().restore, path)
+
+    def test_snapshot_restore_benchmark(self):
+        n = 100000
+        cache = Cache()
+        for i in range(n):
+            cache[f"https://wiki.melvoridle.com/index.php?title=Page_{i}"] = self.generate_string(200)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "benchmark.cache")
+            start = time.perf_counter()
+            cache.snapshot(path)
+            snapshot_time = time.perf_counter() - start
+
+            restored = Cache()
+            start = time.perf_counter()
+            restored.restore(path)
+            restore_time = time.perf_counter() - start
+
+        print(f"\nSnapshot of {n} items: written in {snapshot_time:.3f} s, restored in {restore_time:.3f} s")
+        self.assertEqual(len(restored), n)
+        if ASSERT_BENCHMARKS:
+            self.assertLess(restore_time, 1)
+
+    def test_statistics(self):
+        cache = Cache("stats", max_size=10, lazy_expiry=True)
+        for i in range(15):
+            cache[i] = i
+        for i in range(15):
+            cache.get(i)
+        cache.add_negative("a")
+
+        statistics = cache.statistics
+        self.assertEqual(statistics.sets, 15)
+        self.assertEqual(statistics.hits, 10)
+        self.assertEqual(statistics.misses, 5)
+        self.assertEqual(statistics.hit_ratio, 10 / 15)
+        self.assertEqual(statistics.evictions[EEvictionReason.size], 5)
+
+        cache.delete_unpopular(2)
+        cache[20] = 20
+        cache.delete_delegated(lambda cache_item: cache_item.key == 20)
+        cache.set_item_lifetime(seconds=1)
+        cache[21] = 21
+        time.sleep(1)
+        self.assertRaises(KeyError, cache.__getitem__, 21)
+        self.assertEqual(statistics.evictions[EEvictionReason.unpopular], 10)
+        self.assertEqual(statistics.evictions[EEvictionReason.delegated], 1)
+        self.assertEqual(statistics.evictions[EEvictionReason.expired], 1)
+
+        # Explicit deletions are not evictions
+        cache[22] = 22
+        del cache[22]
+        self.assertEqual(sum(statistics.evictions.values()), 17)
+
+        cache[23] = "x" * 1000
+        dump = cache.get_statistics()
+        self.assertEqual(dump["name"], "stats")
+        self.assertEqual(dump["size"], 1)
+        self.assertEqual(dump["negative_size"], 1)
+        self.assertEqual(dump["evictions"], {"size": 5, "weight": 0, "expired": 1, "unpopular": 10,
+                                              "delegated": 1})
+        self.assertTrue(1000 < dump["approximate_bytes"] < 2000)
+
+        statistics.reset()
+        self.assertEqual(statistics.hits, 0)
+        self.assertEqual(statistics.hit_ratio, None)
+
+    def test_estimate_size(self):
+        shared = "x" * 1000
+        self.assertTrue(estimate_size(shared) >= 1000)
+        self.assertTrue(estimate_size([shared, shared]) < 2000)
+        self.assertTrue(estimate_size({"a": [shared], "b": ("y" * 1000,)}) >= 2000)
+
+        cyclic = []
+        cyclic.append(cyclic)
+        self.assertTrue(estimate_size(cyclic) > 0)
+
+    def test_registry(self):
+        name = self.generate_string()
+        cache = Cache(name)
+        other = Cache(name)
+        self.assertTrue(any(registered is cache for registered in registry))
+        self.assertTrue(registry.get(name) is cache)
+        self.assertEqual(registry.get(self.generate_string()), None)
+
+        # Registry does not keep caches alive
+        num_caches = len(registry)
+        del cache
+        self.assertEqual(len(registry), num_caches - 1)
+        self.assertTrue(registry.get(name) is other)
+
+    def test_janitor(self):
+        janitor = CacheJanitor(batch_size=100)
+        cache = Cache()
+        cache.set_item_lifetime(seconds=1)
+        unlimited = Cache()
+        for i in range(1050):
+            cache[i] = i
+            unlimited[i] = i
+
+        async def run():
+            self.assertEqual(await janitor.sweep(), 0)
+            await asyncio.sleep(0.6)
+            for i in range(50):
+                _ = cache[i]
+            await asyncio.sleep(0.6)
+
+            self.assertTrue(cache.has_deprecated())
+            self.assertEqual(cache.delete_deprecated(max_items=100), 50)
+            self.assertTrue(cache.has_deprecated())
+
+            # Count other task's turns to ensure the janitor gives control back to the loop between batches
+            turns = 0
+
+            async def count_turns():
+                nonlocal turns
+                while True:
+                    turns += 1
+                    await asyncio.sleep(0)
+
+            counter = asyncio.ensure_future(count_turns())
+            await asyncio.sleep(0)
+            self.assertEqual(await janitor.sweep(), 950)
+            counter.cancel()
+            self.assertTrue(turns >= 9)
+
+            self.assertFalse(cache.has_deprecated())
+            self.assertEqual(set(cache.keys()), set(range(50)))
+            self.assertEqual(len(unlimited), 1050)
+
+        asyncio.run(run())
+
+    def test_max_bytes(self):
+        cache = Cache(max_bytes=1000, weigher=len)
+        cache["a"] = "x" * 400
+        cache["b"] = "x" * 400
+        self.assertEqual(cache.total_weight, 800)
+
+        _ = cache["a"]
+        cache["c"] = "x" * 300
+        self.assertEqual(set(cache.keys()), {"a", "c"})
+        self.assertEqual(cache.total_weight, 700)
+
+        # Replacing an item frees its old weight first
+        cache["a"] = "x" * 701
+        self.assertEqual(set(cache.keys()), {"a"})
+        self.assertEqual(cache.total_weight, 701)
+
+        # Values bigger than the whole budget are not stored
+        cache["d"] = "x" * 1001
+        self.assertFalse("d" in cache)
+        self.assertEqual(cache.total_weight, 701)
+        self.assertEqual(cache.statistics.evictions[EEvictionReason.weight], 3)
+
+        cache.pop("a")
+        cache["e"] = "x" * 10
+        cache.popitem()
+        self.assertEqual(cache.total_weight, 0)
+
+        # Setting a byte limit for an existing cache weighs its current items
+        cache = Cache(weigher=len)
+        for i in range(10):
+            cache[i] = "x" * 100
+        self.assertEqual(cache.total_weight, 0)
+        cache.set_max_bytes(550)
+        self.assertEqual(set(cache.keys()), set(range(5, 10)))
+        self.assertEqual(cache.total_weight, 500)
+        cache.reset_max_bytes()
+        self.assertEqual(cache.total_weight, 0)
+
+        default_weigher = Cache(max_bytes=10000)
+        default_weigher["a"] = "x" * 1000
+        default_weigher["b"] = ["x" * 1000, "y" * 1000]
+        self.assertTrue(3000 < default_weigher.total_weight < 4000)
+
+    def test_removed_values_freed(self):
+        class Payload:
+            def __init__(self):
+                self.data = bytes(100000)
+
+        cache = Cache(max_bytes=1000000, weigher=lambda payload: len(payload.data))
+        references = []
+        for i in range(40):
+            payload = Payload()
+            references.append(weakref.ref(payload))
+            cache[i] = payload
+        del payload
+        self.assertEqual(len(cache), 10)
+        # Only the values still in the cache are alive after the evictions
+        self.assertEqual(sum(reference() is not None for reference in references), len(cache))
+
+        del cache[39]
+        cache.delete_many([38, 37])
+        cache.pop(36)
+        self.assertEqual(sum(reference() is not None for reference in references), len(cache))
+
+        # Expiring still works with the keys of the remaining items
+        cache.set_item_lifetime(seconds=1)
+        time.sleep(1.1)
+        self.assertEqual(cache.delete_deprecated(), 6)
+        self.assertFalse(cache.has_deprecated())
+        self.assertEqual(sum(reference() is not None for reference in references), 0)
+
+    def test_sharded_cache(self):
+        num_caches = len(registry)
+        cache = ShardedCache("sharded", num_shards=4, max_size=100)
+        # Only the sharded cache itself is registered
+        self.assertEqual(len(registry), num_caches + 1)
+        self.assertTrue(registry.get("sharded") is cache)
+
+        for i in range(50):
+            cache[i] = i
+        cache.add("value")
+        self.assertEqual(len(cache), 51)
+        self.assertEqual(cache[10], 10)
+        self.assertEqual(cache.get("missing", -1), -1)
+        self.assertTrue("value" in cache)
+        self.assertEqual(cache.pop(10), 10)
+        del cache[11]
+        self.assertEqual(set(cache.keys()), set(range(50)) - {10, 11} | {"value"})
+        self.assertEqual(cache.delete_delegated(lambda cache_item: cache_item.key == "value"), 1)
+        self.assertEqual(cache[12], 12)
+        self.assertEqual(cache.delete_unpopular(1), 47)
+        self.assertEqual(len(cache), 1)
+
+        statistics = cache.get_statistics()
+        self.assertEqual(statistics["size"], 1)
+        self.assertEqual(statistics["max_size"], 100)
+        self.assertEqual(statistics["hits"], 2)
+        self.assertEqual(statistics["misses"], 1)
+
+        for i in range(1000):
+            cache[i] = i
+        self.assertTrue(len(cache) <= 100)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_sharded_cache_stress(self):
+        cache = ShardedCache(num_shards=8)
+        num_writers = 4
+        writes_per_writer = 20000
+
+        def write(writer: int):
+            for i in range(writes_per_writer):
+                cache[(writer, i)] = i
+                if i % 10 == 0:
+                    del cache[(writer, i)]
+            return writer
+
+        async def read(reads: list):
+            while True:
+                key = (random.randrange(num_writers), random.randrange(writes_per_writer))
+                value = cache.get(key)
+                if value is not None:
+                    self.assertEqual(value, key[1])
+                    reads.append(value)
+                await asyncio.sleep(0)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            reads = []
+            readers = [asyncio.ensure_future(read(reads)) for _ in range(10)]
+            with ThreadPoolExecutor(max_workers=num_writers) as executor:
+                finished = await asyncio.gather(*[loop.run_in_executor(executor, write, writer)
+                                                  for writer in range(num_writers)])
+            for reader in readers:
+                reader.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+            self.assertEqual(sorted(finished), list(range(num_writers)))
+            self.assertTrue(len(reads) > 0)
+
+        asyncio.run(run())
+        self.assertEqual(len(cache), num_writers * writes_per_writer * 9 // 10)
+        for writer in range(num_writers):
+            for i in range(writes_per_writer):
+                self.assertEqual((writer, i) in cache, i % 10 != 0)
+
+    def test_cached_decorator(self):
+        calls = []
+        cache_name = self.generate_string()
+
+        @cached(cache_name, max_age=1)
+        async def fetch(value, multiplier=1):
+            calls.append(value)
+            await asyncio.sleep(0.1)
+            return value * multiplier
+
+        class Fetcher:
+            @cached(key=lambda self, value: value)
+            async def fetch(self, value):
+                calls.append(value)
+                return -value
+
+        async def run():
+            self.assertEqual(await asyncio.gather(fetch(1), fetch(1), fetch(2), fetch(1, multiplier=3)), [1, 1, 2, 3])
+            self.assertEqual(calls, [1, 2, 1])
+            self.assertTrue(registry.get(cache_name) is fetch.cache)
+            self.assertEqual(fetch.cache.max_age, 1)
+            self.assertEqual(fetch.cache.item_lifetime, 1)
+
+            await asyncio.sleep(1)
+            self.assertEqual(await fetch(1), 1)
+            self.assertEqual(calls, [1, 2, 1, 1])
+
+            # Custom key ignores the instance, so the instances share values
+            calls.clear()
+            self.assertEqual(await Fetcher().fetch(5), -5)
+            self.assertEqual(await Fetcher().fetch(5), -5)
+            self.assertEqual(calls, [5])
+            self.assertTrue(Fetcher.fetch.cache.name.endswith("Fetcher.fetch"))
+
+        asyncio.run(run())
+
+        existing = Cache(self.generate_string())
+
+        @cached(existing.name)
+        async def use_existing():
+            return 1
+
+        self.assertTrue(use_existing.cache is existing)
+        self.assertRaises(TypeError, cached(), lambda: 1)
+
+    def test_bulk_operations(self):
+        cache = Cache(self.generate_string())
+        cache.set_many({"a": 1, "b": 2})
+        cache.set_many([("c", 3), ("a", 4)])
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.statistics.sets, 4)
+
+        # All items of a batch share the same timestamp
+        self.assertEqual(dict(cache.items())["a"]._last_hit_time, dict(cache.items())["c"]._last_hit_time)
+
+        self.assertEqual(cache.get_many(["a", "c", "missing"]), {"a": 4, "c": 3})
+        self.assertEqual(cache.statistics.hits, 2)
+        self.assertEqual(cache.statistics.misses, 1)
+        self.assertEqual(dict(cache.items())["a"].total_hits, 1)
+        self.assertEqual(list(cache.keys()), ["b", "a", "c"])
+
+        self.assertEqual(cache.delete_many(["a", "b", "missing"]), 2)
+        self.assertEqual(list(cache.keys()), ["c"])
+        self.assertEqual(cache.statistics.evictions[EEvictionReason.delegated], 0)
+
+        # Type override checks do not count as hits
+        strict_cache = Cache(self.generate_string(), allow_type_override=False)
+        strict_cache["a"] = 1
+        strict_cache["a"] = 2
+        strict_cache.set_many({"a": 3, "b": 4})
+        self.assertEqual(strict_cache.get_many(["a", "b"]), {"a": 1, "b": 4})
+        self.assertEqual(dict(strict_cache.items())["a"].total_hits, 1)
+        self.assertRaises(TypeError, strict_cache.set_many, {"a": "1"})
+
+        lazy_cache = Cache(self.generate_string(), lazy_expiry=True)
+        lazy_cache.set_item_lifetime(seconds=1)
+        lazy_cache.set_many({"a": 1, "b": 2})
+        time.sleep(1)
+        self.assertEqual(lazy_cache.get_many(["a", "b"]), {})
+        self.assertEqual(len(lazy_cache), 0)
+        self.assertEqual(lazy_cache.statistics.evictions[EEvictionReason.expired], 2)
+
+    def test_bulk_operations_benchmark(self):
+        n = 10000
+        keys = [f"key{i}" for i in range(n)]
+        items = {cache_key: i for i, cache_key in enumerate(keys)}
+
+        def single_operations():
+            cache = Cache(allow_type_override=False)
+            for cache_key, value in items.items():
+                cache[cache_key] = value
+            for cache_key in keys:
+                cache.get(cache_key)
+            for cache_key in keys:
+                del cache[cache_key]
+
+        def bulk_operations():
+            cache = Cache(allow_type_override=False)
+            cache.set_many(items)
+            cache.get_many(keys)
+            cache.delete_many(keys)
+
+        single_time = min(timeit.repeat(single_operations, number=1, repeat=5))
+        bulk_time = min(timeit.repeat(bulk_operations, number=1, repeat=5))
+        print(f"\nSet, get and delete of {n} keys: one by one {single_time * 1000:.1f} ms, "
+              f"in batches {bulk_time * 1000:.1f} ms ({single_time / bulk_time:.2f}x)")
+
+        if ASSERT_BENCHMARKS:
+            self.assertLess(bulk_time, single_time)
+
+    def test_cache_item(self):
+        cache_item = CacheItem("key", "value")
+        self.assertFalse(hasattr(cache_item, "__dict__"))
+        self.assertEqual(cache_item.total_hits, 0)
+        self.assertTrue(abs((datetime.datetime.utcnow() - cache_item.last_hit).total_seconds()) < 0.1)
+
+        time.sleep(0.5)
+        self.assertTrue(0.4 < (datetime.datetime.utcnow() - cache_item.last_hit).total_seconds() < 0.6)
+        cache_item._hit()
+        self.assertEqual(cache_item.total_hits, 1)
+        self.assertTrue(abs((datetime.datetime.utcnow() - cache_item.last_hit).total_seconds()) < 0.1)
+
+    @staticmethod
+    def measure_item_memory(item_class, n: int) -> int:
+        """
+        Measure memory allocated by n cache items of given class.
+        :return: Number of allocated bytes
+        """
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        items = [item_class(i, None) for i in range(n)]
+        allocated = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del items
+        return allocated
+
+    def test_cache_item_benchmark(self):
+        n = 100000
+        legacy_memory = self.measure_item_memory(LegacyCacheItem, n)
+        current_memory = self.measure_item_memory(CacheItem, n)
+
+        legacy_item = LegacyCacheItem("key", "value")
+        current_item = CacheItem("key", "value")
+        legacy_hits = n / min(timeit.repeat(legacy_item._hit, number=n, repeat=3))
+        current_hits = n / min(timeit.repeat(current_item._hit, number=n, repeat=3))
+        legacy_creates = n / min(timeit.repeat(lambda: LegacyCacheItem("key", "value"), number=n, repeat=3))
+        current_creates = n / min(timeit.repeat(lambda: CacheItem("key", "value"), number=n, repeat=3))
+
+        print(f"\nCacheItem memory for {n} items: legacy {legacy_memory / n:.0f} B/item, "
+              f"current {current_memory / n:.0f} B/item")
+        print(f"CacheItem hits: legacy {legacy_hits:,.0f} ops/s, current {current_hits:,.0f} ops/s")
+        print(f"CacheItem creations: legacy {legacy_creates:,.0f} ops/s, current {current_creates:,.0f} ops/s")
+
+        self.assertLess(current_memory, legacy_memory)
+
 
 if __name__ == '__main__':
     unittest.main()
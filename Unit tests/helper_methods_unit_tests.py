@@ -0,0 +1,113 @@
+import os
+import unittest
+import timeit
+from dateutil.relativedelta import relativedelta
+from helper_methods import string_to_timedelta
+
+# Timings depend on the machine, so the benchmarks only assert them when ASSERT_BENCHMARKS=1 is set
+ASSERT_BENCHMARKS = os.environ.get("ASSERT_BENCHMARKS") == "1"
+
+
+def legacy_string_to_timedelta(time_string: str) -> relativedelta:
+    """
+    The original implementation with chained replaces and a rescan of the string for every character. Used as a
+    reference for measuring the current implementation.
+    """
+    replace_dict = {"years": "yrs",
+                    "yrs": "y",
+                    "months": "mon",
+                    "mon": "m",
+                    "days": "d",
+                    "hours": "H",
+                    "h": "H",
+                    "minutes": "min",
+                    "min": "M",
+                    "seconds": "sec",
+                    "sec": "S",
+                    "s": "S",
+                    " ": ""}
+
+    for old in replace_dict.keys():
+        new = replace_dict[old]
+        time_string = time_string.replace(old, new)
+
+    time_units = {"y": 0, "m": 0, "d": 0, "H": 0, "M": 0, "S": 0}
+
+    for char in time_string:
+        if char not in list(time_units):
+            if not char.isdigit():
+                raise ValueError("Invalid character in timedelta string.")
+            continue
+
+        char_idx = time_string.find(char)
+        time_units[char] = int(time_string[:char_idx])
+
+        target_substring = time_string[:char_idx + 1]
+        time_string = time_string.replace(target_substring, "")
+
+    return relativedelta(years=time_units["y"], months=time_units["m"], days=time_units["d"],
+                         hours=time_units["H"], minutes=time_units["M"], seconds=time_units["S"])
+
+
+class StringToTimedeltaTesting(unittest.TestCase):
+
+    # Inputs supported by both implementations
+    COMMON_INPUTS = ["10s", "5min", "5M", "2h", "1d", "3m", "1y", "1d12h", "1y2m3d4H5M6S", "2 days 3 hours",
+                     "1 years 2 months", "30 minutes 15 seconds", "7days", "12hours"]
+
+    def test_compatible(self):
+        for time_string in self.COMMON_INPUTS:
+            self.assertEqual(string_to_timedelta(time_string), legacy_string_to_timedelta(time_string), time_string)
+
+    def test_compound_units(self):
+        self.assertEqual(string_to_timedelta("2 weeks 30min"), relativedelta(weeks=2, minutes=30))
+        self.assertEqual(string_to_timedelta("1 hour 1 minute 1 second"), relativedelta(hours=1, minutes=1, seconds=1))
+        self.assertEqual(string_to_timedelta("  1yr 6mon "), relativedelta(years=1, months=6))
+
+    def test_iso_8601(self):
+        self.assertEqual(string_to_timedelta("P1Y2M3DT4H5M6S"),
+                         relativedelta(years=1, months=2, days=3, hours=4, minutes=5, seconds=6))
+        self.assertEqual(string_to_timedelta("PT30M"), relativedelta(minutes=30))
+        self.assertEqual(string_to_timedelta("P2W"), relativedelta(weeks=2))
+        self.assertEqual(string_to_timedelta("p1dt12h"), relativedelta(days=1, hours=12))
+
+    def test_invalid(self):
+        # The legacy implementation silently keeps only the last one of repeated units
+        self.assertEqual(legacy_string_to_timedelta("1d2d"), relativedelta(days=2))
+        for time_string in ("1d1d", "1d 2days", "", "   ", "10", "d1", "1x", "-1d", "1.5h", "P", "PT", "P1DT", "P1H"):
+            with self.assertRaises(ValueError, msg=time_string):
+                string_to_timedelta(time_string)
+
+    def test_memoized(self):
+        string_to_timedelta.cache_clear()
+        string_to_timedelta("1d")
+        string_to_timedelta("1d")
+        self.assertEqual(string_to_timedelta.cache_info().hits, 1)
+
+    def test_benchmark(self):
+        number = 2000
+        long_input = " ".join(["1y", "2mon", "3w", "4d", "5h", "6min", "7s"])
+        inputs = self.COMMON_INPUTS + ["100 years 11 months 30 days 23 hours 59 minutes"]
+
+        def parse_all(parser):
+            for time_string in inputs:
+                parser(time_string)
+
+        legacy_time = min(timeit.repeat(lambda: parse_all(legacy_string_to_timedelta), number=number, repeat=3))
+        # Parsing without the memo
+        uncached_time = min(timeit.repeat(lambda: parse_all(string_to_timedelta.__wrapped__), number=number,
+                                          repeat=3))
+        cached_time = min(timeit.repeat(lambda: parse_all(string_to_timedelta), number=number, repeat=3))
+        long_time = min(timeit.repeat(lambda: string_to_timedelta.__wrapped__(long_input), number=number, repeat=3))
+        per_parse = number * len(inputs) / 1e6
+        print(f"\nParsing {len(inputs)} durations: legacy {legacy_time / per_parse:.2f} µs, "
+              f"compiled {uncached_time / per_parse:.2f} µs, memoized {cached_time / per_parse:.2f} µs per parse. "
+              f"Seven units with weeks {long_time / number * 1e6:.2f} µs.")
+
+        if ASSERT_BENCHMARKS:
+            self.assertLess(uncached_time, legacy_time)
+            self.assertLess(cached_time, uncached_time)
+
+
+if __name__ == '__main__':
+    unittest.main()
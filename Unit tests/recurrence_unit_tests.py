@@ -0,0 +1,77 @@
+import datetime
+import unittest
+from recurrence import RecurrenceRule, parse_rule
+
+
+def to_ts(*args) -> int:
+    return int(datetime.datetime(*args).timestamp())
+
+
+class RecurrenceRuleTesting(unittest.TestCase):
+
+    def test_interval(self):
+        rule = RecurrenceRule("1d 2h")
+        self.assertFalse(rule.is_cron)
+        start = to_ts(2021, 5, 1, 12)
+        self.assertEqual(rule.next_occurrence(start, start), to_ts(2021, 5, 2, 14))
+
+        # Missed occurrences are skipped, but the occurrences stay aligned to the previous one
+        self.assertEqual(rule.next_occurrence(start, to_ts(2021, 5, 4, 17)), to_ts(2021, 5, 4, 18))
+        self.assertEqual(rule.next_occurrence(start, to_ts(2021, 5, 4, 18)), to_ts(2021, 5, 5, 20))
+
+        # Calendar intervals do not drift at the end of short months
+        monthly = RecurrenceRule("1mon")
+        self.assertEqual(monthly.next_occurrence(to_ts(2021, 1, 31), to_ts(2021, 1, 31)), to_ts(2021, 2, 28))
+        self.assertEqual(monthly.next_occurrence(to_ts(2021, 1, 31), to_ts(2021, 3, 1)), to_ts(2021, 3, 31))
+
+        with self.assertRaises(ValueError):
+            RecurrenceRule("0s")
+        with self.assertRaises(ValueError):
+            RecurrenceRule("every day")
+
+    def test_cron(self):
+        # Every Monday at 09:00
+        rule = RecurrenceRule("0  9 * * 1")
+        self.assertTrue(rule.is_cron)
+        self.assertEqual(rule.spec, "0 9 * * 1")
+        saturday = to_ts(2021, 5, 1, 12)
+        self.assertEqual(rule.next_occurrence(saturday, saturday), to_ts(2021, 5, 3, 9))
+        # The next occurrence is always after the previous one
+        self.assertEqual(rule.next_occurrence(to_ts(2021, 5, 3, 9), saturday), to_ts(2021, 5, 10, 9))
+
+        self.assertEqual(RecurrenceRule("*/15 * * * *").next_occurrence(saturday, to_ts(2021, 5, 1, 12, 14, 59)),
+                         to_ts(2021, 5, 1, 12, 15))
+        self.assertEqual(RecurrenceRule("30 8-12/2 * * *").next_occurrence(saturday, saturday),
+                         to_ts(2021, 5, 1, 12, 30))
+        # Weekday 7 is Sunday as well
+        self.assertEqual(RecurrenceRule("0 0 * * 7").next_occurrence(saturday, saturday), to_ts(2021, 5, 2))
+        self.assertEqual(RecurrenceRule("0 0 29 2 *").next_occurrence(saturday, saturday), to_ts(2024, 2, 29))
+        # Restricted day and weekday match either of them
+        self.assertEqual(RecurrenceRule("0 0 15 * 1").next_occurrence(saturday, saturday), to_ts(2021, 5, 3))
+        self.assertEqual(RecurrenceRule("0 0 15 * 1").next_occurrence(to_ts(2021, 5, 10), saturday),
+                         to_ts(2021, 5, 15))
+
+        for spec in ("60 * * * *", "0 0 0 * *", "*/0 * * * *", "5-1 * * * *", "0 0 31 2 *"):
+            with self.assertRaises(ValueError):
+                RecurrenceRule(spec)
+
+    def test_min_interval(self):
+        self.assertEqual(RecurrenceRule("1d 2h").min_interval(), 93600)
+        self.assertEqual(RecurrenceRule("1mon").min_interval(), 28 * 86400)
+        self.assertEqual(RecurrenceRule("* * * * *").min_interval(), 60)
+        self.assertEqual(RecurrenceRule("0,45 9 * * *").min_interval(), 45 * 60)
+        self.assertEqual(RecurrenceRule("0 9,12 * * *").min_interval(), 3 * 3600)
+        self.assertEqual(RecurrenceRule("0 9 * * 1").min_interval(), 7 * 86400)
+        # From the last occurrence of a day to the first one of the next day
+        self.assertEqual(RecurrenceRule("0,30 0,23 * * *").min_interval(), 30 * 60)
+        self.assertEqual(RecurrenceRule("55 0,23 * * *").min_interval(), 3600)
+        self.assertEqual(RecurrenceRule("58 23 * * 1,2").min_interval(), 86400)
+        self.assertEqual(RecurrenceRule("58 0,23 * * 1,3").min_interval(), 23 * 3600)
+
+    def test_parse_rule_memoized(self):
+        self.assertIs(parse_rule("1d"), parse_rule("1d"))
+        self.assertIsNot(parse_rule("1d"), parse_rule("2d"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+"""
+Load test for the reminder subsystem. Drives Reminder.add, the reminder loop, serialize and deserialize against a
+stub bot whose channels only record the messages sent to them, so everything runs offline.
+
+For each number of reminders two phases are run:
+    - Persistence: the reminders are added far into the future, serialized into a file and deserialized into a new
+      Reminder.
+    - Firing: the reminders are added to be due within a short time span, and the delivery of every reminder is
+      checked from the stub channels.
+
+Usage: python "Unit tests/reminder_load_test.py" [--sizes 1000 100000 1000000] [--spread 20] [--send-latency 0.05]
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from reminder import Reminder
+from scheduling import HeapScheduler
+
+
+def utc_timestamp() -> float:
+    # Same clock as the reminder timestamps
+    return datetime.datetime.utcnow().timestamp()
+
+
+class StubChannel:
+
+    def __init__(self, channel_id: int, send_latency: float):
+        self.id = channel_id
+        self.send_latency = send_latency
+        self.received: List[tuple] = []
+
+    async def send(self, content: str):
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+        self.received.append((utc_timestamp(), content))
+
+
+class StubBot:
+    """
+    Bot with only the methods Reminder uses. Every channel exists and accepts every message.
+    """
+
+    def __init__(self, send_latency: float = 0):
+        self.send_latency = send_latency
+        self.channels: Dict[int, StubChannel] = {}
+
+    def get_channel(self, channel_id: int) -> StubChannel:
+        try:
+            return self.channels[channel_id]
+        except KeyError:
+            channel = self.channels[channel_id] = StubChannel(channel_id, self.send_latency)
+            return channel
+
+    async def fetch_channel(self, channel_id: int) -> StubChannel:
+        return self.get_channel(channel_id)
+
+
+class CountingScheduler(HeapScheduler):
+    """
+    HeapScheduler counting the reminder loop iterations. The loop checks for due reminders once per wake-up.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.num_wakeups = 0
+
+    def pop_due(self, current_time: float) -> List[int]:
+        self.num_wakeups += 1
+        return super().pop_due(current_time)
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(int(len(sorted_values) * percent / 100), len(sorted_values) - 1)]
+
+
+async def add_reminders(reminder: Reminder, num_reminders: int, first_due: float, spread: float,
+                        num_authors: int, num_channels: int, batch_size: int = 1000) -> float:
+    """
+    Add reminders due evenly within spread seconds from first_due. Yields to the event loop between batches, like
+    reminders coming in from commands would.
+
+    :return: Seconds spent in Reminder.add
+    """
+    rng = random.Random(num_reminders)
+    elapsed = 0
+    for batch_start in range(0, num_reminders, batch_size):
+        batch = []
+        for i in range(batch_start, min(batch_start + batch_size, num_reminders)):
+            due = int(first_due + spread * i / num_reminders)
+            batch.append((due, rng.randrange(num_authors), rng.randrange(num_channels), f"{i}:{due}"))
+        started = time.perf_counter()
+        for due, author, channel, message in batch:
+            reminder.add(due, author, channel, message)
+        elapsed += time.perf_counter() - started
+        await asyncio.sleep(0)
+    return elapsed
+
+
+async def measure_persistence(num_reminders: int, tmp_dir: str, args: argparse.Namespace) -> Dict[str, float]:
+    loop = asyncio.get_event_loop()
+    serialize_path = os.path.join(tmp_dir, f"persistence_{num_reminders}.json")
+    journal_path = os.path.join(tmp_dir, f"persistence_{num_reminders}.journal")
+    reminder = Reminder(StubBot(), loop, serialize_path=serialize_path, journal_path=journal_path,
+                        backup_threshold=10 ** 9)
+    reminder.start()
+    add_time = await add_reminders(reminder, num_reminders, utc_timestamp() + 86400, 86400, args.authors,
+                                   args.channels)
+    await reminder.journal.flush()
+
+    started = time.perf_counter()
+    future = reminder.serialize()
+    snapshot_time = time.perf_counter() - started
+    await future
+    serialize_time = time.perf_counter() - started
+    reminder.stop()
+    await reminder.journal.close()
+
+    restored = Reminder(StubBot(), loop, serialize_path=serialize_path, journal_path=None)
+    started = time.perf_counter()
+    restored.deserialize()
+    deserialize_time = time.perf_counter() - started
+
+    return {"add_us": add_time / num_reminders * 1e6, "snapshot_ms": snapshot_time * 1e3,
+            "serialize_s": serialize_time, "deserialize_s": deserialize_time,
+            "file_mb": os.path.getsize(serialize_path) / 2 ** 20}
+
+
+async def measure_firing(num_reminders: int, tmp_dir: str, args: argparse.Namespace,
+                         lead: float) -> Dict[str, float]:
+    loop = asyncio.get_event_loop()
+    bot = StubBot(args.send_latency)
+    scheduler = CountingScheduler()
+    reminder = Reminder(bot, loop, serialize_path=os.path.join(tmp_dir, f"firing_{num_reminders}.json"),
+                        journal_path=os.path.join(tmp_dir, f"firing_{num_reminders}.journal"),
+                        scheduler=scheduler, backup_threshold=10 ** 9)
+    reminder.start()
+    first_due = int(utc_timestamp() + lead)
+    await add_reminders(reminder, num_reminders, first_due, args.spread, args.authors, args.channels)
+
+    # Wait until the last reminder is due, and then for a grace period for the sends to finish
+    await asyncio.sleep(max(first_due + args.spread - utc_timestamp(), 0) + args.grace)
+    reminder.stop()
+
+    lateness = []
+    delivered = set()
+    for channel in bot.channels.values():
+        for received_at, content in channel.received:
+            for line in content.split("\n"):
+                index, due = line.split(" ", 1)[1].split(":")
+                delivered.add(int(index))
+                lateness.append(received_at - int(due))
+    lateness.sort()
+    await reminder.journal.close()
+
+    return {"p50_ms": percentile(lateness, 50) * 1e3, "p90_ms": percentile(lateness, 90) * 1e3,
+            "p99_ms": percentile(lateness, 99) * 1e3, "max_ms": lateness[-1] * 1e3 if lateness else float("nan"),
+            "missed": num_reminders - len(delivered), "duplicates": len(lateness) - len(delivered),
+            "wakeups": scheduler.num_wakeups}
+
+
+async def main(args: argparse.Namespace):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_reminders in args.sizes:
+            persistence = await measure_persistence(num_reminders, tmp_dir, args)
+            lead = args.lead
+            if lead is None:
+                # Leave enough time to add all reminders before the first one is due
+                lead = 2 + 2 * persistence["add_us"] * num_reminders / 1e6
+            firing = await measure_firing(num_reminders, tmp_dir, args, lead)
+            results.append((num_reminders, persistence, firing))
+
+    print()
+    print(f"{'reminders':>10} {'add µs':>8} {'snapshot ms':>12} {'serialize s':>12} {'file MB':>8} "
+          f"{'deserialize s':>14} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'missed':>7} "
+          f"{'wakeups':>8}")
+    for num_reminders, persistence, firing in results:
+        print(f"{num_reminders:>10} {persistence['add_us']:>8.1f} {persistence['snapshot_ms']:>12.1f} "
+              f"{persistence['serialize_s']:>12.2f} {persistence['file_mb']:>8.1f} "
+              f"{persistence['deserialize_s']:>14.2f} {firing['p50_ms']:>8.1f} {firing['p90_ms']:>8.1f} "
+              f"{firing['p99_ms']:>8.1f} {firing['max_ms']:>8.1f} {firing['missed']:>7} {firing['wakeups']:>8}")
+        if firing["duplicates"]:
+            print(f"{'':>10} WARNING: {firing['duplicates']} reminders were delivered more than once")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test for the reminder subsystem.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000],
+                        help="Numbers of reminders to test with")
+    parser.add_argument("--spread", type=float, default=20, help="Seconds within which the reminders are due")
+    parser.add_argument("--lead", type=float, default=None,
+                        help="Seconds from the start of adding until the first reminder is due. Default is twice the "
+                             "time adding took in the persistence phase.")
+    parser.add_argument("--grace", type=float, default=5, help="Seconds waited for sends after the last due time")
+    parser.add_argument("--authors", type=int, default=10000, help="Number of distinct reminder authors")
+    parser.add_argument("--channels", type=int, default=100, help="Number of distinct reminder channels")
+    parser.add_argument("--send-latency", type=float, default=0, help="Simulated seconds per sent message")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,225 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+from reminder_storage import ReminderJournal, SqliteReminderStore
+
+
+class ReminderJournalTesting(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "reminders.journal")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_append_replay(self):
+        reminder = dict(channel="1", message="Hello ä", author="2")
+
+        async def run():
+            journal = ReminderJournal(self.path)
+            self.assertEqual(journal.append("add", 100, reminder), 1)
+            self.assertEqual(journal.append("add", 200, reminder), 2)
+            self.assertEqual(journal.append("fire", 100), 3)
+            await journal.flush()
+            self.assertEqual(journal.num_records, 3)
+            await journal.close()
+
+            journal = ReminderJournal(self.path)
+            records = list(journal.replay())
+            self.assertEqual([record["op"] for record in records], ["add", "add", "fire"])
+            self.assertEqual(records[0]["reminder"], reminder)
+            self.assertFalse("reminder" in records[2])
+            self.assertEqual([record["seq"] for record in journal.replay(after_sequence=2)], [3])
+
+            # New changes continue the sequence of the replayed ones
+            self.assertEqual(journal.append("fire", 200), 4)
+            await journal.close()
+
+        asyncio.run(run())
+
+    def test_group_commit(self):
+        async def run():
+            journal = ReminderJournal(self.path)
+            with mock.patch("reminder_storage.os.fsync", wraps=os.fsync) as fsync:
+                for i in range(1000):
+                    journal.append("add", i, dict(channel="1", message=str(i), author="1"))
+                await journal.flush()
+            self.assertLess(fsync.call_count, 10)
+            await journal.close()
+            self.assertEqual(len(list(ReminderJournal(self.path).replay())), 1000)
+
+        asyncio.run(run())
+
+    def test_torn_write(self):
+        async def run():
+            journal = ReminderJournal(self.path)
+            journal.append("add", 100, dict(channel="1", message="a", author="1"))
+            journal.append("add", 200, dict(channel="1", message="b", author="1"))
+            await journal.close()
+
+            # A crash in the middle of a write leaves an incomplete last line, which is ignored
+            with open(self.path, "ab") as journal_file:
+                journal_file.write(b'{"seq":3,"op":"ad')
+            journal = ReminderJournal(self.path)
+            self.assertEqual([record["ts"] for record in journal.replay()], [100, 200])
+
+            # Changes appended after the incomplete line are not lost
+            journal.append("add", 300, dict(channel="1", message="c", author="1"))
+            journal.append("add", 400, dict(channel="1", message="d", author="1"))
+            await journal.close()
+            journal = ReminderJournal(self.path)
+            self.assertEqual([record["ts"] for record in journal.replay()], [100, 200, 300, 400])
+            self.assertEqual([record["seq"] for record in journal.replay()], [1, 2, 3, 4])
+            await journal.close()
+
+        asyncio.run(run())
+
+    def test_failed_write(self):
+        fsync = os.fsync
+        failures = []
+
+        def failing_fsync(fd):
+            if not failures:
+                # Only a part of the written lines reaches the disk
+                failures.append(fd)
+                os.truncate(self.path, os.path.getsize(self.path) - 5)
+                raise OSError("Disk full")
+            fsync(fd)
+
+        async def run():
+            journal = ReminderJournal(self.path)
+            journal.append("add", 100)
+            await journal.flush()
+            with mock.patch("reminder_storage.os.fsync", side_effect=failing_fsync):
+                journal.append("add", 200)
+                journal.append("add", 300)
+                await journal.flush()
+                self.assertEqual(len(failures), 1)
+                # The failed lines are written again with the next change
+                journal.append("add", 400)
+                await journal.close()
+
+            journal = ReminderJournal(self.path)
+            self.assertEqual([record["ts"] for record in journal.replay()], [100, 200, 300, 400])
+            self.assertEqual(journal.num_records, 4)
+            await journal.close()
+
+        asyncio.run(run())
+
+    def test_compact(self):
+        async def run():
+            journal = ReminderJournal(self.path)
+            for i in range(10):
+                journal.append("add", i)
+            await journal.flush()
+            await journal.compact(6)
+            journal.append("fire", 1)
+            await journal.close()
+
+            journal = ReminderJournal(self.path)
+            self.assertEqual([record["seq"] for record in journal.replay()], [7, 8, 9, 10, 11])
+            self.assertEqual(journal.num_records, 5)
+            await journal.compact(11)
+            await journal.close()
+
+            # Numbering continues after the snapshot even if the journal is empty
+            journal = ReminderJournal(self.path)
+            self.assertEqual(list(journal.replay(after_sequence=11)), [])
+            self.assertEqual(journal.append("add", 1), 12)
+            await journal.close()
+
+        asyncio.run(run())
+
+
+class SqliteReminderStoreTesting(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "reminders.sqlite3")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_store(self):
+        async def run():
+            store = SqliteReminderStore(self.path)
+            for timestamp in (300, 100, 200, 100):
+                store.add(timestamp, dict(channel="1", message=str(timestamp), author="2"))
+            self.assertEqual(await store.count(), 4)
+
+            # Operations are executed in the order they were called, without waiting for the previous ones
+            window = store.load(100, 300)
+            store.add(150, dict(channel="1", message="150", author="2"))
+            self.assertEqual([timestamp for timestamp, _ in await window], [100, 100, 200])
+            self.assertEqual((await store.load(150, 151))[0][1], dict(id=5, channel="1", message="150", author="2"))
+
+            self.assertEqual(await store.delete_due(100), 2)
+            self.assertEqual(await store.delete_until(200), 2)
+            await store.close()
+
+            store = SqliteReminderStore(self.path)
+            self.assertEqual(await store.load(0, 1000), [(300, dict(id=1, channel="1", message="300", author="2"))])
+            self.assertEqual(store.last_id, 5)
+            await store.close()
+
+        asyncio.run(run())
+
+    def test_author_listing(self):
+        async def run():
+            store = SqliteReminderStore(self.path)
+            for i in range(25):
+                store.add(1000 - i, dict(channel=str(i % 2), message=str(i), author=str(i % 3)))
+            reminders, total = await store.list_author("0", offset=2, limit=3)
+            self.assertEqual(total, 9)
+            self.assertEqual([reminder["message"] for _, reminder in reminders], ["18", "15", "12"])
+
+            # Only the author can delete their reminder
+            reminder_id = reminders[0][1]["id"]
+            self.assertEqual(await store.delete(reminder_id, "1"), 0)
+            self.assertEqual(await store.delete(reminder_id, "0"), 1)
+            self.assertEqual(await store.delete(reminder_id), 0)
+            self.assertEqual(await store.delete_channel("1"), 12)
+            self.assertEqual(await store.count(), 12)
+
+            # Explicit ids are kept
+            await store.add(5000, dict(id=100, channel="1", message="explicit", author="0"))
+            self.assertEqual((await store.load(5000, 5001))[0][1]["id"], 100)
+            await store.close()
+
+        asyncio.run(run())
+
+    def test_recurring(self):
+        async def run():
+            store = SqliteReminderStore(self.path)
+            store.add(100, dict(channel="1", message="once", author="2"))
+            reminder_id = await store.add(100, dict(channel="1", message="daily", author="2", repeat="1d"))
+
+            # Recurring reminders are kept for rescheduling
+            self.assertEqual(await store.delete_until(200), 1)
+            await store.reschedule(reminder_id, 86500)
+            self.assertEqual(await store.delete_due(100), 0)
+            self.assertEqual(await store.load(0, 100000),
+                             [(86500, dict(id=reminder_id, channel="1", message="daily", author="2", repeat="1d"))])
+            await store.close()
+
+        asyncio.run(run())
+
+    def test_window_index(self):
+        async def run():
+            store = SqliteReminderStore(self.path)
+            await store.close()
+            connection = sqlite3.connect(self.path)
+            plan = connection.execute("EXPLAIN QUERY PLAN SELECT due, author, channel, message FROM reminders "
+                                      "WHERE due >= 0 AND due < 10 ORDER BY due, id").fetchall()
+            connection.close()
+            self.assertTrue(any("reminders_due" in row[-1] for row in plan))
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,471 @@
+import asyncio
+import datetime
+import json
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+import discord
+from reminder import Reminder
+from reminder_storage import ReminderJournal
+from scheduling import HeapScheduler
+
+
+def utc_timestamp() -> float:
+    # Same clock as the reminder timestamps
+    return datetime.datetime.utcnow().timestamp()
+
+
+class StubChannel:
+
+    def __init__(self, channel_id: int, bot: "StubBot"):
+        self.id = channel_id
+        self.bot = bot
+        self.received = []
+        # Exceptions raised by the next sends instead of sending
+        self.errors = []
+        self.send_latency = 0
+
+    async def send(self, content: str):
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+        if self.errors:
+            raise self.errors.pop(0)
+        self.received.append(content)
+        self.bot.sent.append((self.id, content))
+
+
+class StubBot:
+    """
+    Bot with only the methods Reminder uses. Every channel exists and accepts every message, unless it is in
+    missing_channels.
+    """
+
+    def __init__(self):
+        self.channels = {}
+        self.missing_channels = set()
+        # Messages of all channels in the order they were sent
+        self.sent = []
+
+    def get_channel(self, channel_id: int) -> StubChannel:
+        if channel_id in self.missing_channels:
+            return None
+        try:
+            return self.channels[channel_id]
+        except KeyError:
+            channel = self.channels[channel_id] = StubChannel(channel_id, self)
+            return channel
+
+    async def fetch_channel(self, channel_id: int) -> StubChannel:
+        if channel_id in self.missing_channels:
+            raise discord.NotFound(http_response(404), "Unknown Channel")
+        return self.get_channel(channel_id)
+
+
+class RecordingScheduler(HeapScheduler):
+    """
+    HeapScheduler recording the timestamps popped by each loop iteration.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.popped = []
+
+    def pop_due(self, current_time: float) -> list:
+        due = super().pop_due(current_time)
+        self.popped.append(due)
+        return due
+
+
+def http_response(status: int, headers: dict = None) -> SimpleNamespace:
+    return SimpleNamespace(status=status, reason="", headers=headers if headers is not None else {})
+
+
+class ReminderTesting(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.serialize_path = os.path.join(self.tmp_dir.name, "reminders.json")
+        self.journal_path = os.path.join(self.tmp_dir.name, "reminders.journal")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_reminder(self, bot=None, **kwargs) -> Reminder:
+        kwargs.setdefault("serialize_path", self.serialize_path)
+        kwargs.setdefault("journal_path", self.journal_path)
+        return Reminder(bot if bot is not None else StubBot(), asyncio.get_event_loop(), **kwargs)
+
+    def test_serialize_unchanged(self):
+        async def run():
+            reminder = self.create_reminder()
+            reminder.add(utc_timestamp() + 3600, 1, 2, "a")
+            await reminder.serialize()
+            modified = os.stat(self.serialize_path).st_mtime_ns
+
+            # Nothing has changed since the last backup, so the file is not written again
+            self.assertTrue(reminder.serialize() is None)
+            self.assertEqual(os.stat(self.serialize_path).st_mtime_ns, modified)
+
+            # Serializing into another file is always done
+            other_path = os.path.join(self.tmp_dir.name, "other.json")
+            await reminder.serialize(other_path)
+            self.assertTrue(os.path.exists(other_path))
+
+            reminder.add(utc_timestamp() + 3600, 1, 2, "b")
+            await reminder.serialize()
+            with open(self.serialize_path, "r", encoding="utf-8") as serialized_file:
+                reminders = [data["message"] for key, value in json.load(serialized_file).items()
+                             if key.isdigit() for data in value]
+            self.assertEqual(sorted(reminders), ["a", "b"])
+            await reminder.close()
+
+        asyncio.run(run())
+
+    def test_serialize_atomic(self):
+        async def run():
+            # Without a journal, which is compacted with the same functions
+            reminder = self.create_reminder(journal_path=None)
+            reminder.add(utc_timestamp() + 3600, 1, 2, "a")
+            with mock.patch("reminder.os.replace", wraps=os.replace) as replace:
+                await reminder.serialize()
+            replace.assert_called_once_with(f"{self.serialize_path}.tmp", self.serialize_path)
+            with open(self.serialize_path, "rb") as serialized_file:
+                serialized = serialized_file.read()
+
+            # A write failing before the file is replaced leaves the previous file intact
+            reminder.add(utc_timestamp() + 3600, 1, 2, "b")
+            with mock.patch("reminder.os.fsync", side_effect=OSError("Disk full")):
+                await reminder.serialize()
+            with open(self.serialize_path, "rb") as serialized_file:
+                self.assertEqual(serialized_file.read(), serialized)
+
+            # The failed backup is written again on the next serialization
+            self.assertFalse(reminder.serialize() is None)
+            await reminder.close()
+
+        asyncio.run(run())
+
+    def test_compaction_not_repeated(self):
+        write_snapshot = Reminder._Reminder__write_snapshot
+
+        def slow_write(filepath, snapshot):
+            time.sleep(1)
+            write_snapshot(filepath, snapshot)
+
+        async def run():
+            reminder = self.create_reminder(compaction_threshold=5)
+            reminder.start()
+            first_due = utc_timestamp() + 3600
+            with mock.patch.object(Reminder, "_Reminder__write_snapshot", side_effect=slow_write), \
+                    mock.patch.object(reminder, "serialize", wraps=reminder.serialize) as serialize:
+                # Every reminder is due before the previous ones, so each one wakes the loop up
+                for i in range(20):
+                    reminder.add(first_due - i, 1, 2, str(i))
+                    await asyncio.sleep(0.04)
+                # The journal stays over the threshold until the first backup has compacted it
+                self.assertEqual(serialize.call_count, 1)
+                await reminder.close()
+
+        asyncio.run(run())
+
+
+    async def fire(self, reminder: Reminder, reminders: list):
+        """
+        Add reminders that are already due into a running reminder, and wait until they are sent.
+        """
+        timestamp = int(utc_timestamp()) - 1
+        for author, channel, message in reminders:
+            reminder.add(timestamp, author, channel, message)
+        await asyncio.sleep(0.05)
+
+    def test_grouped_per_channel(self):
+        async def run():
+            bot = StubBot()
+            reminder = self.create_reminder(bot)
+            reminder.start()
+            await self.fire(reminder, [(1, 10, "a"), (2, 20, "b"), (3, 10, "c")])
+            await reminder.close()
+            self.assertEqual(bot.channels[10].received, ["<@1> a\n<@3> c"])
+            self.assertEqual(bot.channels[20].received, ["<@2> b"])
+
+        asyncio.run(run())
+
+    def test_split_messages(self):
+        async def run():
+            bot = StubBot()
+            reminder = self.create_reminder(bot)
+            reminder.start()
+            await self.fire(reminder, [(1, 10, "a" * 1000), (1, 10, "b" * 1000), (1, 10, "c" * 4500)])
+            await reminder.close()
+            received = bot.channels[10].received
+            self.assertTrue(all(len(content) <= Reminder.MESSAGE_MAX_LENGTH for content in received))
+            self.assertEqual(len(received), 5)
+            self.assertEqual(received[0], f"<@1> {'a' * 1000}")
+            # Lines are joined, and too long lines are split into parts
+            self.assertEqual("".join(received[1:]).replace("\n", ""), f"<@1> {'b' * 1000}<@1> {'c' * 4500}")
+
+        asyncio.run(run())
+
+    def test_send_order(self):
+        async def run():
+            bot = StubBot()
+            reminder = self.create_reminder(bot, max_concurrent_sends=2)
+            reminder.start()
+            bot.get_channel(10).send_latency = 0.2
+            await self.fire(reminder, [(1, 10, "first")])
+            bot.get_channel(10).send_latency = 0
+            await self.fire(reminder, [(1, 10, "second"), (1, 20, "other")])
+            await reminder.close()
+            # The later batch waits for the earlier one in the same channel, but not in other channels
+            self.assertEqual(bot.sent, [(20, "<@1> other"), (10, "<@1> first"), (10, "<@1> second")])
+
+        asyncio.run(run())
+
+    def test_rate_limited(self):
+        async def run():
+            bot = StubBot()
+            reminder = self.create_reminder(bot, max_concurrent_sends=1)
+            reminder.start()
+            bot.get_channel(10).errors.append(
+                discord.HTTPException(http_response(429, {"Retry-After": "0.3"}), "Rate limited"))
+            started = time.monotonic()
+            await self.fire(reminder, [(1, 10, "a")])
+            await self.fire(reminder, [(1, 20, "b")])
+            await reminder.close()
+            self.assertGreaterEqual(time.monotonic() - started, 0.3)
+            # Waiting for the retry does not keep other channels from sending
+            self.assertEqual(bot.sent, [(20, "<@1> b"), (10, "<@1> a")])
+
+        asyncio.run(run())
+
+    def test_client_errors_not_retried(self):
+        async def run():
+            bot = StubBot()
+            reminder = self.create_reminder(bot, max_send_attempts=3)
+            reminder.start()
+            channel = bot.get_channel(10)
+            channel.errors.append(discord.HTTPException(http_response(400), "Bad Request"))
+            channel.errors.append(discord.HTTPException(http_response(503), "Service Unavailable"))
+            started = time.monotonic()
+            await self.fire(reminder, [(1, 10, "a" * 1990), (1, 10, "b")])
+            await reminder.close()
+            # The bad message is dropped, but server errors are retried
+            self.assertEqual(channel.received, ["<@1> b"])
+            self.assertGreaterEqual(time.monotonic() - started, 1)
+
+        asyncio.run(run())
+
+    def test_unavailable_channels(self):
+        async def run():
+            bot = StubBot()
+            reminder = self.create_reminder(bot)
+            reminder.start()
+            bot.missing_channels.add(10)
+            bot.get_channel(20).errors.append(discord.NotFound(http_response(404), "Unknown Channel"))
+            await self.fire(reminder, [(1, 10, "a"), (1, 20, "b" * 1990), (1, 20, "c"), (1, 30, "d")])
+            await reminder.close()
+            # Nothing more is sent to a channel that was not found
+            self.assertEqual(bot.sent, [(30, "<@1> d")])
+            self.assertEqual(len(bot.channels[20].errors), 0)
+
+        asyncio.run(run())
+
+    def test_ids(self):
+        async def run():
+            reminder = self.create_reminder()
+            due = int(utc_timestamp()) + 3600
+            self.assertEqual([reminder.add(due, 1, 2, str(i)) for i in range(3)], [1, 2, 3])
+            await reminder.serialize()
+            await reminder.close()
+
+            # Ids are not reused after a restart, even if the last reminder was deleted
+            restored = self.create_reminder()
+            restored.deserialize()
+            self.assertTrue(await restored.delete(3))
+            self.assertEqual(restored.add(due, 1, 2, "d"), 4)
+            await restored.close()
+
+            restored = self.create_reminder()
+            restored.deserialize()
+            self.assertEqual(restored.add(due, 1, 2, "e"), 5)
+            await restored.close()
+
+        asyncio.run(run())
+
+    def test_delete(self):
+        async def run():
+            reminder = self.create_reminder()
+            reminder_id = reminder.add(int(utc_timestamp()) + 3600, 1, 2, "a")
+            # Only the author can delete a reminder
+            self.assertFalse(await reminder.delete(reminder_id, author_id=3))
+            self.assertEqual((await reminder.list_reminders(1))[1], 1)
+            self.assertTrue(await reminder.delete(reminder_id, author_id=1))
+            self.assertEqual(await reminder.list_reminders(1), ([], 0))
+            self.assertFalse(await reminder.delete(reminder_id))
+            self.assertFalse(await reminder.delete(1000))
+            self.assertEqual(len(reminder.cache), 0)
+            await reminder.close()
+
+        asyncio.run(run())
+
+    def test_list_reminders(self):
+        async def run():
+            reminder = self.create_reminder()
+            due = int(utc_timestamp()) + 3600
+            for i in reversed(range(25)):
+                reminder.add(due + i, 1, 2, str(i))
+                reminder.add(due + i, 3, 2, "other")
+            # Reminders due at the same time are listed in the order they were added
+            reminder.add(due, 1, 2, "0b")
+
+            page, total = await reminder.list_reminders(1, limit=10)
+            self.assertEqual(total, 26)
+            self.assertEqual([data["message"] for _, data in page], ["0", "0b"] + [str(i) for i in range(1, 9)])
+            self.assertEqual([timestamp for timestamp, _ in page], [due, due] + [due + i for i in range(1, 9)])
+            page, total = await reminder.list_reminders("1", offset=20, limit=10)
+            self.assertEqual([data["message"] for _, data in page], [str(i) for i in range(19, 25)])
+            self.assertEqual(await reminder.list_reminders(1, offset=30), ([], 26))
+            self.assertEqual(await reminder.list_reminders(4), ([], 0))
+            await reminder.close()
+
+        asyncio.run(run())
+
+    def test_delete_channel(self):
+        async def run():
+            reminder = self.create_reminder()
+            due = int(utc_timestamp()) + 3600
+            for i in range(5):
+                reminder.add(due + i % 2, i, 10, "a")
+            reminder.add(due, 1, 20, "b")
+            self.assertEqual(await reminder.delete_channel(10), 5)
+            self.assertEqual(await reminder.delete_channel("10"), 0)
+            page, total = await reminder.list_reminders(1)
+            self.assertEqual((total, page[0][1]["channel"]), (1, "20"))
+            self.assertEqual(reminder.cache.keys(), {due})
+            await reminder.close()
+
+        asyncio.run(run())
+
+    def assert_indexed(self, reminder: Reminder, expected: dict):
+        """
+        Check that the reminders of each author are found, and deleted from the cache, through the indexes.
+
+        :param expected: Author ids mapped to the messages of their reminders in due order
+        """
+        async def check():
+            for author, messages in expected.items():
+                page, total = await reminder.list_reminders(author, limit=100)
+                self.assertEqual([data["message"] for _, data in page], messages)
+                self.assertEqual(total, len(messages))
+                for timestamp, data in page:
+                    self.assertTrue(data in reminder.cache[timestamp])
+            self.assertEqual(sum(len(cache_item.value) for _, cache_item in reminder.cache.items()),
+                             sum(len(messages) for messages in expected.values()))
+
+        return check()
+
+    def test_indexes_restored(self):
+        async def run():
+            reminder = self.create_reminder()
+            due = int(utc_timestamp()) + 3600
+            ids = [reminder.add(due + i, i % 2, 10 + i % 3, str(i)) for i in range(6)]
+            await reminder.serialize()
+            # Changes after the serialization are only in the journal
+            await reminder.delete(ids[0])
+            reminder.add(due + 10, 0, 12, "6")
+            await reminder.delete_channel(11)
+            expected = {0: ["2", "6"], 1: ["3", "5"]}
+            await self.assert_indexed(reminder, expected)
+            await reminder.close()
+
+            restored = self.create_reminder()
+            restored.deserialize()
+            await self.assert_indexed(restored, expected)
+            self.assertEqual(await restored.delete_channel(10), 1)
+            self.assertFalse(await restored.delete(ids[5], author_id=0))
+            self.assertTrue(await restored.delete(ids[5], author_id=1))
+            await self.assert_indexed(restored, {0: ["2", "6"], 1: []})
+            await restored.serialize()
+            await restored.close()
+
+            # Serialized with the journal compacted
+            restored = self.create_reminder()
+            restored.deserialize()
+            await self.assert_indexed(restored, {0: ["2", "6"], 1: []})
+            await restored.close()
+
+        asyncio.run(run())
+
+    def test_replay_duplicates(self):
+        async def run():
+            due = int(utc_timestamp()) + 3600
+            journal = ReminderJournal(self.journal_path)
+            once = dict(id=1, channel="10", message="once", author="1")
+            recurring = dict(id=2, channel="10", message="recurring", author="1", repeat="1d")
+            # Records written twice, and a recurring reminder journaled at its next occurrence before the previous one
+            # was removed
+            journal.append("add", due, once)
+            journal.append("add", due, once)
+            journal.append("add", due, recurring)
+            journal.append("add", due + 86400, recurring)
+            await journal.close()
+
+            reminder = self.create_reminder()
+            reminder.deserialize()
+            page, total = await reminder.list_reminders(1)
+            self.assertEqual([(timestamp, data["id"]) for timestamp, data in page], [(due, 1), (due + 86400, 2)])
+            self.assertEqual(total, 2)
+            self.assertEqual(reminder.cache[due], [once])
+            self.assertTrue(await reminder.delete(2))
+            self.assertFalse(due + 86400 in reminder.cache)
+            self.assertEqual(reminder.add(due, 1, 10, "new"), 3)
+            await reminder.close()
+
+        asyncio.run(run())
+
+    def test_wakeup(self):
+        async def run():
+            bot = StubBot()
+            reminder = self.create_reminder(bot)
+            reminder.start()
+            reminder.add(utc_timestamp() + 3600, 1, 10, "later")
+            await asyncio.sleep(0.05)
+            # The loop is sleeping for an hour, and an earlier reminder wakes it up
+            started = time.monotonic()
+            reminder.add(utc_timestamp() + 1, 1, 10, "sooner")
+            while not bot.sent and time.monotonic() - started < 3:
+                await asyncio.sleep(0.01)
+            self.assertEqual(bot.sent, [(10, "<@1> sooner")])
+            self.assertLess(time.monotonic() - started, 2.5)
+            await reminder.close()
+
+        asyncio.run(run())
+
+    def test_due_in_one_pass(self):
+        async def run():
+            bot = StubBot()
+            scheduler = RecordingScheduler()
+            reminder = self.create_reminder(bot, scheduler=scheduler)
+            reminder.start()
+            reminder.add(utc_timestamp() + 3600, 1, 10, "later")
+            await asyncio.sleep(0.05)
+            # Reminders the loop was late for are all sent at once
+            current_time = int(utc_timestamp())
+            for i in range(50):
+                reminder.add(current_time - i, i, 10 + i % 3, str(i))
+            await asyncio.sleep(0.05)
+            await reminder.close()
+            self.assertTrue(sorted(range(current_time - 49, current_time + 1)) in
+                            [sorted(due) for due in scheduler.popped])
+            self.assertEqual(len(bot.sent), 3)
+            self.assertEqual(sum(content.count("\n") + 1 for _, content in bot.sent), 50)
+            self.assertEqual(len(reminder.cache), 1)
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
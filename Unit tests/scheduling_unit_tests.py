@@ -0,0 +1,180 @@
+import os
+import random
+import time
+import tracemalloc
+import unittest
+from scheduling import HeapScheduler, TimingWheel
+
+# The full size benchmark takes long, so it is run only when ASSERT_BENCHMARKS=1 is set like the timed benchmarks
+ASSERT_BENCHMARKS = os.environ.get("ASSERT_BENCHMARKS") == "1"
+
+
+class HeapSchedulerTesting(unittest.TestCase):
+
+    def test_add(self):
+        scheduler = HeapScheduler()
+        self.assertIsNone(scheduler.next_due())
+        self.assertTrue(scheduler.add(100))
+        self.assertFalse(scheduler.add(200))
+        self.assertTrue(scheduler.add(50))
+        self.assertFalse(scheduler.add(50))
+        self.assertEqual(len(scheduler), 3)
+        self.assertEqual(scheduler.next_due(), 50)
+        self.assertTrue(200 in scheduler)
+
+    def test_pop_due(self):
+        scheduler = HeapScheduler()
+        timestamps = list(range(1000))
+        random.shuffle(timestamps)
+        for timestamp in timestamps:
+            scheduler.add(timestamp)
+
+        # Everything due by the given time is popped, so late checks do not skip timestamps
+        self.assertEqual(scheduler.pop_due(-1), [])
+        self.assertEqual(scheduler.pop_due(9.5), list(range(10)))
+        self.assertEqual(scheduler.pop_due(499), list(range(10, 500)))
+        self.assertEqual(scheduler.next_due(), 500)
+        self.assertEqual(len(scheduler), 500)
+
+    def test_discard(self):
+        scheduler = HeapScheduler()
+        for timestamp in range(10):
+            scheduler.add(timestamp)
+        scheduler.discard(0)
+        scheduler.discard(5)
+        scheduler.discard(100)
+        self.assertEqual(scheduler.next_due(), 1)
+        self.assertFalse(5 in scheduler)
+
+        scheduler.add(5)
+        self.assertEqual(scheduler.pop_due(10), [1, 2, 3, 4, 5, 6, 7, 8, 9])
+
+        # Churn of discarded timestamps
+        for timestamp in range(10000):
+            scheduler.add(timestamp)
+            scheduler.discard(timestamp)
+        self.assertEqual(len(scheduler), 0)
+        self.assertIsNone(scheduler.next_due())
+
+        scheduler.add(1)
+        scheduler.clear()
+        self.assertEqual(len(scheduler), 0)
+
+
+
+class TimingWheelTesting(unittest.TestCase):
+
+    start = 1600000000 - 1600000000 % 86400
+
+    def test_add(self):
+        wheel = TimingWheel(self.start)
+        self.assertIsNone(wheel.next_due())
+        self.assertTrue(wheel.add(self.start + 3600))
+        self.assertFalse(wheel.add(self.start + 400 * 86400))
+        self.assertTrue(wheel.add(self.start + 30))
+        self.assertFalse(wheel.add(self.start + 30))
+        self.assertTrue(wheel.add(self.start - 10))
+        self.assertEqual(len(wheel), 4)
+        self.assertEqual(wheel.next_due(), self.start - 10)
+        self.assertTrue(self.start + 400 * 86400 in wheel)
+        self.assertFalse(self.start + 31 in wheel)
+
+    def test_pop_due(self):
+        wheel = TimingWheel(self.start, num_days=7)
+        timestamps = [self.start + offset for offset in (0, 1, 59, 60, 61, 3599, 3600, 86399, 86400, 86401,
+                                                          7 * 86400, 30 * 86400 + 5)]
+        for timestamp in timestamps:
+            wheel.add(timestamp)
+
+        self.assertEqual(wheel.pop_due(self.start), [self.start])
+        self.assertEqual(wheel.pop_due(self.start + 60.5), timestamps[1:4])
+        self.assertEqual(wheel.current_time, self.start + 60)
+        self.assertEqual(wheel.next_due(), self.start + 61)
+
+        # After a long pause everything missed is popped in order
+        self.assertEqual(wheel.pop_due(self.start + 10 * 86400), timestamps[4:11])
+        self.assertEqual(wheel.next_due(), timestamps[11])
+        self.assertEqual(wheel.pop_due(self.start + 40 * 86400), timestamps[11:])
+        self.assertEqual(len(wheel), 0)
+
+    def test_discard(self):
+        wheel = TimingWheel(self.start)
+        for offset in (5, 500, 50000, 5000000, 500000000):
+            wheel.add(self.start + offset)
+        for offset in (5, 50000, 500000000, 6):
+            wheel.discard(self.start + offset)
+        self.assertEqual(len(wheel), 2)
+        self.assertEqual(wheel.next_due(), self.start + 500)
+        self.assertEqual(wheel.pop_due(self.start + 10 ** 9), [self.start + 500, self.start + 5000000])
+
+        wheel.add(self.start + 10 ** 9 + 1)
+        wheel.clear()
+        self.assertEqual(len(wheel), 0)
+        self.assertIsNone(wheel.next_due())
+
+    def test_compare_heap(self):
+        rng = random.Random(0)
+        wheel = TimingWheel(self.start, num_days=3)
+        heap = HeapScheduler()
+        current_time = self.start
+        for _ in range(20000):
+            operation = rng.random()
+            if operation < 0.5:
+                timestamp = current_time + rng.choice([rng.randint(-5, 100), rng.randint(0, 4000),
+                                                       rng.randint(0, 200000), rng.randint(0, 10 * 86400)])
+                self.assertEqual(wheel.add(timestamp), heap.add(timestamp))
+            elif operation < 0.65 and len(heap):
+                timestamp = rng.choice([heap.next_due(), current_time + rng.randint(0, 100)])
+                wheel.discard(timestamp)
+                heap.discard(timestamp)
+            else:
+                current_time += rng.choice([0, 1, 59, 60, 61, 3600, 86400, rng.randint(0, 5 * 86400)])
+                self.assertEqual(wheel.pop_due(current_time), heap.pop_due(current_time))
+            self.assertEqual(wheel.next_due(), heap.next_due())
+            self.assertEqual(len(wheel), len(heap))
+
+    @staticmethod
+    def measure_scheduler(scheduler, timestamps: list, end_time: int) -> tuple:
+        """
+        Add timestamps into a scheduler and advance it to the end time in one minute steps.
+        :return: Insert time, advance time and number of popped timestamps
+        """
+        start = time.perf_counter()
+        for timestamp in timestamps:
+            scheduler.add(timestamp)
+        insert_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        num_popped = 0
+        for current_time in range(TimingWheelTesting.start, end_time + 60, 60):
+            num_popped += len(scheduler.pop_due(current_time))
+        return insert_time, time.perf_counter() - start, num_popped
+
+    @staticmethod
+    def measure_memory(scheduler, timestamps: list) -> int:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for timestamp in timestamps:
+            scheduler.add(timestamp)
+        allocated = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        return allocated
+
+    def test_timing_wheel_benchmark(self):
+        n = 1000000 if ASSERT_BENCHMARKS else 10000
+        end_time = self.start + 30 * 86400
+        timestamps = random.Random(0).sample(range(self.start + 1, end_time), n)
+
+        print(f"\nScheduling {n} timestamps over 30 days, advanced in one minute steps:")
+        for name, scheduler_factory in (("HeapScheduler", HeapScheduler),
+                                        ("TimingWheel", lambda: TimingWheel(self.start))):
+            insert_time, advance_time, num_popped = self.measure_scheduler(scheduler_factory(), timestamps,
+                                                                           end_time)
+            memory = self.measure_memory(scheduler_factory(), timestamps)
+            print(f"{name}: insert {insert_time:.2f} s, advance {advance_time:.2f} s, "
+                  f"memory {memory / n:.0f} B/timestamp")
+            self.assertEqual(num_popped, n)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from tiered_caching import TieredCache
+from cache_backends import SqliteBackend
+
+
+class TieredCacheTesting(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "test.sqlite3")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_storage(self):
+        async def run():
+            storage = SqliteBackend(self.path, item_lifetime=1)
+            await storage.set("a", {"value": [1, 2, 3]})
+            await storage.set(("tuple", 1), "b")
+            self.assertEqual(await storage.get("a"), {"value": [1, 2, 3]})
+            self.assertEqual(await storage.get(("tuple", 1)), "b")
+            with self.assertRaises(KeyError):
+                await storage.get("missing")
+
+            await storage.delete("a")
+            with self.assertRaises(KeyError):
+                await storage.get("a")
+
+            await asyncio.sleep(1)
+            with self.assertRaises(KeyError):
+                await storage.get(("tuple", 1))
+            await storage.close()
+
+            # Items persist over reopening the file
+            storage = SqliteBackend(self.path)
+            await storage.set("c", 3)
+            await storage.close()
+            storage = SqliteBackend(self.path)
+            self.assertEqual(await storage.get("c"), 3)
+            self.assertEqual(await storage.length(), 1)
+            await storage.close()
+
+        asyncio.run(run())
+
+    def test_demote_promote(self):
+        calls = []
+
+        async def loader(value):
+            calls.append(value)
+            return value
+
+        async def run():
+            cache = TieredCache("tiered", SqliteBackend(self.path), max_size=2)
+            for key in "abc":
+                await cache.get_or_fetch(key, lambda: loader(key.upper()))
+            self.assertEqual(set(cache.keys()), {"b", "c"})
+
+            # Item evicted from L1 is found from L2 without calling the loader, and is promoted back into L1
+            await asyncio.sleep(0.1)
+            self.assertEqual(await cache.get_or_fetch("a", lambda: loader("X")), "A")
+            self.assertEqual(calls, ["A", "B", "C"])
+            self.assertTrue("a" in cache)
+
+            # Explicitly deleted items are not demoted
+            cache.delete_unpopular(1)
+            self.assertEqual(await cache.get_or_fetch("d", lambda: loader("D")), "D")
+            self.assertEqual(calls, ["A", "B", "C", "D"])
+            await cache.close()
+
+        asyncio.run(run())
+
+    def test_promoted_age(self):
+        calls = []
+
+        async def loader(value):
+            calls.append(value)
+            return value
+
+        async def run():
+            cache = TieredCache("tiered", SqliteBackend(self.path), max_size=1)
+            cache.set_max_age(seconds=1)
+            await cache.get_or_fetch("a", lambda: loader("a1"))
+            await cache.get_or_fetch("b", lambda: loader("b1"))
+            await asyncio.sleep(0.1)
+
+            # A fresh item keeps its age when it is promoted
+            self.assertEqual(await cache.get_or_fetch("a", lambda: loader("a2")), "a1")
+            self.assertGreaterEqual(cache._get_item("a").age, 0.1)
+
+            # An item outdated while in L2 is fetched again
+            await asyncio.sleep(1)
+            self.assertEqual(await cache.get_or_fetch("a", lambda: loader("a3")), "a3")
+            self.assertEqual(calls, ["a1", "b1", "a3"])
+
+            # With stale-while-revalidate the outdated value is returned and refreshed in the background
+            cache.set_max_age(seconds=1, stale_while_revalidate=True)
+            await asyncio.sleep(1.1)
+            self.assertEqual(await cache.get_or_fetch("b", lambda: loader("b2")), "b1")
+            await asyncio.sleep(0.1)
+            self.assertEqual(calls, ["a1", "b1", "a3", "b2"])
+            self.assertEqual(await cache.get_or_fetch("b", lambda: loader("b3")), "b2")
+            await cache.close()
+
+        asyncio.run(run())
+
+    def test_demote_expired(self):
+        async def loader():
+            return "fetched"
+
+        async def run():
+            cache = TieredCache("tiered", SqliteBackend(self.path, item_lifetime=60))
+            cache.set_item_lifetime(seconds=1)
+            cache["a"] = "cached"
+            time.sleep(1)
+            self.assertEqual(cache.delete_deprecated(), 1)
+            self.assertFalse("a" in cache)
+            await asyncio.sleep(0.1)
+            self.assertEqual(await cache.get_or_fetch("a", loader), "cached")
+            await cache.close()
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,490 @@
+"""
+MIT License
+
+Copyright (c) 2020 Visperi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import pickle
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Callable, Dict, Tuple, List, Union
+from urllib.parse import urlparse, unquote
+
+# Header bytes of serialized values
+_RAW_VALUE = b"\x00"
+_COMPRESSED_VALUE = b"\x01"
+# Errors of loading values written in another format or by another version of the program
+_LOAD_ERRORS = (ValueError, EOFError, AttributeError, ImportError, pickle.UnpicklingError, zlib.error)
+# Length of the HMAC-SHA256 signatures of shared values
+_SIGNATURE_LENGTH = hashlib.sha256().digest_size
+
+
+class CacheBackendError(Exception):
+    """
+    Raised when a cache backend can not complete an operation, e.g. because its database is unavailable.
+    """
+    pass
+
+
+def dump_value(value: Any, compress_threshold: int = 1024) -> bytes:
+    """
+    Serialize a value into a compact byte string. Values are pickled with the highest protocol, and pickles longer
+    than the threshold are compressed with zlib.
+
+    :param value: Any picklable object
+    :param compress_threshold: Minimum pickle length in bytes that is compressed
+    :return: Serialized value
+    """
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) >= compress_threshold:
+        compressed = zlib.compress(data, 6)
+        if len(compressed) < len(data):
+            return _COMPRESSED_VALUE + compressed
+    return _RAW_VALUE + data
+
+
+def load_value(data: bytes) -> Any:
+    """
+    Deserialize a value serialized with dump_value().
+
+    :param data: Serialized value
+    :return: The original value
+    :raises ValueError: If the data is not a serialized value
+    """
+    header, payload = data[:1], data[1:]
+    if header == _RAW_VALUE:
+        return pickle.loads(payload)
+    if header == _COMPRESSED_VALUE:
+        return pickle.loads(zlib.decompress(payload))
+    raise ValueError(f"Unknown value header {header!r}")
+
+
+class CacheBackend:
+    """
+    Interface for the asynchronous key-value storages used as the second level of a TieredCache. Backends store
+    values with an optional time to live and raise KeyError for keys that are not found or have expired.
+
+    Backends with shared set to True can be used by several processes at the same time. For them TieredCache writes
+    fetched values through immediately and uses the fetch locks to avoid fetching the same value in every process.
+    """
+
+    shared = False
+
+    def __init__(self, item_lifetime: Optional[int] = None):
+        """
+        :param item_lifetime: Default time to live of the stored items in seconds. None means items never expire.
+        """
+        self.item_lifetime = item_lifetime
+
+    def _ttl(self, ttl: Optional[float]) -> Optional[float]:
+        return self.item_lifetime if ttl is None else ttl
+
+    async def get(self, key: Any) -> Any:
+        """
+        Get a value from the backend.
+
+        :param key: Key of the value
+        :return: The stored value
+        :raises KeyError: If the key is not found or its item has expired
+        """
+        raise NotImplementedError
+
+    async def set(self, key: Any, value: Any, ttl: Optional[float] = None):
+        """
+        Store a value, replacing an existing one with the same key.
+
+        :param key: Key of the value
+        :param value: The stored value
+        :param ttl: Time to live in seconds. None (default) uses the item lifetime of the backend.
+        """
+        raise NotImplementedError
+
+    async def delete(self, key: Any):
+        """
+        Delete a value from the backend. Does nothing if the key is not found.
+        """
+        raise NotImplementedError
+
+    async def delete_expired(self) -> int:
+        """
+        Delete all expired items. Backends with native expiry do nothing.
+
+        :return: Number of deleted items
+        """
+        return 0
+
+    async def length(self) -> int:
+        """
+        :return: Number of items in the backend. May include expired items that have not been deleted yet.
+        """
+        raise NotImplementedError
+
+    async def try_lock(self, key: Any, ttl: float) -> bool:
+        """
+        Try to acquire a fetch lock for a key. The lock is released automatically after its time to live, so a
+        crashed process can not hold it forever. Backends that are not shared always give the lock.
+
+        :param key: Key whose value is going to be fetched
+        :param ttl: Time to live of the lock in seconds
+        :return: True if the lock was acquired
+        """
+        return True
+
+    async def unlock(self, key: Any):
+        """
+        Release a fetch lock acquired with try_lock().
+        """
+        pass
+
+    async def close(self):
+        """
+        Release the resources of the backend after all pending operations are done.
+        """
+        pass
+
+
+class DictBackend(CacheBackend):
+    """
+    Backend storing the values in an ordinary dictionary in the process memory. Values are not serialized.
+    """
+
+    def __init__(self, item_lifetime: Optional[int] = None):
+        super().__init__(item_lifetime)
+        self.__items: Dict[Any, Tuple[Any, Optional[float]]] = {}
+
+    async def get(self, key: Any) -> Any:
+        value, expires = self.__items[key]
+        if expires is not None and expires <= time.monotonic():
+            del self.__items[key]
+            raise KeyError(key)
+        return value
+
+    async def set(self, key: Any, value: Any, ttl: Optional[float] = None):
+        ttl = self._ttl(ttl)
+        self.__items[key] = (value, None if ttl is None else time.monotonic() + ttl)
+
+    async def delete(self, key: Any):
+        self.__items.pop(key, None)
+
+    async def delete_expired(self) -> int:
+        current_time = time.monotonic()
+        expired_keys = [key for key, (_, expires) in self.__items.items()
+                        if expires is not None and expires <= current_time]
+        for key in expired_keys:
+            del self.__items[key]
+        return len(expired_keys)
+
+    async def length(self) -> int:
+        return len(self.__items)
+
+    async def close(self):
+        self.__items.clear()
+
+
+class SqliteBackend(CacheBackend):
+    """
+    Backend storing the values in a local sqlite file. Keys and values are pickled, so they can be any picklable
+    objects.
+
+    All database work is done in a single worker thread, which owns the database connection. The event loop only
+    waits for the results, so slow disk operations never block it.
+    """
+
+    def __init__(self, path: str, item_lifetime: Optional[int] = None, cleanup_interval: int = 1000):
+        """
+        :param path: Path to the sqlite file. Created if it does not exist.
+        :param item_lifetime: Seconds after which stored items expire. None means items never expire.
+        :param cleanup_interval: Number of writes after which all expired items are deleted from the file
+        """
+        super().__init__(item_lifetime)
+        self.path = path
+        self.cleanup_interval = cleanup_interval
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=type(self).__name__)
+        self.__connection: Optional[sqlite3.Connection] = None
+        self.__writes = 0
+        self.__executor.submit(self.__connect).result()
+
+    def __connect(self):
+        self.__connection = sqlite3.connect(self.path)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("CREATE TABLE IF NOT EXISTS items "
+                                  "(key BLOB PRIMARY KEY, value BLOB NOT NULL, expires REAL)")
+        self.__connection.execute("CREATE INDEX IF NOT EXISTS items_expires ON items (expires)")
+        self.__connection.commit()
+
+    @staticmethod
+    def __dump_key(key: Any) -> bytes:
+        return pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __get(self, key: Any) -> Any:
+        row = self.__connection.execute("SELECT value, expires FROM items WHERE key = ?",
+                                        (self.__dump_key(key),)).fetchone()
+        if row is None:
+            raise KeyError(key)
+
+        value, expires = row
+        if expires is not None and expires <= time.time():
+            self.__delete(key)
+            raise KeyError(key)
+        try:
+            return load_value(value)
+        except _LOAD_ERRORS:
+            # Written in an older format, treat it as a miss
+            self.__delete(key)
+            raise KeyError(key)
+
+    def __set(self, key: Any, value: Any, ttl: Optional[float]):
+        expires = None if ttl is None else time.time() + ttl
+        self.__connection.execute("INSERT OR REPLACE INTO items (key, value, expires) VALUES (?, ?, ?)",
+                                  (self.__dump_key(key), dump_value(value), expires))
+        self.__writes += 1
+        if self.__writes % self.cleanup_interval == 0:
+            self.__delete_expired()
+        self.__connection.commit()
+
+    def __delete(self, key: Any):
+        self.__connection.execute("DELETE FROM items WHERE key = ?", (self.__dump_key(key),))
+        self.__connection.commit()
+
+    def __delete_expired(self) -> int:
+        cursor = self.__connection.execute("DELETE FROM items WHERE expires <= ?", (time.time(),))
+        self.__connection.commit()
+        return cursor.rowcount
+
+    def __len(self) -> int:
+        return self.__connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def __close(self):
+        self.__connection.close()
+        self.__connection = None
+
+    async def __run(self, function: Callable, *args) -> Any:
+        try:
+            return await asyncio.get_event_loop().run_in_executor(self.__executor, function, *args)
+        except sqlite3.Error as e:
+            raise CacheBackendError(f"{type(self).__name__} operation failed: {e}") from e
+
+    async def get(self, key: Any) -> Any:
+        return await self.__run(self.__get, key)
+
+    async def set(self, key: Any, value: Any, ttl: Optional[float] = None):
+        await self.__run(self.__set, key, value, self._ttl(ttl))
+
+    async def delete(self, key: Any):
+        await self.__run(self.__delete, key)
+
+    async def delete_expired(self) -> int:
+        return await self.__run(self.__delete_expired)
+
+    async def length(self) -> int:
+        return await self.__run(self.__len)
+
+    async def close(self):
+        await self.__run(self.__close)
+        self.__executor.shutdown(wait=False)
+
+
+class RedisBackend(CacheBackend):
+    """
+    Backend storing the values in a Redis compatible server, so several bot processes can share the same cached
+    values. Talks the Redis protocol (RESP) directly over an asyncio connection, so no client library is needed.
+
+    Values are serialized with dump_value() and the item lifetimes are set as native key expirations. String keys
+    are stored as they are after the namespace, other keys are pickled. Values are unpickled only if they are signed
+    with the secret together with their key, so anyone else able to write into the server can not make the bot run
+    code, or move values to other keys. Values that are not signed or can not be loaded are treated as misses.
+    """
+
+    shared = True
+
+    def __init__(self, url: str = "redis://localhost:6379/0", namespace: str = "osrshelper",
+                 item_lifetime: Optional[int] = None, compress_threshold: int = 1024, timeout: float = 5, *,
+                 secret: Union[str, bytes]):
+        """
+        :param url: Server url in format redis://[:password@]host[:port][/db]
+        :param namespace: Prefix for all keys, so several caches can share one database
+        :param item_lifetime: Seconds after which stored items expire. None means items never expire.
+        :param compress_threshold: Minimum serialized value length in bytes that is compressed
+        :param timeout: Seconds to wait for a reply before the operation fails
+        :param secret: Key for signing the values. Every process sharing the values must use the same secret.
+        :raises ValueError: If the url is not a redis url or the secret is empty
+        """
+        super().__init__(item_lifetime)
+        if not secret:
+            raise ValueError("A secret is needed for signing the shared values.")
+        self.__secret = secret.encode() if isinstance(secret, str) else secret
+        parsed_url = urlparse(url)
+        if parsed_url.scheme != "redis":
+            raise ValueError(f"Unsupported url scheme \"{parsed_url.scheme}\", expected \"redis\".")
+        self.host = parsed_url.hostname or "localhost"
+        self.port = parsed_url.port or 6379
+        self.db = int(parsed_url.path.lstrip("/") or 0)
+        self.__password = unquote(parsed_url.password) if parsed_url.password else None
+        self.namespace = namespace
+        self.compress_threshold = compress_threshold
+        self.timeout = timeout
+        self.__prefix = f"{namespace}:".encode()
+        self.__reader: Optional[asyncio.StreamReader] = None
+        self.__writer: Optional[asyncio.StreamWriter] = None
+        self.__lock: Optional[asyncio.Lock] = None
+
+    def __dump_key(self, key: Any, kind: bytes = b"v") -> bytes:
+        if isinstance(key, str):
+            return self.__prefix + kind + b":s:" + key.encode()
+        return self.__prefix + kind + b":p:" + pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __sign(self, key: bytes, data: bytes) -> bytes:
+        return hmac.new(self.__secret, b"%d:%s%s" % (len(key), key, data), hashlib.sha256).digest()
+
+    @staticmethod
+    def __encode_command(args: Tuple[Union[str, bytes, int, float], ...]) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    async def __read_reply(self) -> Any:
+        line = await self.__reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the server")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode()
+        if prefix == b"-":
+            raise CacheBackendError(f"Redis error: {payload.decode()}")
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            return (await self.__reader.readexactly(length + 2))[:-2]
+        if prefix == b"*":
+            length = int(payload)
+            if length == -1:
+                return None
+            return [await self.__read_reply() for _ in range(length)]
+        raise CacheBackendError(f"Unknown reply type {prefix!r}")
+
+    async def __connect(self):
+        self.__reader, self.__writer = await asyncio.open_connection(self.host, self.port)
+        if self.__password is not None:
+            await self.__send(("AUTH", self.__password))
+        if self.db:
+            await self.__send(("SELECT", self.db))
+
+    async def __send(self, args: Tuple) -> Any:
+        self.__writer.write(self.__encode_command(args))
+        await self.__writer.drain()
+        return await self.__read_reply()
+
+    def __disconnect(self):
+        if self.__writer is not None:
+            self.__writer.close()
+        self.__reader = self.__writer = None
+
+    async def execute(self, *args: Union[str, bytes, int, float]) -> Any:
+        """
+        Execute a command on the server. Commands are sent one at a time over a single connection, which is opened
+        when needed and reopened after connection errors.
+
+        :param args: Command name and its arguments
+        :return: Reply of the server
+        :raises CacheBackendError: If the server can not be reached or it replies with an error
+        """
+        if self.__lock is None:
+            self.__lock = asyncio.Lock()
+        async with self.__lock:
+            try:
+                if self.__writer is None:
+                    await asyncio.wait_for(self.__connect(), self.timeout)
+                return await asyncio.wait_for(self.__send(args), self.timeout)
+            except CacheBackendError:
+                raise
+            except (OSError, EOFError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                # The connection is in an unknown state, so a reply to this command could be read by the next one
+                self.__disconnect()
+                raise CacheBackendError(f"{type(self).__name__} operation failed: {e!r}") from e
+            except BaseException:
+                # Same for cancellations and malformed replies
+                self.__disconnect()
+                raise
+
+    async def get(self, key: Any) -> Any:
+        redis_key = self.__dump_key(key)
+        data = await self.execute("GET", redis_key)
+        if data is None:
+            raise KeyError(key)
+        signature, data = data[:_SIGNATURE_LENGTH], data[_SIGNATURE_LENGTH:]
+        if not hmac.compare_digest(signature, self.__sign(redis_key, data)):
+            raise KeyError(key)
+        try:
+            return load_value(data)
+        except _LOAD_ERRORS:
+            raise KeyError(key) from None
+
+    async def set(self, key: Any, value: Any, ttl: Optional[float] = None):
+        ttl = self._ttl(ttl)
+        redis_key = self.__dump_key(key)
+        data = dump_value(value, self.compress_threshold)
+        args: List[Any] = ["SET", redis_key, self.__sign(redis_key, data) + data]
+        if ttl is not None:
+            args += ["PX", max(1, int(ttl * 1000))]
+        await self.execute(*args)
+
+    async def delete(self, key: Any):
+        await self.execute("DEL", self.__dump_key(key))
+
+    async def length(self) -> int:
+        cursor = b"0"
+        num_keys = 0
+        while True:
+            cursor, keys = await self.execute("SCAN", cursor, "MATCH", self.__prefix + b"v:*", "COUNT", 1000)
+            num_keys += len(keys)
+            if cursor == b"0":
+                return num_keys
+
+    async def try_lock(self, key: Any, ttl: float) -> bool:
+        reply = await self.execute("SET", self.__dump_key(key, b"l"), 1, "NX", "PX", max(1, int(ttl * 1000)))
+        return reply == "OK"
+
+    async def unlock(self, key: Any):
+        await self.execute("DEL", self.__dump_key(key, b"l"))
+
+    async def close(self):
+        if self.__lock is None:
+            self.__disconnect()
+            return
+        async with self.__lock:
+            if self.__writer is not None:
+                self.__writer.close()
+                try:
+                    await self.__writer.wait_closed()
+                except OSError:
+                    pass
+            self.__reader = self.__writer = None
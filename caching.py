@@ -22,37 +22,212 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from typing import Union, Any, Dict, Tuple, ItemsView, KeysView, ValuesView, Iterable, Optional, Callable
+from typing import Union, Any, Dict, Tuple, ItemsView, KeysView, ValuesView, Iterable, Optional, Callable, List, \
+    Awaitable
 from collections.abc import MutableMapping
+from collections import OrderedDict
+from enum import Enum
+import asyncio
 import datetime
+import functools
+import heapq
+import itertools
+import os
+import pickle
+import struct
+import sys
+import threading
+import time
+import weakref
+import zlib
+
+
+# Snapshot file header: magic bytes, format version, wall clock time of the snapshot, payload CRC32, payload length
+SNAPSHOT_MAGIC = b"OHCS"
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct("<4sHdIQ")
+
+
+class EEvictionPolicy(Enum):
+    """
+    Enum for available eviction policies. The policy decides which item is deleted when a new item is added into a
+    cache that has reached its maximum size.
+    """
+    lru = "lru"  # Least recently used, based on CacheItem.last_hit
+    lfu = "lfu"  # Least frequently used, based on CacheItem.total_hits. Ties are broken by least recent use
+    fifo = "fifo"  # First in, first out. Requests do not affect the order
+
+
+class EEvictionReason(Enum):
+    """
+    Enum for reasons why items are deleted from a cache without being explicitly deleted.
+    """
+    size = "size"  # The cache was full
+    weight = "weight"  # The cache was over its byte budget
+    expired = "expired"  # The item outlived the item lifetime
+    unpopular = "unpopular"  # Deleted with Cache.delete_unpopular()
+    delegated = "delegated"  # Deleted with Cache.delete_delegated()
+
+
+def estimate_size(obj: Any, _seen: Optional[set] = None) -> int:
+    """
+    Estimate memory usage of an object in bytes. Contents of lists, tuples, sets, dicts and objects with __dict__ are
+    included recursively, and objects referenced multiple times are counted only once. The result is an approximation,
+    e.g. memory shared with objects outside the estimated one is counted too.
+
+    :param obj: Object to estimate
+    :return: Approximate size in bytes
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        size += sum(estimate_size(key, _seen) + estimate_size(value, _seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), _seen)
+
+    return size
+
+
+class CacheStatistics:
+    """
+    Aggregate counters of a cache.
+
+    Attributes:
+        hits        Number of successful requests
+        misses      Number of requests for keys that were not in cache
+        sets        Number of items added into cache, including replaced ones
+        evictions   Number of items deleted without explicit deletion, by eviction reason
+    """
+    __slots__ = ("hits", "misses", "sets", "evictions")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions: Dict[EEvictionReason, int] = {reason: 0 for reason in EEvictionReason}
+
+    @property
+    def hit_ratio(self) -> Optional[float]:
+        """
+        :return: Ratio of hits to all requests, or None if there has been no requests
+        """
+        requests = self.hits + self.misses
+        if requests == 0:
+            return None
+        return self.hits / requests
+
+    def reset(self):
+        self.__init__()
 
 
 class CacheItem:
     """
     Encapsulates the actual value and some extra internal values for items stored into Cache.
 
+    Items are stored with __slots__ and their timestamps as floats of the monotonic clock to keep them small and cheap
+    to update on every request. The last hit is converted into a datetime only when it is explicitly asked for.
+
     Attributes:
         last_hit    UTC datetime when this item was added into the cache (no requests) or last requested time
         key         The cache key holding this item
         value       The actual value this item is pointing to
         total_hits  Number of times this item has been requested from cache. Zero if no requests after adding into cache
     """
+    __slots__ = ("key", "value", "total_hits", "_last_hit_time", "_created_time", "_weight")
 
-    def __init__(self, key: Any, value: Any):
-        self.last_hit = datetime.datetime.utcnow()
+    def __init__(self, key: Any, value: Any, total_hits: int = 0, timestamp: Optional[float] = None):
+        """
+        :param key: Cache key of the item
+        :param value: Cached value
+        :param total_hits: Initial number of hits
+        :param timestamp: Monotonic creation time. None (default) reads the clock. Bulk inserts share one reading.
+        """
+        self._last_hit_time: float = time.monotonic() if timestamp is None else timestamp
+        self._created_time: float = self._last_hit_time
+        self._weight: int = 0
         self.key = key
         self.value = value
-        self.total_hits = 0
+        self.total_hits = total_hits
+
+    @property
+    def last_hit(self) -> datetime.datetime:
+        seconds_since_hit = time.monotonic() - self._last_hit_time
+        return datetime.datetime.utcnow() - datetime.timedelta(seconds=seconds_since_hit)
+
+    @property
+    def age(self) -> float:
+        """
+        :return: Seconds since this item was added into the cache
+        """
+        return time.monotonic() - self._created_time
 
-    def _hit(self):
+    def _hit(self, hit_time: Optional[float] = None):
         """
         Update internal data of the cache item. These values measure when and how many times this item has
         been requested.
+
+        :param hit_time: Monotonic time of the request. None (default) reads the clock.
         """
-        self.last_hit = datetime.datetime.utcnow()
+        self._last_hit_time = time.monotonic() if hit_time is None else hit_time
         self.total_hits += 1
 
 
+class _FrequencyIndex:
+    """
+    Index for finding the least frequently used cache key in O(1) time. Cache keys are grouped into buckets by their
+    total hits, and each bucket keeps its keys in the order they arrived to it.
+    """
+
+    def __init__(self):
+        self.__buckets: Dict[int, OrderedDict] = {}
+        self.__min_hits: int = 0
+
+    def __discard(self, cache_key: Any, hits: int):
+        bucket = self.__buckets[hits]
+        del bucket[cache_key]
+        if not bucket:
+            del self.__buckets[hits]
+
+    def add(self, cache_item: CacheItem):
+        self.__buckets.setdefault(cache_item.total_hits, OrderedDict())[cache_item.key] = None
+        self.__min_hits = min(self.__min_hits, cache_item.total_hits)
+
+    def hit(self, cache_item: CacheItem):
+        """
+        Move a cache item to the next bucket. Must be called before the item hits are incremented.
+        """
+        hits = cache_item.total_hits
+        self.__discard(cache_item.key, hits)
+        self.__buckets.setdefault(hits + 1, OrderedDict())[cache_item.key] = None
+        if self.__min_hits == hits and hits not in self.__buckets:
+            self.__min_hits = hits + 1
+
+    def remove(self, cache_item: CacheItem):
+        self.__discard(cache_item.key, cache_item.total_hits)
+
+    def victim(self) -> Any:
+        """
+        :return: Key of the least frequently used cache item
+        """
+        if self.__min_hits not in self.__buckets:
+            # The minimum bucket has been emptied by a removal. Happens rarely, so a full lookup is fine here
+            self.__min_hits = min(self.__buckets)
+        return next(iter(self.__buckets[self.__min_hits]))
+
+    def clear(self):
+        self.__buckets.clear()
+        self.__min_hits = 0
+
+
 # noinspection PyProtectedMember
 class Cache(MutableMapping):
     """
@@ -60,17 +235,67 @@ class Cache(MutableMapping):
     values are returned instead unless specific collection commands are used.
     """
 
-    def __init__(self, name: Optional[str] = None, allow_type_override: bool = True):
+    def __init__(self, name: Optional[str] = None, allow_type_override: bool = True, max_size: Optional[int] = None,
+                 eviction_policy: EEvictionPolicy = EEvictionPolicy.lru, lazy_expiry: bool = False,
+                 max_bytes: Optional[int] = None, weigher: Callable[[Any], int] = estimate_size):
         """
         :param name: Optional name for the cache.
         :param allow_type_override: If True, values stored into cache can be any type. If false, trying to overwrite
                                     an existing cache item with different type of value raises an error.
+        :param max_size: Maximum number of items in the cache. If the cache is full, adding a new item evicts one
+                         existing item based on the eviction policy. None (default) means no limit.
+        :param eviction_policy: Policy used to choose the evicted item when the cache is full.
+        :param lazy_expiry: If True, requesting an item that has outlived the item lifetime deletes it and raises
+                            KeyError instead of returning it.
+        :param max_bytes: Maximum total weight of the cached values, see set_max_bytes(). None (default) means no limit.
+        :param weigher: Function returning the weight of a value in bytes. Default is an estimate of the memory usage
+                        of the value and its contents.
         """
-        self.__cache: Dict[Any, CacheItem] = {}
+        self.__cache: Dict[Any, CacheItem] = OrderedDict()
+        self.__eviction_policy: EEvictionPolicy = eviction_policy
+        self.__frequency_index: Optional[_FrequencyIndex] = None
+        if eviction_policy is EEvictionPolicy.lfu:
+            self.__frequency_index = _FrequencyIndex()
+        # Min-heap of (last hit time, sequence, key) entries. Entries are not updated on hits or deletions, so they are
+        # validated against the actual items when they are popped. Only keys are referenced, so values of deleted items
+        # are freed even while their entries remain.
+        self.__expiry_heap: List[Tuple[float, int, Any]] = []
+        self.__expiry_sequence = itertools.count()
+        # Expiration times of negative results, see add_negative()
+        self.__negative_items: Dict[Any, float] = OrderedDict()
+        # Futures of currently running get_or_fetch loaders
+        self.__in_flight: Dict[Any, asyncio.Future] = {}
+
+        self.statistics: CacheStatistics = CacheStatistics()
+        # Called with the item and the reason whenever an item is evicted
+        self.eviction_listener: Optional[Callable[[CacheItem, EEvictionReason], None]] = None
+        self.lazy_expiry: bool = lazy_expiry
         self.item_lifetime: Union[None, int] = None
+        self.negative_lifetime: int = 300
+        # Options for get_or_fetch, see set_max_age() and set_refresh_ahead()
+        self.max_age: Optional[int] = None
+        self.stale_while_revalidate: bool = False
+        self.refresh_ahead_hits: Optional[int] = None
+        self.refresh_ahead_seconds: int = 0
+        self.max_size: Optional[int] = None
+        self.max_bytes: Optional[int] = None
+        self.weigher: Callable[[Any], int] = weigher
+        # Total weight of the items. Weights are calculated only while the cache has a byte limit
+        self.__total_weight: int = 0
         self.allow_type_override: bool = allow_type_override
         self.name: str = name
 
+        if max_size is not None:
+            self.set_max_size(max_size)
+        if max_bytes is not None:
+            self.set_max_bytes(max_bytes)
+
+        registry.register(self)
+
+    @property
+    def eviction_policy(self) -> EEvictionPolicy:
+        return self.__eviction_policy
+
     def __contains__(self, item: str) -> bool:
         return item in self.__cache
 
@@ -78,30 +303,128 @@ class Cache(MutableMapping):
         return len(self.__cache)
 
     def __getitem__(self, cache_key: Any) -> Any:
-        cache_item = self.__cache[cache_key]
-        cache_item._hit()
+        try:
+            cache_item = self.__cache[cache_key]
+        except KeyError:
+            self.statistics.misses += 1
+            raise
+        if self.__is_expired(cache_item, time.monotonic()):
+            self.__remove(cache_key, EEvictionReason.expired)
+            self.statistics.misses += 1
+            raise KeyError(cache_key)
+        self.__hit(cache_item)
         return cache_item.value
 
     def __setitem__(self, cache_key: Any, value: Any):
-        new_item = CacheItem(cache_key, value)
-        if self.allow_type_override:
-            self.__cache[cache_key] = new_item
+        if not self.allow_type_override and self.__keeps_existing(cache_key, value, time.monotonic()):
             return
 
-        # Overriding cache items with new types is now allowed
-        try:
-            existing = self[cache_key]
-            if type(existing) != type(value):
-                raise TypeError(f"Different type of cache item already has key \"{cache_key}\" (expected "
-                                f"type {type(existing)}, got type {type(value)}")
-        except KeyError:
-            self.__cache[cache_key] = new_item
+        self.__insert(CacheItem(cache_key, value))
+
+    def __is_expired(self, cache_item: CacheItem, current_time: float) -> bool:
+        """
+        :return: True if lazy expiry is enabled and the item has not been requested within its lifetime
+        """
+        return self.lazy_expiry and bool(self.item_lifetime) and \
+            current_time - cache_item._last_hit_time >= self.item_lifetime
+
+    def __keeps_existing(self, cache_key: Any, value: Any, current_time: float) -> bool:
+        """
+        Type override check for caches that do not allow overriding items with new types. The existing item is
+        looked up directly, so the check does not count as a hit.
+
+        :return: True if an item of the same type already exists and must not be replaced
+        :raises TypeError: If an item of different type already exists
+        """
+        existing = self.__cache.get(cache_key)
+        if existing is None or self.__is_expired(existing, current_time):
+            return False
+        if type(existing.value) != type(value):
+            raise TypeError(f"Different type of cache item already has key \"{cache_key}\" (expected "
+                            f"type {type(existing.value)}, got type {type(value)}")
+        return True
+
+    def __hit(self, cache_item: CacheItem, hit_time: Optional[float] = None):
+        """
+        Register a request for a cache item and update its position in the eviction order.
+        """
+        if self.__frequency_index is not None:
+            self.__frequency_index.hit(cache_item)
+        cache_item._hit(hit_time)
+        self.statistics.hits += 1
+        if self.__eviction_policy is EEvictionPolicy.lru:
+            self.__cache.move_to_end(cache_item.key)
+
+    def __insert(self, cache_item: CacheItem):
+        """
+        Insert a new cache item, replacing an existing one with same key. Evicts items if the cache is full. An item
+        weighing more than the whole byte limit is not inserted at all.
+        """
+        cache_key = cache_item.key
+        if self.__negative_items:
+            self.__negative_items.pop(cache_key, None)
+        if cache_key in self.__cache:
+            self.__remove(cache_key)
+        elif self.max_size is not None:
+            while len(self.__cache) >= self.max_size:
+                self.__remove(self.__victim(), EEvictionReason.size)
+
+        if self.max_bytes is not None:
+            cache_item._weight = self.weigher(cache_item.value)
+            if cache_item._weight > self.max_bytes:
+                self.statistics.evictions[EEvictionReason.weight] += 1
+                if self.eviction_listener is not None:
+                    self.eviction_listener(cache_item, EEvictionReason.weight)
+                return
+            while self.__total_weight + cache_item._weight > self.max_bytes:
+                self.__remove(self.__victim(), EEvictionReason.weight)
+            self.__total_weight += cache_item._weight
+
+        self.__cache[cache_key] = cache_item
+        self.statistics.sets += 1
+        if self.__frequency_index is not None:
+            self.__frequency_index.add(cache_item)
+
+        if len(self.__expiry_heap) > 2 * len(self.__cache) + 64:
+            # Too many entries of deleted items have piled up, rebuild the heap from the current items
+            self.__expiry_heap = [(item._last_hit_time, next(self.__expiry_sequence), cache_key)
+                                  for cache_key, item in self.__cache.items()]
+            heapq.heapify(self.__expiry_heap)
+        else:
+            heapq.heappush(self.__expiry_heap, (cache_item._last_hit_time, next(self.__expiry_sequence), cache_key))
+
+    def __remove(self, cache_key: Any, reason: Optional[EEvictionReason] = None) -> CacheItem:
+        """
+        Remove an item from the cache and all its indexes.
+
+        :param cache_key: Key of the removed item
+        :param reason: Eviction reason for statistics. None for explicit deletions
+        :return: The removed CacheItem
+        """
+        cache_item = self.__cache.pop(cache_key)
+        self.__total_weight -= cache_item._weight
+        if self.__frequency_index is not None:
+            self.__frequency_index.remove(cache_item)
+        if reason is not None:
+            self.statistics.evictions[reason] += 1
+            if self.eviction_listener is not None:
+                self.eviction_listener(cache_item, reason)
+        return cache_item
+
+    def __victim(self) -> Any:
+        """
+        :return: Key of the next item to be evicted based on the eviction policy
+        """
+        if self.__frequency_index is not None:
+            return self.__frequency_index.victim()
+        # Both LRU and FIFO caches keep their items in eviction order, only LRU reorders them on hits
+        return next(iter(self.__cache))
 
     def __iter__(self) -> Iterable[Tuple[Any, CacheItem]]:
         yield from self.__cache.items()
 
     def __delitem__(self, cache_key: Any):
-        del self.__cache[cache_key]
+        self.__remove(cache_key)
 
     def __repr__(self):
         return repr(self.__cache)
@@ -116,16 +439,19 @@ class Cache(MutableMapping):
         :param cache_key: Key to search from cache
         :return: The value of popped item
         """
-        return self.__cache.pop(cache_key).value
+        return self.__remove(cache_key).value
 
     def popitem(self) -> Tuple[Any, Any]:
         """
-        Pop the last added item from cache.
+        Pop the last added item from cache. In LRU caches this is the most recently requested item.
 
         :return: Tuple containing the cache key and the value stored into it
         """
 
         lifo_item = self.__cache.popitem()
+        self.__total_weight -= lifo_item[1]._weight
+        if self.__frequency_index is not None:
+            self.__frequency_index.remove(lifo_item[1])
         return lifo_item[0], lifo_item[1].value
 
     def items(self) -> ItemsView[Any, CacheItem]:
@@ -148,11 +474,25 @@ class Cache(MutableMapping):
         """
         return self.__cache.values()
 
+    def _get_item(self, cache_key: Any) -> CacheItem:
+        """
+        Get the raw CacheItem of a key without counting a hit or checking its lifetime. Meant for subclasses that need
+        to adjust the item bookkeeping.
+
+        :raises KeyError: If the key is not in the cache
+        """
+        return self.__cache[cache_key]
+
     def clear(self):
         """
         Clear the cache from items. Choose wisely.
         """
         self.__cache.clear()
+        self.__expiry_heap.clear()
+        self.__negative_items.clear()
+        self.__total_weight = 0
+        if self.__frequency_index is not None:
+            self.__frequency_index.clear()
 
     def get(self, cache_key: Any, default: Optional[Any] = None) -> Any:
         """
@@ -167,29 +507,476 @@ class Cache(MutableMapping):
         except KeyError:
             return default
 
-    def set_item_lifetime(self, seconds: int = 0, minutes: int = 0, hours: int = 0, days: int = 0):
+    def get_many(self, cache_keys: Iterable[Any]) -> Dict[Any, Any]:
         """
-        Set item lifetime for cached items. The total value is converted into total seconds. This value is then used to
-        decide deleted items when deleting deprecated items.
+        Get multiple cache items at once. Works like requesting the items one by one, but the clock is read only
+        once for the whole batch.
 
-        Available to set more complex lifetimes easily instead of calculating seconds manually.
+        :param cache_keys: Keys to be searched from cache
+        :return: Dictionary of the found keys and their values. Keys not found are left out.
+        """
+        found = {}
+        current_time = time.monotonic()
+        cache = self.__cache
+        frequency_index = self.__frequency_index
+        move_to_end = cache.move_to_end if self.__eviction_policy is EEvictionPolicy.lru else None
+        lazy_expiry = self.lazy_expiry and bool(self.item_lifetime)
+        misses = 0
+        for cache_key in cache_keys:
+            cache_item = cache.get(cache_key)
+            if cache_item is None:
+                misses += 1
+                continue
+            if lazy_expiry and current_time - cache_item._last_hit_time >= self.item_lifetime:
+                self.__remove(cache_key, EEvictionReason.expired)
+                misses += 1
+                continue
+            if frequency_index is not None:
+                frequency_index.hit(cache_item)
+            cache_item._last_hit_time = current_time
+            cache_item.total_hits += 1
+            if move_to_end is not None:
+                move_to_end(cache_key)
+            found[cache_key] = cache_item.value
+
+        self.statistics.hits += len(found)
+        self.statistics.misses += misses
+        return found
+
+    def set_many(self, items: Union[Dict[Any, Any], Iterable[Tuple[Any, Any]]]):
+        """
+        Add multiple items into cache at once. All new items share the same creation time, so the clock is read only
+        once for the whole batch.
+
+        :param items: Dictionary or an iterable of (key, value) pairs
+        :raises TypeError: If the cache does not allow type overrides and an item of different type already exists.
+                           Items before the failing one are stored.
+        """
+        if isinstance(items, dict):
+            items = items.items()
+        current_time = time.monotonic()
+        check_types = not self.allow_type_override
+        cache = self.__cache
+        frequency_index = self.__frequency_index
+        negative_items = self.__negative_items
+        expiry_sequence = self.__expiry_sequence
+        max_size = self.max_size
+        added_items = 0
+        for cache_key, value in items:
+            if check_types and self.__keeps_existing(cache_key, value, current_time):
+                continue
+            cache_item = CacheItem(cache_key, value, timestamp=current_time)
+            if self.max_bytes is not None or cache_key in cache or (max_size is not None and len(cache) >= max_size):
+                # Replacing and evicting items needs the full insertion logic
+                self.__insert(cache_item)
+                continue
+
+            # The batch shares the latest timestamp, so appending its entries keeps the expiry heap ordered
+            if negative_items:
+                negative_items.pop(cache_key, None)
+            cache[cache_key] = cache_item
+            if frequency_index is not None:
+                frequency_index.add(cache_item)
+            self.__expiry_heap.append((current_time, next(expiry_sequence), cache_key))
+            added_items += 1
+
+        self.statistics.sets += added_items
+        if len(self.__expiry_heap) > 2 * len(cache) + 64:
+            self.__expiry_heap = [(item._last_hit_time, next(expiry_sequence), cache_key)
+                                  for cache_key, item in cache.items()]
+            heapq.heapify(self.__expiry_heap)
+
+    def delete_many(self, cache_keys: Iterable[Any]) -> int:
+        """
+        Delete multiple items from cache at once. Keys not found are ignored.
+
+        :param cache_keys: Keys of the deleted items
+        :return: Number of deleted items
+        """
+        deleted_items = 0
+        cache = self.__cache
+        frequency_index = self.__frequency_index
+        for cache_key in cache_keys:
+            cache_item = cache.pop(cache_key, None)
+            if cache_item is None:
+                continue
+            self.__total_weight -= cache_item._weight
+            if frequency_index is not None:
+                frequency_index.remove(cache_item)
+            deleted_items += 1
+
+        return deleted_items
+
+    def add_negative(self, cache_key: Any):
+        """
+        Mark a cache key as a negative result, e.g. a page that does not exist. Negative results have their own
+        lifetime, after which they are forgotten. Adding a negative result deletes an existing item with the same key,
+        and adding an item deletes an existing negative result.
+
+        :param cache_key: Cache key that has no value
+        """
+        if cache_key in self.__cache:
+            self.__remove(cache_key)
+
+        negative_items = self.__negative_items
+        negative_items.pop(cache_key, None)
+        negative_items[cache_key] = time.monotonic() + self.negative_lifetime
+        if self.max_size is not None and len(negative_items) > self.max_size:
+            negative_items.popitem(last=False)
+
+    def is_negative(self, cache_key: Any) -> bool:
+        """
+        Check if a cache key is marked as a negative result. Expired negative results are deleted.
+
+        :param cache_key: Cache key to check
+        :return: True if the key is a negative result that has not expired
+        """
+        expiration_time = self.__negative_items.get(cache_key)
+        if expiration_time is None:
+            return False
+        if expiration_time <= time.monotonic():
+            del self.__negative_items[cache_key]
+            return False
+        return True
+
+    def set_negative_lifetime(self, seconds: int = 0, minutes: int = 0, hours: int = 0, days: int = 0):
+        """
+        Set lifetime for negative results added after this call. Should usually be notably shorter than the item
+        lifetime, since missing things tend to appear eventually.
 
         :param seconds:
         :param minutes:
         :param hours:
         :param days:
         """
+        total_seconds = self.__to_seconds(seconds, minutes, hours, days)
+
+        if total_seconds <= 0:
+            raise ValueError("Negative result lifetime must be greater than zero.")
+
+        self.negative_lifetime = total_seconds
+
+    async def get_or_fetch(self, cache_key: Any, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Get a cache item, or fetch and add it into cache if it is not found. Concurrent calls with same cache key
+        share one fetch, so the loader is run only once no matter how many callers are waiting for the item.
+        Exceptions raised by the loader are passed to all waiting callers and nothing is added into cache.
+
+        If max age is set, items older than it are fetched again. With stale-while-revalidate enabled the old value is
+        returned immediately instead and the item is refreshed in the background. With refresh-ahead enabled popular
+        items are refreshed in the background already shortly before they reach the max age.
+
+        :param cache_key: Key to be searched from cache
+        :param coro_factory: Function without arguments returning an awaitable that produces the value, e.g.
+                             lambda: bot.fetch_url(url)
+        :return: The cached or fetched value
+        """
+        try:
+            value = self[cache_key]
+        except KeyError:
+            return await self.__fetch_shared(cache_key, coro_factory)
+
+        if self.max_age is None:
+            return value
+
+        cache_item = self.__cache[cache_key]
+        age = cache_item.age
+        if age >= self.max_age:
+            if not self.stale_while_revalidate:
+                return await self.__fetch_shared(cache_key, coro_factory)
+            self.__start_fetch(cache_key, coro_factory)
+        elif self.refresh_ahead_hits is not None and cache_item.total_hits >= self.refresh_ahead_hits and \
+                age >= self.max_age - self.refresh_ahead_seconds:
+            self.__start_fetch(cache_key, coro_factory)
+
+        return value
+
+    def __start_fetch(self, cache_key: Any, coro_factory: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """
+        Start fetching an item in the background, unless a fetch for it is already running.
+
+        :return: Future of the running fetch
+        """
+        future = self.__in_flight.get(cache_key)
+        if future is None:
+            future = asyncio.ensure_future(self.__fetch(cache_key, coro_factory))
+            self.__in_flight[cache_key] = future
+            future.add_done_callback(functools.partial(self.__fetch_done, cache_key))
+
+        return future
+
+    async def __fetch_shared(self, cache_key: Any, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+        # A cancelled caller must not cancel the fetch other callers are waiting for
+        return await asyncio.shield(self.__start_fetch(cache_key, coro_factory))
+
+    async def __fetch(self, cache_key: Any, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+        value = await coro_factory()
+        previous = self.__cache.get(cache_key)
+        if previous is None:
+            self[cache_key] = value
+        else:
+            # Refreshed items keep their popularity
+            if not self.allow_type_override and type(previous.value) != type(value):
+                raise TypeError(f"Different type of cache item already has key \"{cache_key}\" (expected "
+                                f"type {type(previous.value)}, got type {type(value)}")
+            self.__insert(CacheItem(cache_key, value, previous.total_hits))
+        return value
+
+    def __fetch_done(self, cache_key: Any, future: asyncio.Future):
+        if self.__in_flight.get(cache_key) is future:
+            del self.__in_flight[cache_key]
+        if not future.cancelled():
+            # Mark a possible exception retrieved even if every caller was cancelled before the fetch finished, or
+            # the fetch was a background refresh nobody is waiting for
+            future.exception()
+
+    @staticmethod
+    def __to_seconds(seconds: int, minutes: int, hours: int, days: int) -> int:
         total_seconds = seconds
 
         total_seconds += minutes * 60
         total_seconds += hours * 3600
         total_seconds += days * 3600 * 24
 
+        return total_seconds
+
+    def estimate_size(self) -> int:
+        """
+        Estimate memory usage of the cache contents in bytes, including keys, values and the CacheItem objects.
+        Goes through all items, so this should not be called in hot paths.
+
+        :return: Approximate size in bytes
+        """
+        seen = set()
+        return sum(estimate_size(cache_key, seen) + estimate_size(cache_item.value, seen) +
+                   sys.getsizeof(cache_item) for cache_key, cache_item in self.__cache.items())
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        Get the cache statistics in a JSON serializable dictionary:
+
+        {
+            "name": str,
+            "size": (int) current number of items,
+            "max_size": int or None,
+            "total_weight": (int) total weight of values in bytes, zero if max_bytes is None,
+            "max_bytes": int or None,
+            "negative_size": (int) current number of negative results,
+            "approximate_bytes": int,
+            "hits": int,
+            "misses": int,
+            "hit_ratio": float or None,
+            "sets": int,
+            "evictions": {"size": int, "weight": int, "expired": int, "unpopular": int, "delegated": int}
+        }
+
+        :return: The statistics in a dictionary
+        """
+        statistics = self.statistics
+        return {
+            "name": self.name,
+            "size": len(self.__cache),
+            "max_size": self.max_size,
+            "total_weight": self.__total_weight,
+            "max_bytes": self.max_bytes,
+            "negative_size": len(self.__negative_items),
+            "approximate_bytes": self.estimate_size(),
+            "hits": statistics.hits,
+            "misses": statistics.misses,
+            "hit_ratio": statistics.hit_ratio,
+            "sets": statistics.sets,
+            "evictions": {reason.value: count for reason, count in statistics.evictions.items()}
+        }
+
+    def snapshot(self, path: str) -> int:
+        """
+        Write the cache items into a binary snapshot file, from which they can be restored with restore(). Item hits
+        and ages are preserved. The file is first written into a temporary file and then renamed over the target,
+        so an interrupted write never leaves a partial snapshot behind. Negative results are not included.
+
+        :param path: Path to the snapshot file
+        :return: Number of items in the snapshot
+        """
+        current_time = time.monotonic()
+        records = [(cache_key, cache_item.value, cache_item.total_hits, current_time - cache_item._last_hit_time,
+                    current_time - cache_item._created_time) for cache_key, cache_item in self.__cache.items()]
+        payload = pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL)
+        header = _SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, time.time(), zlib.crc32(payload),
+                                       len(payload))
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as snapshot_file:
+            snapshot_file.write(header)
+            snapshot_file.write(payload)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(tmp_path, path)
+
+        return len(records)
+
+    def restore(self, path: str) -> int:
+        """
+        Add items from a snapshot file written by snapshot() into the cache. Existing items with same keys are
+        replaced. Item ages also include the time between writing and restoring the snapshot. Values are unpickled,
+        so only snapshots written by this program should be restored.
+
+        :param path: Path to the snapshot file
+        :return: Number of restored items
+        :raises ValueError: If the file is not a snapshot, is written in an unsupported version or is corrupted
+        """
+        with open(path, "rb") as snapshot_file:
+            header = snapshot_file.read(_SNAPSHOT_HEADER.size)
+            payload = snapshot_file.read()
+
+        if len(header) < _SNAPSHOT_HEADER.size:
+            raise ValueError(f"File {path} is not a cache snapshot.")
+        magic, version, snapshot_timestamp, checksum, payload_length = _SNAPSHOT_HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"File {path} is not a cache snapshot.")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported cache snapshot version {version} (expected {SNAPSHOT_VERSION}).")
+        if len(payload) != payload_length or zlib.crc32(payload) != checksum:
+            raise ValueError(f"Cache snapshot {path} is corrupted.")
+
+        records = pickle.loads(payload)
+        # Time passed since the snapshot can't be measured with the monotonic clock across processes
+        current_time = time.monotonic() - max(time.time() - snapshot_timestamp, 0)
+        for cache_key, value, total_hits, seconds_since_hit, age in records:
+            cache_item = CacheItem(cache_key, value, total_hits)
+            cache_item._last_hit_time = current_time - seconds_since_hit
+            cache_item._created_time = current_time - age
+            self.__insert(cache_item)
+
+        return len(records)
+
+    def set_item_lifetime(self, seconds: int = 0, minutes: int = 0, hours: int = 0, days: int = 0):
+        """
+        Set item lifetime for cached items. The total value is converted into total seconds. This value is then used to
+        decide deleted items when deleting deprecated items.
+
+        Available to set more complex lifetimes easily instead of calculating seconds manually.
+
+        :param seconds:
+        :param minutes:
+        :param hours:
+        :param days:
+        """
+        total_seconds = self.__to_seconds(seconds, minutes, hours, days)
+
         if total_seconds < 0:
             raise ValueError("Item lifetime can not be a negative value.")
 
         self.item_lifetime = total_seconds
 
+    def set_max_age(self, seconds: int = 0, minutes: int = 0, hours: int = 0, days: int = 0,
+                    stale_while_revalidate: bool = False):
+        """
+        Set max age for items fetched with get_or_fetch(). Unlike item lifetime, which is counted from the last hit
+        and decides when unused items are deleted, max age is counted from the time an item was added into cache
+        and decides when its value is considered outdated.
+
+        :param seconds:
+        :param minutes:
+        :param hours:
+        :param days:
+        :param stale_while_revalidate: If True, outdated items are returned immediately while they are refreshed in
+                                       the background. If False, callers wait for the refreshed value.
+        """
+        total_seconds = self.__to_seconds(seconds, minutes, hours, days)
+
+        if total_seconds <= 0:
+            raise ValueError("Max age must be greater than zero.")
+
+        self.max_age = total_seconds
+        self.stale_while_revalidate = stale_while_revalidate
+
+    def reset_max_age(self):
+        """
+        Reset the max age to None, which means get_or_fetch() never refreshes items that are in cache.
+        """
+        self.max_age = None
+        self.stale_while_revalidate = False
+
+    def set_refresh_ahead(self, hits_limit: int, seconds: int):
+        """
+        Refresh popular items in the background before they reach the max age. Has no effect if max age is None.
+
+        :param hits_limit: Lower limit for total hits of refreshed items
+        :param seconds: How many seconds before reaching the max age the items are refreshed
+        """
+        if hits_limit < 0:
+            raise ValueError("Hits limit must be equal or greater than zero.")
+        if seconds < 0:
+            raise ValueError("Refresh ahead time can not be a negative value.")
+
+        self.refresh_ahead_hits = hits_limit
+        self.refresh_ahead_seconds = seconds
+
+    def reset_refresh_ahead(self):
+        """
+        Disable refreshing items before they reach the max age.
+        """
+        self.refresh_ahead_hits = None
+        self.refresh_ahead_seconds = 0
+
+    def set_max_size(self, max_size: int):
+        """
+        Set the maximum number of items in the cache. If the cache currently has more items, the excess is evicted
+        immediately based on the eviction policy.
+
+        :param max_size: Maximum number of items. Must be greater than zero
+        """
+        if max_size < 1:
+            raise ValueError("Maximum cache size must be greater than zero.")
+
+        self.max_size = max_size
+        while len(self.__cache) > max_size:
+            self.__remove(self.__victim(), EEvictionReason.size)
+
+    def reset_max_size(self):
+        """
+        Reset the maximum cache size to None, which means the cache can grow without limits.
+        """
+        self.max_size = None
+
+    def set_max_bytes(self, max_bytes: int):
+        """
+        Set the maximum total weight of the cached values in bytes. Values are weighed with the weigher when they are
+        added into the cache, and items are evicted based on the eviction policy until new items fit into the limit.
+        If the limit is set for a cache that already has items, they are all weighed and the excess is evicted
+        immediately.
+
+        :param max_bytes: Maximum total weight. Must be greater than zero
+        """
+        if max_bytes < 1:
+            raise ValueError("Maximum cache weight must be greater than zero.")
+
+        if self.max_bytes is None:
+            self.__total_weight = 0
+            for cache_item in self.__cache.values():
+                cache_item._weight = self.weigher(cache_item.value)
+                self.__total_weight += cache_item._weight
+
+        self.max_bytes = max_bytes
+        while self.__total_weight > max_bytes:
+            self.__remove(self.__victim(), EEvictionReason.weight)
+
+    def reset_max_bytes(self):
+        """
+        Reset the maximum total weight to None, which means values are no longer weighed.
+        """
+        self.max_bytes = None
+        self.__total_weight = 0
+        for cache_item in self.__cache.values():
+            cache_item._weight = 0
+
+    @property
+    def total_weight(self) -> int:
+        """
+        :return: Total weight of the cached values in bytes. Always zero if the cache has no byte limit
+        """
+        return self.__total_weight
+
     def reset_item_lifetime(self):
         """
         Reset the item lifetime to None, which in practice means an infinite lifetime. Available just to encapsulate
@@ -221,29 +1008,70 @@ class Cache(MutableMapping):
         """
         del self[cache_key]
 
-    def delete_deprecated(self) -> int:
+    def delete_deprecated(self, max_items: Optional[int] = None) -> int:
         """
         Delete cache items based on the last time they were requested from cache. All items that have bigger than item
         lifetime difference between their last hit and current time, are deleted.
 
-        Does nothing if item lifetime is None.
+        Items are looked up from an index ordered by their last hits, so only the expired items and items requested
+        since they were indexed are processed instead of the whole cache.
+
+        Expired negative results are deleted too. Otherwise does nothing if item lifetime is None.
 
+        :param max_items: Maximum number of index entries processed in this call. If given, deleting a large number of
+                          items can be split into multiple calls. See has_deprecated().
         :return: Number of deleted items
         """
+        self.__delete_expired_negatives()
         if not self.item_lifetime:
             return 0
 
-        preserved_items = {}
-        current_dt = datetime.datetime.utcnow()
-        # Make a new dict of current cache contents which last hits are recent enough
-        for cache_key, cache_item in self.items():
-            if (current_dt - cache_item.last_hit).total_seconds() < self.item_lifetime:
-                preserved_items[cache_key] = cache_item
+        deleted_items = 0
+        expiry_heap = self.__expiry_heap
+        cutoff_time = time.monotonic() - self.item_lifetime
+        processed_entries = 0
+
+        while expiry_heap and expiry_heap[0][0] <= cutoff_time:
+            if max_items is not None and processed_entries >= max_items:
+                break
+            processed_entries += 1
+            entry_time, _, cache_key = heapq.heappop(expiry_heap)
+            cache_item = self.__cache.get(cache_key)
+            if cache_item is None or entry_time < cache_item._created_time:
+                # The item has been deleted or replaced after it was indexed
+                continue
+            if cache_item._last_hit_time <= cutoff_time:
+                self.__remove(cache_key, EEvictionReason.expired)
+                deleted_items += 1
+            else:
+                # The item has been requested after it was indexed, reindex it with its current last hit
+                heapq.heappush(expiry_heap, (cache_item._last_hit_time, next(self.__expiry_sequence), cache_key))
 
-        deleted_items = len(self) - len(preserved_items)
-        self.__cache = preserved_items
         return deleted_items
 
+    def has_deprecated(self) -> bool:
+        """
+        Check in constant time if the cache may have items that delete_deprecated() would delete.
+
+        :return: False if there are no deprecated items. True if there may be some
+        """
+        if not self.item_lifetime or not self.__expiry_heap:
+            return False
+        return self.__expiry_heap[0][0] <= time.monotonic() - self.item_lifetime
+
+    def __delete_expired_negatives(self):
+        """
+        Delete expired negative results. They are stored in the order they were added, so only the expired ones and
+        the first preserved one need to be checked.
+        """
+        negative_items = self.__negative_items
+        current_time = time.monotonic()
+        while negative_items:
+            cache_key, expiration_time = next(iter(negative_items.items()))
+            if expiration_time > current_time:
+                break
+            del negative_items[cache_key]
+
     def delete_unpopular(self, hits_limit: int) -> int:
         """
         Delete cache items based on their number of total hits. All items that have less than given number of total
@@ -255,14 +1083,7 @@ class Cache(MutableMapping):
         if hits_limit < 0:
             raise ValueError("Hits limit must be equal or greater than zero.")
 
-        preserved_items = {}
-        for cache_key, cache_item in self.items():
-            if cache_item.total_hits >= hits_limit:
-                preserved_items[cache_key] = cache_item
-
-        deleted_items = len(self) - len(preserved_items)
-        self.__cache = preserved_items
-        return deleted_items
+        return self.__delete_where(lambda cache_item: cache_item.total_hits < hits_limit, EEvictionReason.unpopular)
 
     def delete_delegated(self, delete_check: Callable) -> int:
         """
@@ -273,11 +1094,387 @@ class Cache(MutableMapping):
         :param delete_check: Method that returns True for CacheItem objects that should be deleted
         :return: Number of deleted items
         """
-        preserved_items = {}
-        for cache_key, cache_item in self.items():
-            if delete_check(cache_item) is False:
-                preserved_items[cache_key] = cache_item
+        return self.__delete_where(lambda cache_item: delete_check(cache_item) is not False,
+                                   EEvictionReason.delegated)
+
+    def __delete_where(self, predicate: Callable[[CacheItem], bool], reason: EEvictionReason) -> int:
+        """
+        Delete all cache items for which the predicate returns True. Items are deleted in place, so that the
+        eviction indexes stay valid.
+
+        :param predicate: Function taking a CacheItem as its only argument
+        :param reason: Eviction reason for statistics
+        :return: Number of deleted items
+        """
+        deleted_keys = [cache_key for cache_key, cache_item in self.__cache.items() if predicate(cache_item)]
+        for cache_key in deleted_keys:
+            self.__remove(cache_key, reason)
+
+        return len(deleted_keys)
+
+
+class ShardedCache(MutableMapping):
+    """
+    Thread-safe cache, which can be used from both the event loop and worker threads. Items are distributed into
+    multiple Cache shards by their key hashes, and each shard has its own lock. Locks are held only for single cache
+    operations, and operations on different shards never wait for each other, so a reader on the event loop is blocked
+    only by a writer that happens to be using the same shard at the same time.
+
+    Supports the same synchronous operations as Cache. Collection commands return lists instead of views, since the
+    shards can change while the views are used.
+    """
+
+    def __init__(self, name: Optional[str] = None, num_shards: int = 16, max_size: Optional[int] = None,
+                 eviction_policy: EEvictionPolicy = EEvictionPolicy.lru, lazy_expiry: bool = False):
+        """
+        :param name: Optional name for the cache.
+        :param num_shards: Number of shards. More shards mean less waiting between threads but less accurate eviction,
+                           since each shard evicts independently.
+        :param max_size: Maximum number of items in the cache. Split evenly between the shards, rounded up.
+        :param eviction_policy: Policy used to choose the evicted item in a full shard.
+        :param lazy_expiry: If True, requesting an item that has outlived the item lifetime deletes it and raises
+                            KeyError instead of returning it.
+        """
+        if num_shards < 1:
+            raise ValueError("Number of shards must be greater than zero.")
+
+        shard_size = None if max_size is None else -(-max_size // num_shards)
+        self.__shards: List[Cache] = [Cache(name, max_size=shard_size, eviction_policy=eviction_policy,
+                                            lazy_expiry=lazy_expiry) for _ in range(num_shards)]
+        self.__locks: List[threading.RLock] = [threading.RLock() for _ in range(num_shards)]
+        # The shards are handled through this cache, so the janitor must not see them separately
+        for shard in self.__shards:
+            registry.unregister(shard)
+
+        self.name: str = name
+        registry.register(self)
+
+    def __shard(self, cache_key: Any) -> Tuple[Cache, threading.RLock]:
+        index = hash(cache_key) % len(self.__shards)
+        return self.__shards[index], self.__locks[index]
+
+    def __contains__(self, item: Any) -> bool:
+        shard, lock = self.__shard(item)
+        with lock:
+            return item in shard
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.__shards)
+
+    def __getitem__(self, cache_key: Any) -> Any:
+        shard, lock = self.__shard(cache_key)
+        with lock:
+            return shard[cache_key]
+
+    def __setitem__(self, cache_key: Any, value: Any):
+        shard, lock = self.__shard(cache_key)
+        with lock:
+            shard[cache_key] = value
+
+    def __delitem__(self, cache_key: Any):
+        shard, lock = self.__shard(cache_key)
+        with lock:
+            del shard[cache_key]
+
+    def __iter__(self) -> Iterable[Tuple[Any, CacheItem]]:
+        yield from self.items()
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __str__(self):
+        return str(dict(self.items()))
+
+    @property
+    def item_lifetime(self) -> Optional[int]:
+        return self.__shards[0].item_lifetime
+
+    @property
+    def statistics(self) -> CacheStatistics:
+        """
+        :return: Sum of the shard statistics
+        """
+        statistics = CacheStatistics()
+        for shard in self.__shards:
+            statistics.hits += shard.statistics.hits
+            statistics.misses += shard.statistics.misses
+            statistics.sets += shard.statistics.sets
+            for reason, count in shard.statistics.evictions.items():
+                statistics.evictions[reason] += count
+        return statistics
+
+    def __for_each_shard(self, operation: Callable[[Cache], Any]) -> List[Any]:
+        """
+        Run an operation for every shard while holding the shard lock.
+
+        :return: Return values of the operation for each shard
+        """
+        results = []
+        for shard, lock in zip(self.__shards, self.__locks):
+            with lock:
+                results.append(operation(shard))
+        return results
+
+    def get(self, cache_key: Any, default: Optional[Any] = None) -> Any:
+        shard, lock = self.__shard(cache_key)
+        with lock:
+            return shard.get(cache_key, default)
+
+    def pop(self, cache_key: Any) -> Any:
+        shard, lock = self.__shard(cache_key)
+        with lock:
+            return shard.pop(cache_key)
+
+    def popitem(self) -> Tuple[Any, Any]:
+        """
+        Pop the last added item from the first shard that has items.
+        """
+        for shard, lock in zip(self.__shards, self.__locks):
+            with lock:
+                if len(shard) > 0:
+                    return shard.popitem()
+        raise KeyError("popitem(): cache is empty")
+
+    def add(self, value: Any, cache_key: Optional[Any] = None):
+        if not cache_key:
+            cache_key = str(value)
+        self[cache_key] = value
+
+    def delete(self, cache_key: Any):
+        del self[cache_key]
+
+    def items(self) -> List[Tuple[Any, CacheItem]]:
+        return [item for shard_items in self.__for_each_shard(lambda shard: list(shard.items()))
+                for item in shard_items]
+
+    def keys(self) -> List[Any]:
+        return [cache_key for cache_key, _ in self.items()]
+
+    def values(self) -> List[CacheItem]:
+        return [cache_item for _, cache_item in self.items()]
+
+    def clear(self):
+        self.__for_each_shard(lambda shard: shard.clear())
+
+    def set_item_lifetime(self, seconds: int = 0, minutes: int = 0, hours: int = 0, days: int = 0):
+        self.__for_each_shard(lambda shard: shard.set_item_lifetime(seconds, minutes, hours, days))
+
+    def reset_item_lifetime(self):
+        self.__for_each_shard(lambda shard: shard.reset_item_lifetime())
+
+    def delete_deprecated(self, max_items: Optional[int] = None) -> int:
+        """
+        Delete deprecated items from all shards. See Cache.delete_deprecated().
+
+        :param max_items: Maximum number of index entries processed in each shard
+        :return: Number of deleted items
+        """
+        return sum(self.__for_each_shard(lambda shard: shard.delete_deprecated(max_items)))
+
+    def has_deprecated(self) -> bool:
+        return any(self.__for_each_shard(lambda shard: shard.has_deprecated()))
+
+    def delete_unpopular(self, hits_limit: int) -> int:
+        return sum(self.__for_each_shard(lambda shard: shard.delete_unpopular(hits_limit)))
+
+    def delete_delegated(self, delete_check: Callable) -> int:
+        return sum(self.__for_each_shard(lambda shard: shard.delete_delegated(delete_check)))
+
+    def estimate_size(self) -> int:
+        return sum(self.__for_each_shard(lambda shard: shard.estimate_size()))
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        Get the statistics of all shards combined. See Cache.get_statistics() for the format.
+        """
+        shard_statistics = self.__for_each_shard(lambda shard: shard.get_statistics())
+        statistics = self.statistics
+        max_sizes = [shard_stats["max_size"] for shard_stats in shard_statistics]
+        return {
+            "name": self.name,
+            "size": sum(shard_stats["size"] for shard_stats in shard_statistics),
+            "max_size": None if None in max_sizes else sum(max_sizes),
+            "total_weight": 0,
+            "max_bytes": None,
+            "negative_size": sum(shard_stats["negative_size"] for shard_stats in shard_statistics),
+            "approximate_bytes": sum(shard_stats["approximate_bytes"] for shard_stats in shard_statistics),
+            "hits": statistics.hits,
+            "misses": statistics.misses,
+            "hit_ratio": statistics.hit_ratio,
+            "sets": statistics.sets,
+            "evictions": {reason.value: count for reason, count in statistics.evictions.items()}
+        }
+
+
+class CacheRegistry:
+    """
+    Registry of all existing caches. Caches register themselves on creation and are referenced weakly, so being in the
+    registry does not keep a cache alive.
+    """
+
+    def __init__(self):
+        self.__caches: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self.__sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.__caches)
+
+    def __iter__(self) -> Iterable[Union[Cache, ShardedCache]]:
+        yield from self.caches()
+
+    def register(self, cache: Union[Cache, ShardedCache]):
+        self.__caches[next(self.__sequence)] = cache
+
+    def unregister(self, cache: Union[Cache, ShardedCache]):
+        for sequence, registered in list(self.__caches.items()):
+            if registered is cache:
+                del self.__caches[sequence]
+
+    def caches(self) -> List[Union[Cache, ShardedCache]]:
+        """
+        :return: All existing caches in the order they were created
+        """
+        return [cache for _, cache in sorted(self.__caches.items(), key=lambda item: item[0])]
+
+    def get(self, name: str) -> Optional[Union[Cache, ShardedCache]]:
+        """
+        Get a cache by its name. If multiple caches have the same name, the oldest one is returned.
+
+        :param name: Name of the cache
+        :return: The cache or None if no cache has the name
+        """
+        for cache in self.caches():
+            if cache.name == name:
+                return cache
+        return None
+
+
+registry = CacheRegistry()
+
+
+def _default_cache_key(*args, **kwargs) -> Tuple:
+    if kwargs:
+        return args, tuple(sorted(kwargs.items()))
+    return args
+
+
+def cached(cache: Union[str, Cache, None] = None, key: Optional[Callable[..., Any]] = None,
+           max_size: Optional[int] = None, max_age: Optional[int] = None, item_lifetime: Optional[int] = None,
+           stale_while_revalidate: bool = False) -> Callable:
+    """
+    Decorator for caching return values of coroutine functions and methods. Values are stored with
+    Cache.get_or_fetch(), so concurrent calls with the same arguments share one call of the decorated function and
+    exceptions are never cached. The cache is available in attribute cache of the decorated function.
+
+    Usage:
+        @cached("wiki", max_age=3600)
+        async def fetch_page(self, url: str) -> str:
+            ...
+
+    :param cache: Cache or name of a cache where the values are stored. An existing cache with the name is used if
+                  there is one in the registry, otherwise a new one is created. None (default) uses the qualified
+                  name of the decorated function.
+    :param key: Function taking the same arguments as the decorated function and returning the cache key. Default is
+                a tuple of all the arguments, including self for methods. The arguments must then be hashable.
+    :param max_size: Maximum size for a newly created cache
+    :param max_age: Seconds after which values are considered outdated, see Cache.set_max_age(). Also used as the
+                    item lifetime, unless one is given. Applied to existing caches too.
+    :param item_lifetime: Seconds after which unused values are deleted, see Cache.set_item_lifetime(). Applied to
+                          existing caches too.
+    :param stale_while_revalidate: Return outdated values immediately while refreshing them in the background
+    """
+    make_key = key if key is not None else _default_cache_key
+
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        if not asyncio.iscoroutinefunction(func):
+            raise TypeError(f"Only coroutine functions can be cached, got {func.__qualname__}.")
+
+        if isinstance(cache, Cache):
+            target_cache = cache
+        else:
+            cache_name = cache if cache is not None else func.__qualname__
+            target_cache = registry.get(cache_name)
+            if target_cache is None:
+                target_cache = Cache(cache_name, max_size=max_size)
+            elif not isinstance(target_cache, Cache):
+                raise TypeError(f"Cache {cache_name} does not support caching coroutine results.")
+
+        if max_age is not None:
+            target_cache.set_max_age(seconds=max_age, stale_while_revalidate=stale_while_revalidate)
+        if item_lifetime is not None or max_age is not None:
+            target_cache.set_item_lifetime(seconds=item_lifetime if item_lifetime is not None else max_age)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await target_cache.get_or_fetch(make_key(*args, **kwargs), lambda: func(*args, **kwargs))
+
+        wrapper.cache = target_cache
+        return wrapper
+
+    return decorator
+
+
+class CacheJanitor:
+    """
+    Background task that periodically deletes deprecated items from all registered caches. Caches are swept in small
+    batches, and control is given back to the event loop between the batches, so that sweeping big caches never
+    blocks other tasks for long.
+    """
+
+    def __init__(self, interval: int = 60, batch_size: int = 1000):
+        """
+        :param interval: Seconds between sweeps over all caches
+        :param batch_size: Maximum number of expiry index entries processed in a single batch
+        """
+        self.__name = type(self).__name__
+        self.__loop_task: Union[asyncio.Task, None] = None
+        self.interval = interval
+        self.batch_size = batch_size
+
+    def __log(self, msg: str):
+        print(f"[{self.__name}] {msg}")
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """
+        Start the janitor loop.
+        :param loop: Event loop where the janitor is started as a task
+        :raises ValueError: If the janitor is already running
+        """
+        if self.__loop_task is not None:
+            raise ValueError("Cache janitor is already running.")
+
+        self.__loop_task = loop.create_task(self.__loop())
+
+    def stop(self):
+        """
+        Stop the janitor loop.
+        :raises ValueError: If the janitor is not running
+        """
+        if self.__loop_task is None:
+            raise ValueError("Cache janitor is not running.")
+
+        self.__loop_task.cancel()
+        self.__loop_task = None
+
+    async def sweep(self) -> int:
+        """
+        Delete deprecated items from all registered caches in batches.
+
+        :return: Number of deleted items
+        """
+        deleted_items = 0
+        for cache in registry.caches():
+            deleted_items += cache.delete_deprecated(max_items=self.batch_size)
+            while cache.has_deprecated():
+                await asyncio.sleep(0)
+                deleted_items += cache.delete_deprecated(max_items=self.batch_size)
+            await asyncio.sleep(0)
 
-        deleted_items = len(self) - len(preserved_items)
-        self.__cache = preserved_items
         return deleted_items
+
+    async def __loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            deleted_items = await self.sweep()
+            if deleted_items:
+                self.__log(f"Deleted {deleted_items} deprecated cache items.")
@@ -22,6 +22,7 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import asyncio
 import discord
 from discord.ext import commands
 import helper_methods
@@ -30,7 +31,8 @@ import platform
 import random
 import os
 from reminder import Reminder
-from typing import Union
+from recurrence import parse_rule
+from typing import Optional, Union
 from mathparse import mathparse
 
 
@@ -38,9 +40,23 @@ class DiscordCog(commands.Cog):
 
     def __init__(self, bot: commands.bot):
         self.bot = bot
-        self.reminder = Reminder(bot, bot.loop)
+        self.reminder: Optional[Reminder] = None
+        self.__reminder_started = bot.loop.create_task(self.__start_reminder())
+
+    async def __start_reminder(self):
+        # The reminder of a previously loaded cog must have closed its journal before it is opened again
+        if self.bot.reminder_closed is not None:
+            await asyncio.wait([self.bot.reminder_closed])
+        self.reminder = Reminder(self.bot, self.bot.loop)
         self.reminder.start()
 
+    async def __close_reminder(self):
+        await self.__reminder_started
+        await self.reminder.close()
+
+    async def cog_before_invoke(self, ctx: commands.Context):
+        await asyncio.shield(self.__reminder_started)
+
     @staticmethod
     def fetch_user_activity(activity: Union[discord.BaseActivity, discord.Spotify, discord.Activity]) -> str:
         if activity is None:
@@ -63,8 +79,17 @@ class DiscordCog(commands.Cog):
 
         return _activity
 
-    def serialize(self):
-        self.reminder.serialize()
+    async def serialize(self):
+        await asyncio.shield(self.__reminder_started)
+        future = self.reminder.serialize()
+        if future is not None:
+            await future
+
+    def cog_unload(self):
+        if self.reminder is not None:
+            # Stopped immediately, so no more reminders are sent from the unloaded cog
+            self.reminder.stop()
+        self.bot.reminder_closed = self.bot.loop.create_task(self.__close_reminder())
 
     @commands.command(name="info", aliases=["version"])
     async def get_bot_info(self, ctx: commands.Context):
@@ -172,10 +197,13 @@ class DiscordCog(commands.Cog):
 
         raw_reminder_timer = msg[:beg_quote_i].rstrip()
         raw_reminder_message = msg[beg_quote_i+1:end_quote_i]
+        if raw_reminder_timer.startswith("every "):
+            await self.add_recurring_reminder(ctx, raw_reminder_timer[len("every "):], raw_reminder_message)
+            return
         try:
             reminder_timer = helper_methods.string_to_timedelta(raw_reminder_timer)
-        except ValueError:
-            await ctx.send("Reminder timer was not in supported format.")
+        except ValueError as e:
+            await ctx.send(f"Reminder timer was not in supported format: {e}")
             return
         reminder_message = helper_methods.parse_message(raw_reminder_message)
         if len(reminder_message) == 0:
@@ -194,9 +222,80 @@ class DiscordCog(commands.Cog):
             return
 
         future_ts = (datetime.datetime.utcnow() + reminder_timer).timestamp()
-        self.reminder.add(int(future_ts), ctx.author.id, ctx.channel.id, reminder_message)
+        reminder_id = self.reminder.add(int(future_ts), ctx.author.id, ctx.channel.id, reminder_message)
         formatted_ts = datetime.datetime.fromtimestamp(future_ts).replace(microsecond=0)
-        await ctx.send(f"Reminder set to {formatted_ts} UTC.")
+        await ctx.send(f"Reminder set to {formatted_ts} UTC. Reminder id: {reminder_id}")
+
+    async def add_recurring_reminder(self, ctx: commands.Context, raw_rule: str, raw_reminder_message: str):
+        interval_minimum_value = 600
+
+        try:
+            rule = parse_rule(raw_rule)
+        except ValueError as e:
+            await ctx.send(f"Reminder recurrence was not in supported format: {e}")
+            return
+        reminder_message = helper_methods.parse_message(raw_reminder_message)
+        if len(reminder_message) == 0:
+            await ctx.send("The reminder message can not be empty.")
+            return
+
+        ts_now = datetime.datetime.utcnow().timestamp()
+        try:
+            future_ts = rule.next_occurrence(int(ts_now), ts_now)
+        except OverflowError:
+            await ctx.send("Too long reminder interval.")
+            return
+        if rule.min_interval() < interval_minimum_value:
+            await ctx.send(f"The reminder interval must be at least {interval_minimum_value} seconds.")
+            return
+
+        reminder_id = self.reminder.add(future_ts, ctx.author.id, ctx.channel.id, reminder_message, repeat=rule.spec)
+        formatted_ts = datetime.datetime.fromtimestamp(future_ts)
+        await ctx.send(f"Recurring reminder set. Next one at {formatted_ts} UTC. Reminder id: {reminder_id}")
+
+    @commands.command(name="reminders")
+    async def list_reminders(self, ctx: commands.Context, page: int = 1):
+        page_size = 10
+        max_preview_length = 50
+
+        if page < 1:
+            await ctx.send("The page number must be at least 1.")
+            return
+
+        reminders, total = await self.reminder.list_reminders(ctx.author.id, offset=(page - 1) * page_size,
+                                                              limit=page_size)
+        if total == 0:
+            await ctx.send("You have no reminders.")
+            return
+        num_pages = (total + page_size - 1) // page_size
+        if page > num_pages:
+            await ctx.send(f"You have only {num_pages} pages of reminders.")
+            return
+
+        lines = []
+        for timestamp, reminder in reminders:
+            formatted_ts = datetime.datetime.fromtimestamp(timestamp)
+            message = reminder["message"].replace("\n", " ")
+            if len(message) > max_preview_length:
+                message = f"{message[:max_preview_length]}..."
+            repeat = f" (every {reminder['repeat']})" if "repeat" in reminder else ""
+            lines.append(f"`{reminder['id']}` {formatted_ts} UTC{repeat} in <#{reminder['channel']}>: {message}")
+
+        embed = discord.Embed(title=f"Reminders of {ctx.author.display_name}", description="\n".join(lines))
+        embed.set_footer(text=f"Page {page}/{num_pages}")
+        await ctx.send(embed=embed)
+
+    @commands.command(name="delreminder", aliases=["cancelreminder"])
+    async def delete_reminder(self, ctx: commands.Context, reminder_id: int):
+        if await self.reminder.delete(reminder_id, author_id=ctx.author.id):
+            await ctx.send(f"Reminder {reminder_id} deleted.")
+        else:
+            await ctx.send(f"You have no reminder with id {reminder_id}.")
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        await asyncio.shield(self.__reminder_started)
+        await self.reminder.delete_channel(channel.id)
 
     @commands.command(name="roll", aliases=["dice", "die"])
     async def roll_die(self, ctx: commands.Context, dice_options: Union[str, int] = 6):
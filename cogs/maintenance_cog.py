@@ -22,6 +22,11 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import io
+import inspect
+import json
+import discord
+import caching
 from discord.ext import commands
 
 
@@ -81,6 +86,7 @@ class MaintenanceCog(commands.Cog):
     async def serialize_cog(self, ctx: commands.Context, cog_name: str):
         """
         Serialize cog contents into a file. The cog must have a public serialize() method without positional arguments.
+        If the method is a coroutine, it is awaited, so the contents are written when this returns.
         :param ctx: Discord context
         :param cog_name: Cog class name. This is used to get it from loaded cogs.
         """
@@ -90,7 +96,9 @@ class MaintenanceCog(commands.Cog):
             return
 
         try:
-            cog.serialize()
+            result = cog.serialize()
+            if inspect.isawaitable(result):
+                await result
         except AttributeError:
             await ctx.send(f"Cog `{cog_name}` does not have method `serialize()` or it requires positional arguments.")
             return
@@ -115,6 +123,37 @@ class MaintenanceCog(commands.Cog):
         loaded_cogs = [f"`{name}`" for name in self.bot.cogs]
         await ctx.send("Currently loaded cogs:\n" + "\n".join(loaded_cogs))
 
+    @commands.command(name="cachestats")
+    async def get_cache_statistics(self, ctx: commands.Context, output_format: str = "text"):
+        """
+        Get statistics of all caches. Format json gives them in machine-readable format as a file.
+        :param ctx: Discord context
+        :param output_format: Either text (default) or json
+        """
+        statistics = [cache.get_statistics() for cache in caching.registry]
+
+        if output_format == "json":
+            dump = json.dumps(statistics, indent=4).encode("utf-8")
+            await ctx.send(file=discord.File(io.BytesIO(dump), filename="cachestats.json"))
+            return
+        elif output_format != "text":
+            await ctx.send(f"Invalid output format: `{output_format}`. Supported formats are `text` and `json`.")
+            return
+
+        lines = []
+        for cache_statistics in statistics:
+            hit_ratio = cache_statistics["hit_ratio"]
+            hit_ratio = "-" if hit_ratio is None else f"{hit_ratio:.1%}"
+            evictions = ", ".join(f"{reason} {count}" for reason, count in cache_statistics["evictions"].items())
+            lines.append(f"{cache_statistics['name']}: {cache_statistics['size']}/{cache_statistics['max_size']} items "
+                         f"(~{cache_statistics['approximate_bytes'] / 1024:.0f} KiB), "
+                         f"{cache_statistics['negative_size']} negative\n"
+                         f"    hits {cache_statistics['hits']}, misses {cache_statistics['misses']}, "
+                         f"hit ratio {hit_ratio}, sets {cache_statistics['sets']}\n"
+                         f"    evictions: {evictions}")
+
+        await ctx.send("```\n" + "\n".join(lines) + "\n```")
+
     @commands.command(name="id")
     async def get_item_id(self, ctx: commands.Context, *, item_name: str):
         raise NotImplementedError
@@ -133,8 +172,28 @@ class MaintenanceCog(commands.Cog):
         raise NotImplementedError
 
     @commands.command("clear")
-    async def clear_cache(self, ctx: commands.Context, cache_name: str):
-        raise NotImplementedError
+    async def clear_cache(self, ctx: commands.Context, *, cache_name: str):
+        """
+        Clear a cache from all items.
+        :param ctx: Discord context
+        :param cache_name: Name of the cache. Cache names are case sensitive.
+        """
+        cache = caching.registry.get(cache_name)
+        if cache is None:
+            cache_names = ", ".join(f"`{cache.name}`" for cache in caching.registry if cache.name is not None)
+            await ctx.send(f"No cache with name `{cache_name}`. Available caches are {cache_names}.")
+            return
+
+        if any(getattr(cog, "reminder", None) is not None and cog.reminder.cache is cache
+               for cog in self.bot.cogs.values()):
+            # Clearing would leave the reminder indexes and schedule pointing to reminders that no longer exist
+            await ctx.send(f"Cache `{cache_name}` holds the reminders and can not be cleared.")
+            return
+
+        num_items = len(cache)
+        cache.clear()
+        self.__log(f"Cache {cache_name} cleared.")
+        await ctx.send(f"Cleared {num_items} items from cache `{cache_name}`.")
 
     @commands.command("devcommands")
     async def get_maintenance_commands(self, ctx: commands.Context):
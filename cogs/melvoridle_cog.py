@@ -44,30 +44,47 @@ class MelvoridleCog(commands.Cog):
         direct_page = helper_methods.titlecase(search).replace(" ", "_")
         search_parameter = direct_page.replace("_", "+")
 
-        try:
-            # At first, try to find an existing page by building a direct wiki page url
-            direct_link = f"{direct_url}{direct_page}"
-            await self.bot.fetch_url(f"{direct_url}{direct_page}")
-            await ctx.send(f"<{direct_link}>")
-            return
-        except asyncio.TimeoutError:
-            await ctx.send("Melvoridle wiki answered too slowly. Try again later.")
-            return
-        except aiohttp.ClientError:
-            # No page was found with direct url, try using search page
-            search_page = f"{full_search_url}{search_parameter}"
+        direct_link = f"{direct_url}{direct_page}"
+        search_page = f"{full_search_url}{search_parameter}"
+
+        # At first, try to find an existing page by building a direct wiki page url. Titles known to not exist are
+        # skipped straight to the search page
+        if not self.cache.is_negative(direct_link):
             try:
-                response = await self.bot.fetch_url(search_page)
+                await self.cache.get_or_fetch(direct_link, lambda: self.bot.fetch_url(direct_link))
+                await ctx.send(f"<{direct_link}>")
+                return
             except asyncio.TimeoutError:
                 await ctx.send("Melvoridle wiki answered too slowly. Try again later.")
                 return
+            except aiohttp.ClientResponseError as e:
+                if e.status == 404:
+                    self.cache.add_negative(direct_link)
             except aiohttp.ClientError:
-                await ctx.send("Could not find anything.")
-                return
+                pass
+
+        # No page was found with direct url, try using search page
+        if self.cache.is_negative(search_page):
+            await ctx.send("Could not find anything.")
+            return
+
+        try:
+            response = await self.cache.get_or_fetch(search_page, lambda: self.bot.fetch_url(search_page))
+        except asyncio.TimeoutError:
+            await ctx.send("Melvoridle wiki answered too slowly. Try again later.")
+            return
+        except aiohttp.ClientError:
+            await ctx.send("Could not find anything.")
+            return
+
+        candidates = helper_methods.parse_wiki_search_candidates(response, base_url)
+        if not candidates:
+            self.cache.add_negative(search_page)
+            await ctx.send("Could not find anything.")
+            return
 
-            candidates = helper_methods.parse_wiki_search_candidates(response, base_url)
-            embed = discord.Embed(title="Did you mean", description="\n".join(candidates[:5]))
-            await ctx.send(embed=embed)
+        embed = discord.Embed(title="Did you mean", description="\n".join(candidates[:5]))
+        await ctx.send(embed=embed)
 
 
 def setup(bot: OsrsHelper):
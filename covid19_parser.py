@@ -30,6 +30,7 @@ import sys
 import datetime
 import dateutil
 import threading
+from caching import cached
 from typing import Tuple, Union
 
 
@@ -94,10 +95,13 @@ class CovidParser:
                              "ongoing request or other similar issues.")
         return self.__corona_data, self.__hospitalised_data, self.__vaccination_data
 
+    # Keyed by the data update, so a summary never lags behind the update time, and parsers are not kept alive
+    @cached("Covid summaries", key=lambda parser: parser.last_update_dt, max_age=60)
     async def get_summarized_data(self) -> dict:
         """
         Get summarized corona data, hospitalized data, vaccination data and daily cases in whole Finland area
-        based on the latest data synchronization. The returned data is in format:
+        based on the latest data synchronization. Summaries of each synchronization are cached for a minute. The
+        returned data is in format:
 
         {
             "corona_data": {
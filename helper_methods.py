@@ -23,7 +23,9 @@ SOFTWARE.
 """
 
 import pytz
+import re
 import datetime
+import functools
 import dateutil.parser
 from caching import Cache
 from typing import Union
@@ -116,54 +118,59 @@ def parse_message(string: str):
     return string.replace("\\\\n", "n").replace("\\n", "\n")
 
 
+# Time units of durations and the relativedelta arguments they map to. Lowercase m is months and uppercase M minutes.
+DURATION_UNITS = {
+    **dict.fromkeys(["y", "yr", "yrs", "year", "years"], "years"),
+    **dict.fromkeys(["m", "mon", "month", "months"], "months"),
+    **dict.fromkeys(["w", "wk", "week", "weeks"], "weeks"),
+    **dict.fromkeys(["d", "day", "days"], "days"),
+    **dict.fromkeys(["h", "H", "hr", "hrs", "hour", "hours"], "hours"),
+    **dict.fromkeys(["M", "min", "mins", "minute", "minutes"], "minutes"),
+    **dict.fromkeys(["s", "S", "sec", "secs", "second", "seconds"], "seconds"),
+}
+DURATION_TOKEN_PATTERN = re.compile(r"\s*(\d+)\s*([A-Za-z]+)\s*")
+ISO_DURATION_PATTERN = re.compile(r"P(?:(?P<years>\d+)Y)?(?:(?P<months>\d+)M)?(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?"
+                                  r"(?:T(?=\d)(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?",
+                                  re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=256)
 def string_to_timedelta(time_string: str) -> relativedelta:
     """
-    Convert string from format '[years][months][days][hours][minutes][seconds]' to relativedelta object. Any time unit
-    can be left out if not needed.
+    Convert string from format '[years][months][weeks][days][hours][minutes][seconds]' to relativedelta object, e.g.
+    '1d 12h' or '2 weeks 30min'. Any time unit can be left out if not needed, but each one can be given only once.
+    ISO 8601 durations such as 'P1DT12H' are supported as well. Results are memoized, so they must not be modified.
     :param time_string: Relative time in string format
     :return: datetutil.relativedelta.relativedelta object
+    :raises ValueError: If the string is not a valid duration
     """
-
-    replace_dict = {"years": "yrs",
-                    "yrs": "y",
-                    "months": "mon",
-                    "mon": "m",
-                    "days": "d",
-                    "hours": "H",
-                    "h": "H",
-                    "minutes": "min",
-                    "min": "M",
-                    "seconds": "sec",
-                    "sec": "S",
-                    "s": "S",
-                    " ": ""}
-
-    for old in replace_dict.keys():
-        new = replace_dict[old]
-        time_string = time_string.replace(old, new)
-
-    time_units = {"y": 0, "m": 0, "d": 0, "H": 0, "M": 0, "S": 0}
-
-    # Extract all different time units from string
-    for char in time_string:
-        if char not in list(time_units):
-            if not char.isdigit():
-                raise ValueError("Invalid character in timedelta string.")
-            continue
-
-        char_idx = time_string.find(char)
-        time_units[char] = int(time_string[:char_idx])
-
-        target_substring = time_string[:char_idx + 1]
-        time_string = time_string.replace(target_substring, "")
-
-    timedelta = relativedelta(years=time_units["y"],
-                              months=time_units["m"],
-                              days=time_units["d"],
-                              hours=time_units["H"],
-                              minutes=time_units["M"],
-                              seconds=time_units["S"])
-    return timedelta
+    time_string = time_string.strip()
+    if not time_string:
+        raise ValueError("Empty timedelta string.")
+
+    iso_match = ISO_DURATION_PATTERN.fullmatch(time_string)
+    if iso_match is not None:
+        if iso_match.lastindex is None:
+            raise ValueError(f"ISO 8601 duration '{time_string}' has no time units.")
+        return relativedelta(**{unit: int(value) for unit, value in iso_match.groupdict().items() if value})
+
+    time_units = {}
+    position = 0
+    while position < len(time_string):
+        token = DURATION_TOKEN_PATTERN.match(time_string, position)
+        if token is None:
+            raise ValueError(f"Invalid timedelta string '{time_string}' at position {position}.")
+        value, unit_name = token.groups()
+        try:
+            unit = DURATION_UNITS[unit_name]
+        except KeyError:
+            raise ValueError(f"Unknown time unit '{unit_name}' in timedelta string.") from None
+        if unit in time_units:
+            raise ValueError(f"Time unit '{unit}' is given more than once in timedelta string.")
+        time_units[unit] = int(value)
+        position = token.end()
+
+    return relativedelta(**time_units)
 
 
 if __name__ == '__main__':
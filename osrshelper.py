@@ -22,10 +22,16 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import asyncio
+import os
+import pickle
 import aiohttp
 import discord
 from discord.ext import commands
-from caching import Cache
+from caching import CacheJanitor
+from tiered_caching import TieredCache
+from cache_backends import CacheBackend, SqliteBackend, RedisBackend
+from typing import List, Optional
 
 
 class OsrsHelper(commands.Bot):
@@ -44,10 +50,91 @@ class OsrsHelper(commands.Bot):
                          **options)
         self.remove_command("help")
         self.on_ready_called = False
+        # Closing of the reminder of an unloaded DiscordCog. A reloaded cog waits for it before opening the same files.
+        self.reminder_closed: Optional[asyncio.Task] = None
 
         self.aiohttp_session = aiohttp.ClientSession(loop=self.loop)
-        self.mwiki_cache = Cache("mwiki")
-        self.wiki_cache = Cache("wiki")
+
+        self.cache_snapshot_dir = "Data files/cache"
+        os.makedirs(self.cache_snapshot_dir, exist_ok=True)
+        # Wiki pages that do not fit in memory are kept on disk for a week. Bot processes running on the same host
+        # can share them through a Redis server instead.
+        self.redis_url = os.environ.get("OSRSHELPER_REDIS_URL")
+        self.redis_secret = os.environ.get("OSRSHELPER_REDIS_SECRET")
+        if self.redis_url and not self.redis_secret:
+            self.__log("OSRSHELPER_REDIS_SECRET is not set, so the caches are not shared through Redis.")
+            self.redis_url = None
+        self.mwiki_cache = TieredCache("mwiki", self.create_cache_backend("mwiki"), loop=self.loop, max_size=1000,
+                                       max_bytes=32 * 1024 ** 2)
+        self.wiki_cache = TieredCache("wiki", self.create_cache_backend("wiki"), loop=self.loop, max_size=1000,
+                                      max_bytes=32 * 1024 ** 2)
+        for cache in (self.mwiki_cache, self.wiki_cache):
+            cache.set_max_age(hours=12, stale_while_revalidate=True)
+            cache.set_refresh_ahead(hits_limit=10, seconds=600)
+            cache.set_negative_lifetime(minutes=10)
+
+        self.restore_caches()
+        self.cache_janitor = CacheJanitor()
+        self.cache_janitor.start(self.loop)
+
+    def __log(self, msg: str):
+        print(f"[{type(self).__name__}] {msg}")
+
+    def create_cache_backend(self, cache_name: str, item_lifetime: int = 7 * 24 * 3600) -> CacheBackend:
+        """
+        Create the second level storage for a wiki cache. A Redis backend is used if environment variables
+        OSRSHELPER_REDIS_URL and OSRSHELPER_REDIS_SECRET are set, otherwise a local sqlite file.
+
+        :param cache_name: Name of the cache, used as the file name or the key namespace
+        :param item_lifetime: Seconds after which the stored items expire
+        :return: The cache backend
+        """
+        if self.redis_url:
+            return RedisBackend(self.redis_url, namespace=f"osrshelper:{cache_name}", item_lifetime=item_lifetime,
+                                secret=self.redis_secret)
+        return SqliteBackend(f"{self.cache_snapshot_dir}/{cache_name}.sqlite3", item_lifetime=item_lifetime)
+
+    @property
+    def caches(self) -> List[TieredCache]:
+        """
+        :return: All caches owned by the bot
+        """
+        return [self.mwiki_cache, self.wiki_cache]
+
+    def restore_caches(self):
+        """
+        Restore the wiki caches from their snapshot files, if there are any.
+        """
+        for cache in self.caches:
+            path = f"{self.cache_snapshot_dir}/{cache.name}.cache"
+            try:
+                num_restored = cache.restore(path)
+            except FileNotFoundError:
+                continue
+            except (ValueError, EOFError, pickle.UnpicklingError) as e:
+                self.__log(f"Could not restore cache {cache.name}: {e}")
+                continue
+            self.__log(f"Restored {num_restored} items into cache {cache.name}.")
+
+    def snapshot_caches(self):
+        """
+        Write the wiki caches into snapshot files, so they can be restored on the next startup.
+        """
+        for cache in self.caches:
+            path = f"{self.cache_snapshot_dir}/{cache.name}.cache"
+            try:
+                num_items = cache.snapshot(path)
+            except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+                self.__log(f"Could not snapshot cache {cache.name}: {e}")
+                continue
+            self.__log(f"Wrote {num_items} items from cache {cache.name} into a snapshot.")
+
+    async def close(self):
+        self.cache_janitor.stop()
+        self.snapshot_caches()
+        for cache in self.caches:
+            await cache.close()
+        await super().close()
 
     async def fetch_url(self, url: str) -> str:
         if url is None:
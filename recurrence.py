@@ -0,0 +1,194 @@
+"""
+MIT License
+
+Copyright (c) 2020 Visperi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import datetime
+import functools
+from typing import FrozenSet, List
+from dateutil.relativedelta import relativedelta
+from helper_methods import string_to_timedelta
+
+
+class RecurrenceRule:
+    """
+    Rule for a recurring reminder. Only the rule is stored, and the next occurrence is computed from it when the
+    previous one has been triggered.
+
+    The spec is either an interval in the format of helper_methods.string_to_timedelta, e.g. '1d' or '2 hours', or a
+    cron-like spec of five fields 'minute hour day month weekday', e.g. '0 9 * * 1' for every Monday at 09:00 UTC.
+    Cron fields support '*', numbers, lists 'a,b', ranges 'a-b' and steps '*/n' or 'a-b/n'. Weekday 0 and 7 are
+    Sunday. If both day and weekday are restricted, a day matching either of them is enough, like in cron.
+    """
+
+    # Minimum, maximum of the cron fields minute, hour, day, month and weekday
+    CRON_FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+    # Cron specs that match no day within this many days are rejected. Covers the gaps between leap days.
+    MAX_SEARCH_DAYS = 366 * 8
+
+    def __init__(self, spec: str):
+        """
+        :param spec: Interval or cron-like spec
+        :raises ValueError: If the spec is invalid, or a cron spec never matches
+        """
+        self.spec = " ".join(spec.split())
+        fields = self.spec.split(" ")
+        self.is_cron = len(fields) == 5 and all(field[0] in "*0123456789" for field in fields)
+
+        if self.is_cron:
+            parsed = [self.__parse_cron_field(field, low, high)
+                      for field, (low, high) in zip(fields, self.CRON_FIELD_RANGES)]
+            self.__minutes: List[int] = sorted(parsed[0])
+            self.__hours: List[int] = sorted(parsed[1])
+            self.__days: FrozenSet[int] = parsed[2]
+            self.__months: FrozenSet[int] = parsed[3]
+            self.__weekdays: FrozenSet[int] = frozenset(weekday % 7 for weekday in parsed[4])
+            self.__days_restricted = not fields[2].startswith("*")
+            self.__weekdays_restricted = not fields[4].startswith("*")
+            # Raises ValueError for specs like '0 0 31 2 *'
+            self.next_occurrence(0, 0)
+        else:
+            self.__interval: relativedelta = string_to_timedelta(self.spec)
+            self.__fixed_seconds = None
+            if self.__interval.years == 0 and self.__interval.months == 0:
+                self.__fixed_seconds = (self.__interval.days * 86400 + self.__interval.hours * 3600 +
+                                        self.__interval.minutes * 60 + self.__interval.seconds)
+                if self.__fixed_seconds <= 0:
+                    raise ValueError("Recurrence interval must be positive.")
+            elif self.__interval.years < 0 or self.__interval.months < 0:
+                raise ValueError("Recurrence interval must be positive.")
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.spec!r})"
+
+    @staticmethod
+    def __parse_cron_field(field: str, low: int, high: int) -> FrozenSet[int]:
+        values = set()
+        try:
+            for part in field.split(","):
+                range_part, _, step_part = part.partition("/")
+                step = int(step_part) if step_part else 1
+                if range_part == "*":
+                    start, end = low, high
+                elif "-" in range_part:
+                    start, end = (int(value) for value in range_part.split("-", 1))
+                else:
+                    start = int(range_part)
+                    # 'a/n' means every n starting from a
+                    end = high if step_part else start
+                if step < 1 or not low <= start <= end <= high:
+                    raise ValueError
+                values.update(range(start, end + 1, step))
+        except ValueError:
+            raise ValueError(f"Invalid cron field '{field}'. Values must be between {low} and {high}.") from None
+        return frozenset(values)
+
+    def __day_matches(self, day: datetime.date) -> bool:
+        if day.month not in self.__months:
+            return False
+        day_matches = day.day in self.__days
+        # Python weeks start from Monday = 0, cron weeks from Sunday = 0
+        weekday_matches = (day.weekday() + 1) % 7 in self.__weekdays
+        if self.__days_restricted and self.__weekdays_restricted:
+            return day_matches or weekday_matches
+        return day_matches and weekday_matches
+
+    def __next_cron_occurrence(self, after: int) -> int:
+        start = datetime.datetime.fromtimestamp(after).replace(second=0) + datetime.timedelta(minutes=1)
+        day = start.date()
+        for _ in range(self.MAX_SEARCH_DAYS):
+            if self.__day_matches(day):
+                is_start_day = day == start.date()
+                for hour in self.__hours:
+                    if is_start_day and hour < start.hour:
+                        continue
+                    for minute in self.__minutes:
+                        if is_start_day and hour == start.hour and minute < start.minute:
+                            continue
+                        return int(datetime.datetime.combine(day, datetime.time(hour, minute)).timestamp())
+            day += datetime.timedelta(days=1)
+        raise ValueError(f"Cron spec '{self.spec}' does not match any date.")
+
+    def next_occurrence(self, previous: int, current_time: float) -> int:
+        """
+        Compute the next occurrence. Occurrences missed while the bot was offline are skipped.
+
+        :param previous: Timestamp of the previous occurrence, or the time the rule was created at
+        :param current_time: Current timestamp. The next occurrence is always after it.
+        :return: Timestamp of the first occurrence after both previous and current_time
+        """
+        if self.is_cron:
+            return self.__next_cron_occurrence(int(max(previous, current_time)))
+
+        if self.__fixed_seconds is not None:
+            num_intervals = max(int((current_time - previous) // self.__fixed_seconds) + 1, 1)
+            return int(previous + num_intervals * self.__fixed_seconds)
+
+        # Calendar intervals are always added to the previous occurrence, so e.g. monthly reminders on the 31st do
+        # not drift to the 28th after February
+        previous_dt = datetime.datetime.fromtimestamp(previous)
+        num_intervals = 1
+        while True:
+            next_ts = int((previous_dt + self.__interval * num_intervals).timestamp())
+            if next_ts > current_time:
+                return next_ts
+            num_intervals += 1
+
+
+    def min_interval(self) -> int:
+        """
+        Compute the shortest time between two consecutive occurrences. For cron specs this includes the gaps between
+        the last occurrence of a day and the first one of the next matching day. Calendar intervals are counted with
+        their shortest length, e.g. 28 days for a month.
+
+        :return: Shortest interval in seconds
+        """
+        if not self.is_cron:
+            if self.__fixed_seconds is not None:
+                return self.__fixed_seconds
+            interval = self.__interval
+            return ((interval.years * 365 + interval.months * 28 + interval.days) * 86400 + interval.hours * 3600 +
+                    interval.minutes * 60 + interval.seconds)
+
+        times = [hour * 3600 + minute * 60 for hour in self.__hours for minute in self.__minutes]
+        intervals = [later - earlier for earlier, later in zip(times, times[1:])]
+        # The gaps between matching days depend on the months and weekdays, so they are searched from the calendar
+        day = datetime.date.today()
+        previous_match = None
+        for _ in range(self.MAX_SEARCH_DAYS):
+            if self.__day_matches(day):
+                if previous_match is not None:
+                    intervals.append((day - previous_match).days * 86400 - times[-1] + times[0])
+                previous_match = day
+            day += datetime.timedelta(days=1)
+        return min(intervals, default=self.MAX_SEARCH_DAYS * 86400)
+
+@functools.lru_cache(maxsize=1024)
+def parse_rule(spec: str) -> RecurrenceRule:
+    """
+    Parse a recurrence rule. Rules are memoized, so the rules of recurring reminders are parsed only once.
+
+    :param spec: Interval or cron-like spec. See RecurrenceRule.
+    :return: The parsed rule
+    :raises ValueError: If the spec is invalid
+    """
+    return RecurrenceRule(spec)
@@ -24,85 +24,319 @@ SOFTWARE.
 
 import datetime
 import asyncio
+import heapq
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import caching
+import discord
 from discord.ext import commands
-from typing import Union
+from scheduling import HeapScheduler, TimingWheel
+from reminder_storage import ReminderJournal, SqliteReminderStore
+from recurrence import parse_rule
+from typing import Union, Optional, Dict, List, Set, Tuple
+
+
+class _ChannelLock:
+    """
+    Lock keeping the sends of one channel in the order they were dispatched, and the number of sends holding or
+    waiting for it.
+    """
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
 
 
 class Reminder:
 
+    # Key of the last journal sequence number included in the serialized reminders
+    JOURNAL_SEQUENCE_KEY = "journal_sequence"
+    # Key of the id given to the next new reminder in the serialized reminders
+    NEXT_ID_KEY = "next_reminder_id"
+    # Maximum length of a Discord message
+    MESSAGE_MAX_LENGTH = 2000
+
     def __init__(self, bot: commands.Bot, loop: asyncio.BaseEventLoop,
-                 cache: caching.Cache = caching.Cache(name="Reminder cache"),
+                 cache: Optional[caching.Cache] = None,
                  serialize_path: str = "Data files/reminders.json",
-                 backup_threshold: int = 1800):
+                 backup_threshold: int = 1800,
+                 scheduler: Optional[Union[HeapScheduler, TimingWheel]] = None,
+                 journal_path: Optional[str] = "Data files/reminders.journal",
+                 compaction_threshold: int = 10000,
+                 store: Optional[SqliteReminderStore] = None,
+                 store_window: int = 3600,
+                 max_concurrent_sends: int = 5,
+                 max_send_attempts: int = 5):
         """
         :param bot: Bot owning this reminder. This is used in actually sending the reminders to Discord
         :param loop: Event loop where the reminder is initialized to as a task
-        :param cache: Cache where the reminders are deserialized and stored to
+        :param cache: Cache where the reminders are deserialized and stored to. None (default) creates a new cache
         :param serialize_path: Path to a file where reminders can be serialized to
-        :param backup_threshold: Number of rounds after which the reminders are serialized into file in serialize_path
+        :param backup_threshold: Seconds after which the reminders are serialized into file in serialize_path
+        :param scheduler: Scheduler keeping track of the reminder timestamps. None (default) creates a HeapScheduler.
+                          A TimingWheel scales better for very large numbers of reminders. It must be started from
+                          the reminder clock, i.e. TimingWheel(datetime.datetime.utcnow().timestamp()).
+        :param journal_path: Path to a journal file where every change is written immediately. Changes since the last
+                             serialization are recovered from it. None disables the journal.
+        :param compaction_threshold: Number of journaled changes after which the reminders are serialized before
+                                     backup_threshold, so the journal is compacted
+        :param store: Storage engine keeping all reminders in a database. If given, only the reminders due within
+                      store_window seconds are kept in memory, and the json file and the journal are not used.
+        :param store_window: Seconds of reminders loaded from the store into memory at once
+        :param max_concurrent_sends: Maximum number of requests sending reminders or fetching channels at the same time
+        :param max_send_attempts: Number of times sending a message or fetching a channel is attempted before the
+                                  reminders are dropped
         """
         self.__name = type(self).__name__
         self.__loop_task: Union[asyncio.tasks.Task, None] = None
+        self.__scheduler = scheduler if scheduler is not None else HeapScheduler()
+        # Set when the loop must recheck the next due time before its sleep ends
+        self.__wakeup: Optional[asyncio.Event] = None
         self.bot = bot
-        self.cache = cache
+        self.cache = cache if cache is not None else caching.Cache(name="Reminder cache")
         self.serialize_path = serialize_path
         self.loop = loop
         self.backup_threshold = backup_threshold
+        self.store = store
+        self.store_window = store_window
+        # Reminders due before this timestamp have been loaded from the store. None until the first load.
+        self.__loaded_until: Optional[int] = None
+        self.journal = ReminderJournal(journal_path, loop) if journal_path is not None and store is None else None
+        self.compaction_threshold = compaction_threshold
+        self.max_concurrent_sends = max_concurrent_sends
+        self.max_send_attempts = max_send_attempts
+        self.__dispatch_tasks: Set[asyncio.Task] = set()
+        # Created on the loop by the first dispatch, and shared by all dispatches
+        self.__send_semaphore: Optional[asyncio.Semaphore] = None
+        # Locks of the channels having sends, so a later batch can't overtake an earlier one in the same channel
+        self.__channel_locks: Dict[int, _ChannelLock] = {}
+        # Serializations are written one at a time, so an older snapshot can never replace a newer one
+        self.__serialize_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.__name)
+        self.__pending_serializations: Set[asyncio.Future] = set()
+        # Task of the latest backup serialization, which also compacts the journal
+        self.__backup_task: Optional[asyncio.Task] = None
+        # Counters of changes to the reminders, and the changes included in the last serialization
+        self.__changes = 0
+        self.__serialized_changes = 0
+        # Secondary indexes of the reminders in memory. Ids map to their timestamp and data, and authors and channels
+        # to the ids of their reminders, so a reminder is found without scanning the cache.
+        self.__reminders_by_id: Dict[int, Tuple[int, dict]] = {}
+        self.__ids_by_author: Dict[str, Set[int]] = {}
+        self.__ids_by_channel: Dict[str, Set[int]] = {}
+        self.__next_id = store.last_id + 1 if store is not None else 1
 
     def __log(self, msg: str):
         print(f"[{self.__name}] {msg}")
 
     @staticmethod
-    def __cache_delete_check(cache_item: caching.CacheItem):
+    def __current_timestamp() -> float:
         """
-        Check method for using Cache.delete_delegated method. Marks reminder to be deleted if its timestamp is in
-        the past.
-        :param cache_item: CacheItem object which timestamp is compared to current UTC timestamp
-        :return: True if the reminder timestamp is in the past
+        :return: Current time in the same format as the reminder timestamps
         """
-        return cache_item.key <= int(datetime.datetime.utcnow().timestamp())
+        return datetime.datetime.utcnow().timestamp()
 
-    def serialize(self, filepath: str = None) -> None:
+    def serialize(self, filepath: str = None) -> Optional[asyncio.Future]:
         """
         Serialize reminders in cache to json file. Creates a new file if one does not exist beforehand.
+
+        Only a copy of the reminders is taken on the event loop. Encoding and writing are done in a worker thread,
+        and the file is replaced atomically, so a crash in the middle of writing does not corrupt the previous file.
+        Serializing into self.serialize_path is skipped if nothing has changed since the last serialization, and
+        compacts the journal afterwards. Does nothing if the reminders are kept in a store.
         :param filepath: Path to a file. None value (default) is converted to self.serialize_path.
+        :return: Future that is done when the file is written, or None if nothing is written
         """
+        if self.store is not None:
+            return None
         if filepath is None:
             filepath = self.serialize_path
+        is_backup = filepath == self.serialize_path
+        if is_backup and self.__changes == self.__serialized_changes:
+            return None
+
+        snapshot = {str(timestamp): list(cache_item.value) for timestamp, cache_item in self.cache.items()}
+        snapshot[self.NEXT_ID_KEY] = self.__next_id
+        journal_sequence = None
+        if self.journal is not None and is_backup:
+            journal_sequence = self.journal.sequence
+            snapshot[self.JOURNAL_SEQUENCE_KEY] = journal_sequence
+
+        future = self.loop.run_in_executor(self.__serialize_executor, self.__write_snapshot, filepath, snapshot)
+        if is_backup:
+            future = self.__backup_task = self.loop.create_task(self.__finish_backup(future, self.__changes,
+                                                                                     journal_sequence))
+        self.__pending_serializations.add(future)
+        future.add_done_callback(self.__pending_serializations.discard)
+        return future
 
-        tmp = {}
-        self.cache.delete_delegated(self.__cache_delete_check)
+    @staticmethod
+    def __write_snapshot(filepath: str, snapshot: dict):
+        """
+        Write serialized reminders into a temporary file and replace the target file with it.
+        """
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as target_file:
+            json.dump(snapshot, target_file, ensure_ascii=False, separators=(",", ":"))
+            target_file.flush()
+            os.fsync(target_file.fileno())
+        os.replace(tmp_path, filepath)
+
+    async def __finish_backup(self, write: asyncio.Future, changes: int, journal_sequence: Optional[int]):
+        """
+        Wait for a backup serialization and compact the journal after it.
 
-        for timestamp, cache_item in self.cache.items():
-            tmp[str(timestamp)] = cache_item.value
+        :param write: Future of writing the file
+        :param changes: Value of the change counter when the snapshot was taken
+        :param journal_sequence: Last journal sequence number included in the snapshot
+        """
+        try:
+            await write
+        except OSError as e:
+            self.__log(f"Could not serialize reminders: {e}")
+            return
 
-        with open(filepath, "w", encoding="utf-8") as target_file:
-            json.dump(tmp, target_file, indent=4, ensure_ascii=False)
+        self.__serialized_changes = max(self.__serialized_changes, changes)
+        if journal_sequence is not None:
+            await self.journal.compact(journal_sequence)
 
     def deserialize(self, filepath: str = None) -> None:
         """
-        Deserialize reminders from a json file to reminder cache.
+        Deserialize reminders from a json file to reminder cache, and replay the changes journaled after the file
+        was written.
         :param filepath: Path to a file containing serialized reminders. None value (default) is converted to
                          self.serialize_path.
+        :raises FileNotFoundError: If the file does not exist and there is no journal to replay
         """
         if filepath is None:
             filepath = self.serialize_path
 
-        with open(filepath, "r", encoding="utf-8") as serialized_file:
-            serialized_reminders = json.load(serialized_file)
+        try:
+            with open(filepath, "r", encoding="utf-8") as serialized_file:
+                serialized_reminders = json.load(serialized_file)
+        except FileNotFoundError:
+            if self.journal is None:
+                raise
+            serialized_reminders = {}
 
         # Load serialized reminders into the cache
         # They are in format {ts: [reminder, ... , reminder_n], ts2: [reminder, ... , reminder_m], ...}
+        journal_sequence = serialized_reminders.pop(self.JOURNAL_SEQUENCE_KEY, 0)
+        self.__next_id = max(self.__next_id, serialized_reminders.pop(self.NEXT_ID_KEY, 1))
         for timestamp, reminder_dict in serialized_reminders.items():
             self.cache[int(timestamp)] = reminder_dict
 
-        num_deleted = self.cache.delete_delegated(self.__cache_delete_check)
-        self.__log(f"Deleted {num_deleted} deprecated reminders.")
+        if self.journal is not None:
+            num_replayed = self.__replay_journal(journal_sequence)
+            self.__changes += num_replayed
+            self.__log(f"Replayed {num_replayed} changes from the journal.")
+
+        self.__reindex()
+        # Reminders in the past are deleted, except recurring ones that are moved to their next occurrence
+        current_time = self.__current_timestamp()
+        deprecated = [timestamp for timestamp in self.cache.keys() if timestamp <= int(current_time)]
+        num_deleted = 0
+        recurring = []
+        for timestamp in deprecated:
+            for reminder in self.cache.pop(timestamp):
+                self.__unindex(reminder)
+                if "repeat" in reminder:
+                    recurring.append((timestamp, reminder))
+                else:
+                    num_deleted += 1
+        self.__changes += len(deprecated)
+
+        for timestamp in self.cache.keys():
+            self.__scheduler.add(timestamp)
+        for timestamp, reminder in recurring:
+            self.__reschedule(timestamp, reminder, current_time)
+        self.__log(f"Deleted {num_deleted} deprecated reminders and rescheduled {len(recurring)} recurring ones.")
         self.__log(f"Loaded {len(self.cache)} reminders from serialized file.")
 
-    def add(self, timestamp: int, author_id: Union[int, str], channel_id: Union[int, str], message: str) -> None:
+    def __replay_journal(self, after_sequence: int) -> int:
+        """
+        Apply the journaled changes into the cache.
+
+        :param after_sequence: Last journal sequence number already included in the cache
+        :return: Number of replayed changes
+        """
+        num_replayed = 0
+        for record in self.journal.replay(after_sequence):
+            timestamp = record["ts"]
+            if record["op"] == "add":
+                reminder = record["reminder"]
+                try:
+                    reminder_list = self.cache[timestamp]
+                except KeyError:
+                    self.cache[timestamp] = [reminder]
+                else:
+                    if "id" not in reminder or all(other.get("id") != reminder["id"] for other in reminder_list):
+                        reminder_list.append(reminder)
+            elif record["op"] == "fire" and timestamp in self.cache:
+                del self.cache[timestamp]
+            elif record["op"] == "delete" and timestamp in self.cache:
+                reminder_list = self.cache[timestamp]
+                reminder_list[:] = [reminder for reminder in reminder_list
+                                    if reminder.get("id") != record["reminder"]["id"]]
+                if not reminder_list:
+                    del self.cache[timestamp]
+            num_replayed += 1
+
+        return num_replayed
+
+    def __reindex(self):
+        """
+        Rebuild the secondary indexes from the cache. Reminders serialized before they had ids are given one. If the
+        same reminder is found at several timestamps, e.g. a recurring reminder at its previous and next occurrence,
+        only the latest one is kept.
+        """
+        self.__reminders_by_id.clear()
+        self.__ids_by_author.clear()
+        self.__ids_by_channel.clear()
+        duplicates = []
+        for timestamp, cache_item in self.cache.items():
+            for reminder in cache_item.value:
+                if "id" not in reminder:
+                    reminder["id"] = self.__next_id
+                self.__next_id = max(self.__next_id, reminder["id"] + 1)
+                indexed = self.__reminders_by_id.get(reminder["id"])
+                if indexed is not None:
+                    if indexed[0] >= timestamp:
+                        duplicates.append((timestamp, reminder))
+                        continue
+                    duplicates.append(indexed)
+                    self.__unindex(indexed[1])
+                self.__index(timestamp, reminder)
+
+        for timestamp, duplicate in duplicates:
+            reminder_list = self.cache[timestamp]
+            reminder_list[:] = [reminder for reminder in reminder_list if reminder is not duplicate]
+            if not reminder_list:
+                del self.cache[timestamp]
+        if duplicates:
+            self.__changes += len(duplicates)
+            self.__log(f"Dropped {len(duplicates)} duplicate reminders.")
+
+    def __index(self, timestamp: int, reminder: dict):
+        reminder_id = reminder["id"]
+        self.__reminders_by_id[reminder_id] = (timestamp, reminder)
+        self.__ids_by_author.setdefault(reminder["author"], set()).add(reminder_id)
+        self.__ids_by_channel.setdefault(reminder["channel"], set()).add(reminder_id)
+
+    def __unindex(self, reminder: dict):
+        reminder_id = reminder["id"]
+        del self.__reminders_by_id[reminder_id]
+        for index, key in ((self.__ids_by_author, reminder["author"]), (self.__ids_by_channel, reminder["channel"])):
+            ids = index[key]
+            ids.discard(reminder_id)
+            if not ids:
+                del index[key]
+
+    def add(self, timestamp: int, author_id: Union[int, str], channel_id: Union[int, str], message: str,
+            repeat: Optional[str] = None) -> int:
         """
         Add a reminder
 
@@ -110,18 +344,151 @@ class Reminder:
         :param author_id: Discord ID of the reminder author. Reminder is mentioned when the reminder is triggered.
         :param channel_id: Discord ID of the reminder channel. Reminder is sent to this channel when triggered.
         :param message: Message for the reminder.
+        :param repeat: Recurrence rule spec for a recurring reminder, see recurrence.RecurrenceRule. After each
+                       trigger the reminder is moved to the next occurrence of the rule. None (default) triggers the
+                       reminder only once.
+        :return: Id of the new reminder
+        :raises ValueError: If the recurrence rule is invalid
         """
         if self.__loop_task is None:
             self.__log("WARNING: Reminder loop is not running. Reminders will not be triggered until one is started.")
 
-        reminder_data = dict(channel=str(channel_id), message=message, author=str(author_id))
+        timestamp = int(timestamp)
+        if repeat is not None:
+            parse_rule(repeat)
+        reminder_id = self.__next_id
+        self.__next_id += 1
+        reminder_data = dict(id=reminder_id, channel=str(channel_id), message=message, author=str(author_id))
+        if repeat is not None:
+            # Only the rule is stored. Its occurrences are computed one at a time when the reminder is triggered.
+            reminder_data["repeat"] = parse_rule(repeat).spec
+        if self.store is not None:
+            self.__track(self.store.add(timestamp, reminder_data))
+            if self.__loaded_until is None or timestamp >= self.__loaded_until:
+                # Loaded into memory when its window is loaded
+                return reminder_id
+
+        self.__insert(timestamp, reminder_data)
+        return reminder_id
+
+    def __insert(self, timestamp: int, reminder: dict):
+        """
+        Put a reminder into memory and the indexes, and journal it.
+        """
         try:
-            self.cache[int(timestamp)].append(reminder_data)
+            self.cache[timestamp].append(reminder)
         except KeyError:
-            self.cache[int(timestamp)] = [reminder_data]
+            self.cache[timestamp] = [reminder]
+        self.__index(timestamp, reminder)
+        self.__changes += 1
+        if self.journal is not None:
+            self.journal.append("add", timestamp, reminder)
 
-    def delete(self):
-        raise NotImplementedError
+        if self.__scheduler.add(timestamp) and self.__wakeup is not None:
+            # The new reminder is due before the one the loop is sleeping for
+            self.__wakeup.set()
+
+    def __reschedule(self, timestamp: int, reminder: dict, current_time: float):
+        """
+        Move a triggered or missed recurring reminder to its next occurrence.
+
+        :param timestamp: The previous due timestamp of the reminder
+        :param reminder: Reminder data, which is no longer in memory
+        :param current_time: Current timestamp. Occurrences before it are skipped.
+        """
+        next_timestamp = parse_rule(reminder["repeat"]).next_occurrence(timestamp, current_time)
+        if self.store is not None:
+            self.__track(self.store.reschedule(reminder["id"], next_timestamp))
+            if next_timestamp >= self.__loaded_until:
+                return
+        self.__insert(next_timestamp, reminder)
+
+    def __remove(self, reminder_id: int):
+        """
+        Remove a reminder from memory and the indexes, and journal the removal.
+        """
+        timestamp, reminder = self.__reminders_by_id[reminder_id]
+        self.__unindex(reminder)
+        reminder_list = self.cache[timestamp]
+        # Only the reminders due at the same second are searched
+        for i, other in enumerate(reminder_list):
+            if other is reminder:
+                del reminder_list[i]
+                break
+        if not reminder_list:
+            del self.cache[timestamp]
+            self.__scheduler.discard(timestamp)
+        self.__changes += 1
+        if self.journal is not None:
+            self.journal.append("delete", timestamp, dict(id=reminder_id))
+
+    async def delete(self, reminder_id: int, author_id: Optional[Union[int, str]] = None) -> bool:
+        """
+        Delete a reminder by its id.
+
+        :param reminder_id: Id of the reminder
+        :param author_id: If given, the reminder is deleted only if it belongs to this author
+        :return: True if the reminder was deleted, False if it does not exist or belongs to someone else
+        """
+        reminder_id = int(reminder_id)
+        author = str(author_id) if author_id is not None else None
+        entry = self.__reminders_by_id.get(reminder_id)
+        if entry is not None:
+            if author is not None and entry[1]["author"] != author:
+                return False
+            self.__remove(reminder_id)
+            if self.store is not None:
+                self.__track(self.store.delete(reminder_id))
+            return True
+        if self.store is None:
+            return False
+
+        num_deleted = await self.store.delete(reminder_id, author)
+        if reminder_id in self.__reminders_by_id:
+            # Its window was loaded while the reminder was deleted from the store
+            self.__remove(reminder_id)
+        return num_deleted > 0
+
+    async def delete_channel(self, channel_id: Union[int, str]) -> int:
+        """
+        Delete all reminders of a channel, e.g. when the channel is deleted.
+
+        :param channel_id: Discord ID of the channel
+        :return: Number of deleted reminders
+        """
+        channel = str(channel_id)
+        reminder_ids = list(self.__ids_by_channel.get(channel, ()))
+        for reminder_id in reminder_ids:
+            self.__remove(reminder_id)
+        if self.store is None:
+            return len(reminder_ids)
+
+        num_deleted = await self.store.delete_channel(channel)
+        for reminder_id in list(self.__ids_by_channel.get(channel, ())):
+            self.__remove(reminder_id)
+        return num_deleted
+
+    async def list_reminders(self, author_id: Union[int, str], offset: int = 0,
+                             limit: int = 10) -> Tuple[List[Tuple[int, dict]], int]:
+        """
+        List one page of the reminders of an author. Only the reminders of the author are looked at, so the time
+        does not depend on the total number of reminders.
+
+        :param author_id: Discord ID of the author
+        :param offset: Number of reminders skipped from the start
+        :param limit: Maximum number of listed reminders
+        :return: Tuple of a list of (timestamp, reminder data) tuples in due order, and the total number of reminders
+                 of the author
+        """
+        author = str(author_id)
+        if self.store is not None:
+            # The store has all reminders, including the ones not loaded into memory yet
+            return await self.store.list_author(author, offset, limit)
+
+        reminder_ids = self.__ids_by_author.get(author, ())
+        entries = heapq.nsmallest(offset + limit, (self.__reminders_by_id[reminder_id] for reminder_id in reminder_ids),
+                                  key=lambda entry: (entry[0], entry[1]["id"]))
+        return entries[offset:], len(reminder_ids)
 
     def stop(self) -> None:
         """
@@ -134,6 +501,23 @@ class Reminder:
         self.__loop_task.cancel()
         self.__log("Reminder loop stopped.")
         self.__loop_task = None
+        self.__wakeup = None
+
+    async def close(self) -> None:
+        """
+        Stop the reminder loop if it is running, and wait for the reminders being sent and the pending serializations.
+        Then close the journal and the worker threads. The store is not closed, as it is owned by the caller.
+        """
+        if self.__loop_task is not None:
+            self.stop()
+        if self.__dispatch_tasks:
+            await asyncio.gather(*self.__dispatch_tasks, return_exceptions=True)
+        if self.__pending_serializations:
+            await asyncio.gather(*self.__pending_serializations, return_exceptions=True)
+        if self.journal is not None:
+            await self.journal.close()
+        self.__serialize_executor.shutdown(wait=False)
+        self.__log("Reminder closed.")
 
     def start(self) -> None:
         """
@@ -143,47 +527,242 @@ class Reminder:
         if self.__loop_task is not None:
             raise ValueError("Reminder loop is already running for this Reminder instance.")
 
-        try:
-            self.deserialize(self.serialize_path)
-        except FileNotFoundError:
-            self.__log(f"File for serialized reminders does not exist. One is created automatically at serialization.")
+        if self.store is None:
+            try:
+                self.deserialize(self.serialize_path)
+            except FileNotFoundError:
+                self.__log(f"File for serialized reminders does not exist. One is created automatically at "
+                           f"serialization.")
 
         self.__loop_task = self.loop.create_task(self.__loop())
 
+    def __track(self, future: asyncio.Future):
+        """
+        Log errors of a store operation nobody waits for.
+        """
+        def done(completed: asyncio.Future):
+            if not completed.cancelled() and completed.exception() is not None:
+                self.__log(f"Reminder store operation failed: {completed.exception()}")
+
+        future.add_done_callback(done)
+
+    async def __load_window(self, current_time: float):
+        """
+        Load the reminders due before the end of the next window from the store into memory.
+        """
+        start = 0 if self.__loaded_until is None else self.__loaded_until
+        if self.__loaded_until is None:
+            num_deleted = await self.store.delete_until(int(current_time) - 1)
+            self.__log(f"Deleted {num_deleted} deprecated reminders.")
+        # Reminders added from now on are stored after the window is read, so they are put into memory directly
+        self.__loaded_until = int(current_time) + self.store_window
+        reminders = await self.store.load(start, self.__loaded_until)
+
+        for timestamp, reminder_data in reminders:
+            if "repeat" in reminder_data and timestamp < int(current_time):
+                # Missed while the bot was offline
+                self.__reschedule(timestamp, reminder_data, current_time)
+                continue
+            try:
+                self.cache[timestamp].append(reminder_data)
+            except KeyError:
+                self.cache[timestamp] = [reminder_data]
+            self.__index(timestamp, reminder_data)
+            self.__scheduler.add(timestamp)
+
+    def __dispatch_due(self, timestamps: List[int]):
+        """
+        Remove the reminders of due timestamps from the cache and send them in the background, so the loop can keep
+        on scheduling while the messages are sent.
+        """
+        reminders_by_channel: Dict[int, List[dict]] = {}
+        fired_timestamps = []
+        current_time = self.__current_timestamp()
+        for timestamp in timestamps:
+            try:
+                reminder_list = self.cache.pop(timestamp)
+            except KeyError:
+                continue
+            fired_timestamps.append(timestamp)
+            self.__changes += 1
+            if self.journal is not None:
+                # Journaled before the recurring reminders are moved, so a crash while the reminders are being sent
+                # can not leave them at both timestamps
+                self.journal.append("fire", timestamp)
+            for reminder in reminder_list:
+                self.__unindex(reminder)
+                if "repeat" in reminder:
+                    self.__reschedule(timestamp, reminder, current_time)
+                reminders_by_channel.setdefault(int(reminder["channel"]), []).append(reminder)
+
+        if not fired_timestamps:
+            return
+        task = self.loop.create_task(self.__dispatch(fired_timestamps, reminders_by_channel))
+        self.__dispatch_tasks.add(task)
+        task.add_done_callback(self.__dispatch_tasks.discard)
+
+    async def __dispatch(self, timestamps: List[int], reminders_by_channel: Dict[int, List[dict]]):
+        """
+        Send reminders grouped by channel. Channels are handled concurrently, with up to max_concurrent_sends requests
+        at a time over all dispatches.
+        """
+        if self.__send_semaphore is None:
+            self.__send_semaphore = asyncio.Semaphore(self.max_concurrent_sends)
+        results = await asyncio.gather(*[self.__send_to_channel(channel_id, reminders)
+                                         for channel_id, reminders in reminders_by_channel.items()],
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                self.__log(f"Could not send reminders: {result!r}")
+
+        if self.store is not None:
+            # Deleted only after the recurring reminders have been moved to their next occurrence
+            for timestamp in timestamps:
+                self.__track(self.store.delete_due(timestamp))
+
+    @classmethod
+    def __combine_messages(cls, reminders: List[dict]) -> List[str]:
+        """
+        Combine reminders into as few messages as possible without exceeding the Discord message length limit.
+        """
+        messages = []
+        current = ""
+        for reminder in reminders:
+            line = f"<@{reminder['author']}> {reminder['message']}"
+            if current and len(current) + 1 + len(line) > cls.MESSAGE_MAX_LENGTH:
+                messages.append(current)
+                current = ""
+            while len(line) > cls.MESSAGE_MAX_LENGTH:
+                messages.append(line[:cls.MESSAGE_MAX_LENGTH])
+                line = line[cls.MESSAGE_MAX_LENGTH:]
+            current = f"{current}\n{line}" if current else line
+        if current:
+            messages.append(current)
+        return messages
+
+    @staticmethod
+    def __is_retryable(error: Exception) -> bool:
+        """
+        :return: False for client errors other than rate limits, as they fail the same way when retried
+        """
+        return not isinstance(error, discord.HTTPException) or not 400 <= error.status < 500 or error.status == 429
+
+    @staticmethod
+    def __retry_delay(error: Exception, attempt: int) -> float:
+        """
+        :return: Seconds to wait before the next attempt. Rate limited requests wait as long as Discord tells.
+        """
+        if isinstance(error, discord.HTTPException) and error.status == 429:
+            try:
+                return float(error.response.headers["Retry-After"])
+            except (AttributeError, KeyError, TypeError, ValueError):
+                pass
+        return min(2 ** attempt, 60)
+
+    async def __resolve_channel(self, channel_id: int) -> Optional[discord.abc.Messageable]:
+        """
+        Get a channel from the bot cache, or fetch it from the API if it is not cached.
+
+        :return: The channel, or None if it does not exist or can not be accessed
+        """
+        channel = self.bot.get_channel(channel_id)
+        if channel is not None:
+            return channel
+
+        for attempt in range(self.max_send_attempts):
+            try:
+                async with self.__send_semaphore:
+                    return await self.bot.fetch_channel(channel_id)
+            except (discord.NotFound, discord.Forbidden, discord.InvalidData):
+                return None
+            except (discord.HTTPException, OSError, asyncio.TimeoutError) as e:
+                if not self.__is_retryable(e):
+                    return None
+                await asyncio.sleep(self.__retry_delay(e, attempt))
+        return None
+
+    async def __send_to_channel(self, channel_id: int, reminders: List[dict]):
+        """
+        Send the reminders of one channel, retrying failed messages with backoff. Waits for the earlier dispatched
+        sends of the same channel to finish first. A place in max_concurrent_sends is held only during requests, not
+        while waiting for a retry.
+        """
+        channel_lock = self.__channel_locks.get(channel_id)
+        if channel_lock is None:
+            channel_lock = self.__channel_locks[channel_id] = _ChannelLock()
+        channel_lock.users += 1
+        try:
+            async with channel_lock.lock:
+                channel = await self.__resolve_channel(channel_id)
+                if channel is None:
+                    self.__log(f"Dropped {len(reminders)} reminders for unavailable channel {channel_id}.")
+                    return
+
+                for content in self.__combine_messages(reminders):
+                    for attempt in range(self.max_send_attempts):
+                        try:
+                            async with self.__send_semaphore:
+                                await channel.send(content)
+                            break
+                        except (discord.NotFound, discord.Forbidden) as e:
+                            self.__log(f"Dropped reminders for channel {channel_id}: {e}")
+                            return
+                        except (discord.HTTPException, OSError, asyncio.TimeoutError) as e:
+                            if not self.__is_retryable(e):
+                                self.__log(f"Dropped a reminder message for channel {channel_id}: {e}")
+                                break
+                            await asyncio.sleep(self.__retry_delay(e, attempt))
+                    else:
+                        self.__log(f"Dropped a reminder message for channel {channel_id} after "
+                                   f"{self.max_send_attempts} attempts.")
+        finally:
+            channel_lock.users -= 1
+            if not channel_lock.users:
+                del self.__channel_locks[channel_id]
+
     async def __loop(self):
         """
-        An infinite loop that checks the existing reminders in cache in intervals, and notifies reminder authors
-        with specified messages. Automatically serializes existing reminders into specified file after specified
-        number of cache checkup rounds.
+        An infinite loop that sleeps until the next reminder is due, and notifies reminder authors with specified
+        messages. All reminders due by the current time are sent, so reminders are not skipped even if the loop is
+        late. Adding a reminder due before the next one wakes the loop up early. Automatically serializes existing
+        reminders into specified file every backup_threshold seconds, or earlier if the journal grows past
+        compaction_threshold changes. With a store, the next window of reminders is loaded when half of the current
+        one has passed.
 
         start() and stop() methods can be used for controlling this loop.
         """
-        deserialized_loops = 0
+        wakeup = self.__wakeup = asyncio.Event()
+        next_backup = time.monotonic() + self.backup_threshold
 
         self.__log("Reminder loop started.")
-        while True:
-            # Do a backup serialization every X loops
-            if deserialized_loops == self.backup_threshold:
-                deserialized_loops = 0
+        # A cancellation arriving just as the sleep times out can be lost, so the loop also ends when it is stopped
+        while self.__wakeup is wakeup:
+            # The journal is counted down only when its compaction finishes, so a running backup is not repeated
+            compaction_due = self.journal is not None and self.journal.num_records >= self.compaction_threshold and \
+                (self.__backup_task is None or self.__backup_task.done())
+            if time.monotonic() >= next_backup or compaction_due:
+                next_backup = time.monotonic() + self.backup_threshold
                 self.serialize()
 
-            utc_ts = int(datetime.datetime.utcnow().timestamp())
+            if self.store is not None and \
+                    (self.__loaded_until is None or
+                     self.__current_timestamp() >= self.__loaded_until - self.store_window / 2):
+                await self.__load_window(self.__current_timestamp())
 
-            try:
-                reminder_list = self.cache.pop(utc_ts)
-            except KeyError:
-                deserialized_loops += 1
-                await asyncio.sleep(1)
-                continue
+            self.__dispatch_due(self.__scheduler.pop_due(self.__current_timestamp()))
 
-            for reminder in reminder_list:
-                channel = self.bot.get_channel(int(reminder["channel"]))
-                author = self.bot.get_user(int(reminder["author"]))
-                message = reminder["message"]
-                await channel.send(f"{author.mention} {message}")
+            timeout = next_backup - time.monotonic()
+            if self.store is not None:
+                timeout = min(timeout, self.__loaded_until - self.store_window / 2 - self.__current_timestamp())
+            next_due = self.__scheduler.next_due()
+            if next_due is not None:
+                timeout = min(timeout, next_due - self.__current_timestamp())
 
-            deserialized_loops += 1
-            await asyncio.sleep(1)
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
 
 
 if __name__ == '__main__':
@@ -0,0 +1,405 @@
+"""
+MIT License
+
+Copyright (c) 2020 Visperi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Iterator, Iterable, Tuple, Callable
+
+
+class ReminderJournal:
+    """
+    Append-only write-ahead journal of reminder changes. Every change is one JSON line with an increasing sequence
+    number, so writing a change costs O(1) regardless of the number of reminders.
+
+    Changes are written and fsynced in a single worker thread. Changes appended while a write is in progress are
+    collected and written together in the next write (group commit), so a burst of changes needs only a few fsyncs.
+
+    The journal is compacted by writing the reminders into a snapshot that records the last included sequence
+    number, and then dropping the journal lines up to that number. Replaying skips the lines already in the snapshot,
+    so a crash between the two steps is harmless.
+    """
+
+    def __init__(self, path: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        :param path: Path to the journal file. Created if it does not exist.
+        :param loop: Event loop where the writes are scheduled. Default is the current event loop.
+        """
+        self.path = path
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.sequence = 0
+        # Number of changes appended since the journal was last compacted
+        self.num_records = 0
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=type(self).__name__)
+        self.__file = None
+        self.__buffer: List[bytes] = []
+        self.__flush_task: Optional[asyncio.Task] = None
+        self.__executor.submit(self.__truncate_torn_tail).result()
+        self.__executor.submit(self.__open).result()
+
+    def __open(self):
+        self.__file = open(self.path, "ab")
+        # Length of the journal up to its last complete write
+        self.__length = self.__file.tell()
+
+    def __truncate_torn_tail(self):
+        """
+        Cut the journal after its last valid line. Otherwise new lines would be appended after an incomplete one left
+        by a crash, and reading would stop there before reaching them.
+        """
+        valid_length = sum(len(line) for _, line in self.__read())
+        try:
+            if os.path.getsize(self.path) > valid_length:
+                os.truncate(self.path, valid_length)
+        except FileNotFoundError:
+            pass
+
+    def __write(self, lines: List[bytes]):
+        if self.__file.tell() != self.__length:
+            # Cutting off an earlier failed write has failed too
+            self.__cut_failed_write()
+        data = b"".join(lines)
+        try:
+            self.__file.write(data)
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+        except OSError:
+            self.__cut_failed_write()
+            raise
+        self.__length += len(data)
+
+    def __cut_failed_write(self):
+        """
+        Cut off the part of a failed write that may have reached the file. Otherwise the lines written again would
+        follow an incomplete line in the middle of the journal, and reading would stop before them.
+        """
+        try:
+            self.__file.close()
+        except OSError:
+            # The unwritten data is dropped, and the file is closed anyway
+            pass
+        try:
+            os.truncate(self.path, self.__length)
+        finally:
+            self.__file = open(self.path, "ab")
+
+    def __compact(self, sequence: int):
+        """
+        Rewrite the journal without the records up to the given sequence number.
+        """
+        kept = [line for record, line in self.__read() if record["seq"] > sequence]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as tmp_file:
+            tmp_file.write(b"".join(kept))
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        self.__file.close()
+        os.replace(tmp_path, self.path)
+        self.__open()
+
+    def __read(self) -> Iterator[tuple]:
+        """
+        Read the journal records and their raw lines. Reading stops at the first incomplete or invalid line, which
+        is left by a crash in the middle of a write.
+        """
+        try:
+            journal_file = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with journal_file:
+            for line in journal_file:
+                if not line.endswith(b"\n"):
+                    return
+                try:
+                    yield json.loads(line), line
+                except ValueError:
+                    return
+
+    def __close(self):
+        self.__file.close()
+
+    def append(self, operation: str, timestamp: int, reminder: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Append a change into the journal. The change is written in the background, see flush().
+
+        :param operation: Name of the change, e.g. "add" or "fire"
+        :param timestamp: Timestamp of the changed reminders
+        :param reminder: Data of the changed reminder, if the change concerns one reminder
+        :return: Sequence number of the change
+        """
+        self.sequence += 1
+        record = dict(seq=self.sequence, op=operation, ts=timestamp)
+        if reminder is not None:
+            record["reminder"] = reminder
+        self.__buffer.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode() + b"\n")
+        self.num_records += 1
+        if self.__flush_task is None:
+            self.__flush_task = self.loop.create_task(self.__flush())
+        return self.sequence
+
+    async def __flush(self):
+        try:
+            while self.__buffer:
+                lines, self.__buffer = self.__buffer, []
+                try:
+                    await self.loop.run_in_executor(self.__executor, self.__write, lines)
+                except OSError as e:
+                    # Keep the lines, so they are written with the next change
+                    self.__buffer[:0] = lines
+                    print(f"[{type(self).__name__}] Could not write into journal {self.path}: {e}")
+                    break
+        finally:
+            self.__flush_task = None
+
+    async def flush(self):
+        """
+        Wait until all appended changes are written and fsynced.
+        """
+        while self.__flush_task is not None:
+            await asyncio.shield(self.__flush_task)
+
+    def replay(self, after_sequence: int = 0) -> Iterator[Dict[str, Any]]:
+        """
+        Read the journaled changes. Also updates the sequence counter, so new changes continue after the replayed
+        ones.
+
+        :param after_sequence: Skip changes up to this sequence number, e.g. ones already included in a snapshot
+        :return: Iterator of the change records in the order they were appended
+        """
+        self.num_records = 0
+        # A compacted journal may be empty, and its numbering must still continue after the snapshot
+        self.sequence = max(self.sequence, after_sequence)
+        previous_sequence = 0
+        for record, _ in self.__read():
+            self.num_records += 1
+            if record["seq"] <= previous_sequence:
+                # Written again after a failed write
+                continue
+            previous_sequence = record["seq"]
+            self.sequence = max(self.sequence, previous_sequence)
+            if previous_sequence > after_sequence:
+                yield record
+
+    async def compact(self, sequence: int):
+        """
+        Drop the changes up to the given sequence number from the journal. Must be called only after a snapshot
+        including these changes is safely written.
+
+        :param sequence: Last sequence number included in the snapshot
+        """
+        self.num_records = 0
+        await self.loop.run_in_executor(self.__executor, self.__compact, sequence)
+
+    async def close(self):
+        """
+        Write the pending changes and close the journal.
+        """
+        await self.flush()
+        await self.loop.run_in_executor(self.__executor, self.__close)
+        self.__executor.shutdown(wait=False)
+
+
+class SqliteReminderStore:
+    """
+    Storage for reminders in a local sqlite file, indexed by due time, author and channel. Reminder keeps only the
+    reminders due in the near future in memory and loads the rest from the store when their time gets closer.
+
+    All database work is done in a single writer thread, which owns the database connection. Operations are submitted
+    to the thread immediately when called and are executed in the same order, so the event loop never waits for the
+    database and the results are consistent with the order of the calls.
+    """
+
+    def __init__(self, path: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        :param path: Path to the sqlite file. Created if it does not exist.
+        :param loop: Event loop where the results are delivered. Default is the current event loop.
+        """
+        self.path = path
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=type(self).__name__)
+        self.__connection: Optional[sqlite3.Connection] = None
+        # Largest reminder id ever stored. Ids of deleted reminders are not reused.
+        self.last_id = 0
+        self.__executor.submit(self.__connect).result()
+
+    def __connect(self):
+        self.__connection = sqlite3.connect(self.path)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        self.__connection.execute("CREATE TABLE IF NOT EXISTS reminders (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                  "due INTEGER NOT NULL, author TEXT NOT NULL, channel TEXT NOT NULL, "
+                                  "message TEXT NOT NULL, repeat TEXT)")
+        columns = [row[1] for row in self.__connection.execute("PRAGMA table_info(reminders)")]
+        if "repeat" not in columns:
+            self.__connection.execute("ALTER TABLE reminders ADD COLUMN repeat TEXT")
+        self.__connection.execute("CREATE INDEX IF NOT EXISTS reminders_due ON reminders (due)")
+        self.__connection.execute("CREATE INDEX IF NOT EXISTS reminders_author ON reminders (author, due)")
+        self.__connection.execute("CREATE INDEX IF NOT EXISTS reminders_channel ON reminders (channel, due)")
+        self.__connection.commit()
+        row = self.__connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'reminders'").fetchone()
+        self.last_id = row[0] if row is not None else 0
+
+    def __submit(self, function: Callable, *args) -> asyncio.Future:
+        return self.loop.run_in_executor(self.__executor, function, *args)
+
+    def __add(self, timestamp: int, reminder: Dict[str, Any]) -> int:
+        cursor = self.__connection.execute("INSERT INTO reminders (id, due, author, channel, message, repeat) "
+                                           "VALUES (?, ?, ?, ?, ?, ?)",
+                                           (reminder.get("id"), timestamp, reminder["author"], reminder["channel"],
+                                            reminder["message"], reminder.get("repeat")))
+        self.__connection.commit()
+        return cursor.lastrowid
+
+    @staticmethod
+    def __to_reminders(rows: Iterable[tuple]) -> List[Tuple[int, Dict[str, Any]]]:
+        reminders = []
+        for reminder_id, due, author, channel, message, repeat in rows:
+            reminder = dict(id=reminder_id, channel=channel, message=message, author=author)
+            if repeat is not None:
+                reminder["repeat"] = repeat
+            reminders.append((due, reminder))
+        return reminders
+
+    def __load(self, start: int, end: int) -> List[Tuple[int, Dict[str, Any]]]:
+        rows = self.__connection.execute("SELECT id, due, author, channel, message, repeat FROM reminders "
+                                         "WHERE due >= ? AND due < ? ORDER BY due, id", (start, end))
+        return self.__to_reminders(rows)
+
+    def __list_author(self, author: str, offset: int, limit: int) -> Tuple[List[Tuple[int, Dict[str, Any]]], int]:
+        rows = self.__connection.execute("SELECT id, due, author, channel, message, repeat FROM reminders "
+                                         "WHERE author = ? ORDER BY due, id LIMIT ? OFFSET ?", (author, limit, offset))
+        reminders = self.__to_reminders(rows)
+        total = self.__connection.execute("SELECT COUNT(*) FROM reminders WHERE author = ?", (author,)).fetchone()[0]
+        return reminders, total
+
+    def __delete_where(self, condition: str, args: tuple) -> int:
+        cursor = self.__connection.execute(f"DELETE FROM reminders WHERE {condition}", args)
+        self.__connection.commit()
+        return cursor.rowcount
+
+    def __reschedule(self, reminder_id: int, timestamp: int):
+        self.__connection.execute("UPDATE reminders SET due = ? WHERE id = ?", (timestamp, reminder_id))
+        self.__connection.commit()
+
+    def __count(self) -> int:
+        return self.__connection.execute("SELECT COUNT(*) FROM reminders").fetchone()[0]
+
+    def __close(self):
+        self.__connection.close()
+        self.__connection = None
+
+    def add(self, timestamp: int, reminder: Dict[str, Any]) -> asyncio.Future:
+        """
+        Store a reminder.
+
+        :param timestamp: Due timestamp of the reminder
+        :param reminder: Reminder data with keys channel, message and author, and optionally id and repeat. A new id
+                         is generated if it is not given.
+        :return: Future of the id of the stored reminder
+        """
+        return self.__submit(self.__add, timestamp, reminder)
+
+    def list_author(self, author: str, offset: int = 0, limit: int = 10) -> asyncio.Future:
+        """
+        Load one page of the reminders of an author.
+
+        :param author: Discord ID of the author
+        :param offset: Number of reminders skipped from the start
+        :param limit: Maximum number of reminders loaded
+        :return: Future of a tuple of a list of (timestamp, reminder data) tuples in due order, and the total number
+                 of reminders of the author
+        """
+        return self.__submit(self.__list_author, author, offset, limit)
+
+    def delete(self, reminder_id: int, author: Optional[str] = None) -> asyncio.Future:
+        """
+        Delete a reminder by its id.
+
+        :param reminder_id: Id of the reminder
+        :param author: If given, the reminder is deleted only if it belongs to this author
+        :return: Future of the number of deleted reminders
+        """
+        if author is None:
+            return self.__submit(self.__delete_where, "id = ?", (reminder_id,))
+        return self.__submit(self.__delete_where, "id = ? AND author = ?", (reminder_id, author))
+
+    def delete_channel(self, channel: str) -> asyncio.Future:
+        """
+        Delete all reminders of a channel.
+
+        :return: Future of the number of deleted reminders
+        """
+        return self.__submit(self.__delete_where, "channel = ?", (channel,))
+
+    def load(self, start: int, end: int) -> asyncio.Future:
+        """
+        Load the reminders due in a time window.
+
+        :param start: Start of the window, inclusive
+        :param end: End of the window, exclusive
+        :return: Future of a list of (timestamp, reminder data) tuples in due order
+        """
+        return self.__submit(self.__load, start, end)
+
+    def delete_due(self, timestamp: int) -> asyncio.Future:
+        """
+        Delete all reminders due at a timestamp. Recurring reminders must be rescheduled before this.
+
+        :return: Future of the number of deleted reminders
+        """
+        return self.__submit(self.__delete_where, "due = ?", (timestamp,))
+
+    def delete_until(self, timestamp: int) -> asyncio.Future:
+        """
+        Delete all one-shot reminders due at or before a timestamp. Recurring reminders are kept, so they can be
+        rescheduled.
+
+        :return: Future of the number of deleted reminders
+        """
+        return self.__submit(self.__delete_where, "due <= ? AND repeat IS NULL", (timestamp,))
+
+    def reschedule(self, reminder_id: int, timestamp: int) -> asyncio.Future:
+        """
+        Move a recurring reminder to its next occurrence.
+
+        :param reminder_id: Id of the reminder
+        :param timestamp: Next due timestamp of the reminder
+        :return: Future that is done when the reminder is updated
+        """
+        return self.__submit(self.__reschedule, reminder_id, timestamp)
+
+    def count(self) -> asyncio.Future:
+        """
+        :return: Future of the number of stored reminders
+        """
+        return self.__submit(self.__count)
+
+    async def close(self):
+        """
+        Close the database connection after all pending operations are done.
+        """
+        await self.__submit(self.__close)
+        self.__executor.shutdown(wait=False)
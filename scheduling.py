@@ -0,0 +1,367 @@
+"""
+MIT License
+
+Copyright (c) 2020 Visperi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import heapq
+from typing import List, Optional, Set, Tuple
+
+
+class HeapScheduler:
+    """
+    Min-heap of due timestamps. Tells when the next timestamp is due and pops all timestamps that are due at a given
+    time, so timestamps can not be skipped even if they are checked late.
+
+    Each timestamp is scheduled only once. Discarded timestamps are removed from the heap lazily.
+    """
+
+    def __init__(self):
+        self.__heap: List[int] = []
+        self.__scheduled: Set[int] = set()
+
+    def __len__(self):
+        return len(self.__scheduled)
+
+    def __contains__(self, timestamp: int) -> bool:
+        return timestamp in self.__scheduled
+
+    def __prune(self):
+        """
+        Pop discarded timestamps from the top of the heap.
+        """
+        heap = self.__heap
+        while heap and heap[0] not in self.__scheduled:
+            heapq.heappop(heap)
+
+    def add(self, timestamp: int) -> bool:
+        """
+        Schedule a timestamp. Does nothing if the timestamp is already scheduled.
+
+        :param timestamp: The due timestamp
+        :return: True if the timestamp is now the next due one
+        """
+        if timestamp in self.__scheduled:
+            return False
+        next_due = self.next_due()
+        self.__scheduled.add(timestamp)
+        heapq.heappush(self.__heap, timestamp)
+        if len(self.__heap) > 2 * len(self.__scheduled) + 64:
+            # Too many discarded timestamps have piled up, rebuild the heap from the scheduled ones
+            self.__heap = list(self.__scheduled)
+            heapq.heapify(self.__heap)
+        return next_due is None or timestamp < next_due
+
+    def discard(self, timestamp: int):
+        """
+        Unschedule a timestamp. Does nothing if the timestamp is not scheduled.
+        """
+        self.__scheduled.discard(timestamp)
+
+    def next_due(self) -> Optional[int]:
+        """
+        :return: The earliest scheduled timestamp, or None if nothing is scheduled
+        """
+        self.__prune()
+        return self.__heap[0] if self.__heap else None
+
+    def pop_due(self, current_time: float) -> List[int]:
+        """
+        Unschedule all timestamps that are due at the given time.
+
+        :param current_time: Current timestamp
+        :return: The due timestamps in ascending order
+        """
+        due = []
+        heap = self.__heap
+        scheduled = self.__scheduled
+        while heap and heap[0] <= current_time:
+            timestamp = heapq.heappop(heap)
+            if timestamp in scheduled:
+                scheduled.remove(timestamp)
+                due.append(timestamp)
+        return due
+
+    def clear(self):
+        self.__heap.clear()
+        self.__scheduled.clear()
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel of due timestamps with one second resolution. Has the same interface as HeapScheduler,
+    but scales better for very large numbers of timestamps.
+
+    Timestamps are stored in the slots of four wheels: seconds of the current minute, minutes of the current hour,
+    hours of the current day and the following days. Timestamps further in the future wait in an overflow heap. When
+    the wheels are advanced to a new minute, hour or day, the timestamps in its slot are moved down to the finer
+    wheels. Each timestamp is moved at most four times, so adding, discarding and advancing cost amortized O(1).
+
+    The wheel a timestamp is in is determined by the timestamp and the current time of the wheels, so no separate
+    index is needed for discarding timestamps.
+    """
+
+    # Size of a slot in seconds for each wheel
+    SLOT_SECONDS = (1, 60, 3600, 86400)
+
+    def __init__(self, current_time: float, num_days: int = 366):
+        """
+        :param current_time: Timestamp the wheels start from
+        :param num_days: Number of slots in the day wheel. Timestamps further than this in the future are kept in
+                         the overflow heap until they get closer.
+        """
+        self.num_days = num_days
+        self.__current = int(current_time)
+        self.__wheels: List[List[Set[int]]] = [[set() for _ in range(size)] for size in (60, 60, 24, num_days)]
+        self.__wheel_sizes = [0, 0, 0, 0]
+        self.__overflow = HeapScheduler()
+        # Timestamps added when they were already due
+        self.__past: Set[int] = set()
+        # Cached result of next_due(), so adding timestamps does not need to search the wheels
+        self.__next_due: Optional[int] = None
+        self.__next_due_valid = True
+
+    def __len__(self):
+        return sum(self.__wheel_sizes) + len(self.__overflow) + len(self.__past)
+
+    def __contains__(self, timestamp: int) -> bool:
+        location = self.__locate(timestamp)
+        if location is None:
+            return timestamp in self.__past
+        if location[0] == 4:
+            return timestamp in self.__overflow
+        return timestamp in self.__wheels[location[0]][location[1]]
+
+    @property
+    def current_time(self) -> int:
+        """
+        :return: The timestamp the wheels have been advanced to
+        """
+        return self.__current
+
+    def __locate(self, timestamp: int) -> Optional[Tuple[int, int]]:
+        """
+        :return: Index of the wheel and the slot the timestamp belongs to at the current time. Wheel index 4 is the
+                 overflow heap. None if the timestamp is already due.
+        """
+        current = self.__current
+        if timestamp <= current:
+            return None
+        if timestamp // 60 == current // 60:
+            return 0, timestamp % 60
+        if timestamp // 3600 == current // 3600:
+            return 1, timestamp // 60 % 60
+        day = timestamp // 86400
+        if day == current // 86400:
+            return 2, timestamp // 3600 % 24
+        if day - current // 86400 < self.num_days:
+            return 3, day % self.num_days
+        return 4, 0
+
+    def __place(self, timestamp: int):
+        location = self.__locate(timestamp)
+        if location is None:
+            self.__past.add(timestamp)
+        elif location[0] == 4:
+            self.__overflow.add(timestamp)
+        else:
+            self.__wheels[location[0]][location[1]].add(timestamp)
+            self.__wheel_sizes[location[0]] += 1
+
+    def __cascade(self, wheel_index: int, slot_index: int):
+        """
+        Move all timestamps in a slot into the finer wheels.
+        """
+        slot = self.__wheels[wheel_index][slot_index]
+        if not slot:
+            return
+        self.__wheel_sizes[wheel_index] -= len(slot)
+        self.__wheels[wheel_index][slot_index] = set()
+
+        # Cascading happens at the start of the slot, so all its timestamps belong to the current day
+        current = self.__current
+        minute, hour = current // 60, current // 3600
+        seconds_wheel, minutes_wheel, hours_wheel = self.__wheels[:3]
+        cascaded = [0, 0, 0]
+        for timestamp in slot:
+            if timestamp <= current:
+                self.__past.add(timestamp)
+            elif timestamp // 60 == minute:
+                seconds_wheel[timestamp % 60].add(timestamp)
+                cascaded[0] += 1
+            elif timestamp // 3600 == hour:
+                minutes_wheel[timestamp // 60 % 60].add(timestamp)
+                cascaded[1] += 1
+            else:
+                hours_wheel[timestamp // 3600 % 24].add(timestamp)
+                cascaded[2] += 1
+        for index, count in enumerate(cascaded):
+            self.__wheel_sizes[index] += count
+
+    def add(self, timestamp: int) -> bool:
+        """
+        Schedule a timestamp. Does nothing if the timestamp is already scheduled.
+
+        :param timestamp: The due timestamp
+        :return: True if the timestamp is now the next due one
+        """
+        next_due = self.next_due()
+        location = self.__locate(timestamp)
+        if location is None:
+            if timestamp in self.__past:
+                return False
+            self.__past.add(timestamp)
+        elif location[0] == 4:
+            if timestamp in self.__overflow:
+                return False
+            self.__overflow.add(timestamp)
+        else:
+            slot = self.__wheels[location[0]][location[1]]
+            if timestamp in slot:
+                return False
+            slot.add(timestamp)
+            self.__wheel_sizes[location[0]] += 1
+
+        if next_due is None or timestamp < next_due:
+            self.__next_due = timestamp
+            return True
+        return False
+
+    def discard(self, timestamp: int):
+        """
+        Unschedule a timestamp. Does nothing if the timestamp is not scheduled.
+        """
+        if timestamp == self.__next_due:
+            self.__next_due_valid = False
+        location = self.__locate(timestamp)
+        if location is None:
+            self.__past.discard(timestamp)
+        elif location[0] == 4:
+            self.__overflow.discard(timestamp)
+        else:
+            slot = self.__wheels[location[0]][location[1]]
+            if timestamp in slot:
+                slot.remove(timestamp)
+                self.__wheel_sizes[location[0]] -= 1
+
+    def next_due(self) -> Optional[int]:
+        """
+        Find the earliest timestamp from the first non-empty slot of the finest non-empty wheel.
+
+        :return: The earliest scheduled timestamp, or None if nothing is scheduled
+        """
+        if not self.__next_due_valid:
+            self.__next_due = self.__find_next_due()
+            self.__next_due_valid = True
+        return self.__next_due
+
+    def __find_next_due(self) -> Optional[int]:
+        if self.__past:
+            return min(self.__past)
+
+        current = self.__current
+        for wheel_index, slot_seconds in enumerate(self.SLOT_SECONDS):
+            if not self.__wheel_sizes[wheel_index]:
+                continue
+            wheel = self.__wheels[wheel_index]
+            unit = current // slot_seconds
+            for offset in range(1, len(wheel) + 1):
+                slot = wheel[(unit + offset) % len(wheel)]
+                if slot:
+                    return min(slot)
+
+        return self.__overflow.next_due()
+
+    def pop_due(self, current_time: float) -> List[int]:
+        """
+        Advance the wheels to the given time and unschedule all timestamps that are due. After a long pause the
+        wheels catch up by skipping the spans where the finer wheels are empty, so the cost depends on the number
+        of non-empty slots instead of the length of the pause.
+
+        :param current_time: Current timestamp
+        :return: The due timestamps in ascending order
+        """
+        target = int(current_time)
+        if not self.__next_due_valid or (self.__next_due is not None and self.__next_due <= target):
+            self.__next_due_valid = False
+        due = sorted(self.__past)
+        self.__past.clear()
+        wheel_sizes = self.__wheel_sizes
+        seconds_wheel = self.__wheels[0]
+
+        while self.__current < target:
+            current = self.__current
+            if wheel_sizes[0] and (current + 1) % 60:
+                # Pop the seconds of the current minute. A slot of the second wheel can only contain one second.
+                last_second = min(target, current - current % 60 + 59)
+                for second in range(current + 1, last_second + 1):
+                    slot = seconds_wheel[second % 60]
+                    if slot:
+                        wheel_sizes[0] -= len(slot)
+                        due.extend(slot)
+                        slot.clear()
+                        if not wheel_sizes[0]:
+                            last_second = second
+                            break
+                self.__current = last_second
+                continue
+
+            # Skip to the next boundary of the finest non-empty wheel
+            if wheel_sizes[0] or wheel_sizes[1]:
+                current = (current // 60 + 1) * 60
+            elif wheel_sizes[2]:
+                current = (current // 3600 + 1) * 3600
+            elif wheel_sizes[3] or self.__overflow:
+                current = (current // 86400 + 1) * 86400
+            else:
+                self.__current = target
+                break
+            if current > target:
+                # No boundary is crossed before the target
+                self.__current = target
+                break
+
+            self.__current = current
+            if current % 3600 == 0:
+                if current % 86400 == 0:
+                    day = current // 86400
+                    for timestamp in self.__overflow.pop_due((day + self.num_days) * 86400 - 1):
+                        self.__place(timestamp)
+                    self.__cascade(3, day % self.num_days)
+                self.__cascade(2, current // 3600 % 24)
+            self.__cascade(1, current // 60 % 60)
+
+            # Timestamps due exactly at the boundary are cascaded into the past timestamps
+            if self.__past:
+                due.extend(sorted(self.__past))
+                self.__past.clear()
+
+        return due
+
+    def clear(self):
+        for wheel in self.__wheels:
+            for slot in wheel:
+                slot.clear()
+        self.__wheel_sizes = [0, 0, 0, 0]
+        self.__overflow.clear()
+        self.__past.clear()
+        self.__next_due = None
+        self.__next_due_valid = True
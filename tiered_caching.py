@@ -0,0 +1,210 @@
+"""
+MIT License
+
+Copyright (c) 2021 Visperi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import time
+from typing import Any, Optional, Callable, Awaitable, Set, Tuple
+from caching import Cache, CacheItem, EEvictionPolicy, EEvictionReason
+from cache_backends import CacheBackend, CacheBackendError
+
+
+class _L2Entry:
+    """
+    Value stored in L2 together with the wall clock time it was fetched at, so its age survives demotion, promotion
+    and moving between processes.
+    """
+    __slots__ = ("value", "created_time")
+
+    def __init__(self, value: Any, created_time: float):
+        self.value = value
+        self.created_time = created_time
+
+    def __getstate__(self):
+        return self.value, self.created_time
+
+    def __setstate__(self, state: Tuple[Any, float]):
+        self.value, self.created_time = state
+
+
+class TieredCache(Cache):
+    """
+    Two-level cache, where the ordinary in-memory Cache is the first level (L1) and a CacheBackend the second one
+    (L2). Items evicted from L1 because it is full or because they expired are demoted into L2. get_or_fetch() looks
+    for items that are not in L1 from L2 before fetching them, and promotes found items back into L1.
+
+    If L2 is shared between processes, fetched values are written into it immediately, and a fetch lock in L2 makes
+    other processes wait for the value instead of fetching it again.
+
+    Items keep their age over L2, so max age and stale-while-revalidate work for promoted items like for items that
+    stayed in L1.
+
+    Works as a drop-in replacement for Cache, but only get_or_fetch() uses L2. Other operations handle only L1.
+    """
+
+    # Items evicted for these reasons are still valid, so they are worth keeping on disk
+    DEMOTED_REASONS = (EEvictionReason.size, EEvictionReason.weight, EEvictionReason.expired)
+
+    def __init__(self, name: Optional[str], storage: CacheBackend, loop: Optional[asyncio.AbstractEventLoop] = None,
+                 max_size: Optional[int] = None, eviction_policy: EEvictionPolicy = EEvictionPolicy.lru,
+                 max_bytes: Optional[int] = None, fetch_lock_ttl: float = 30, fetch_poll_interval: float = 0.1):
+        """
+        :param name: Optional name for the cache.
+        :param storage: The second level storage
+        :param loop: Event loop where the items are demoted into L2. Default is the current event loop.
+        :param max_size: Maximum number of items in L1.
+        :param eviction_policy: Policy used to choose the evicted item when L1 is full.
+        :param max_bytes: Maximum total weight of the values in L1.
+        :param fetch_lock_ttl: Seconds after which a fetch lock of a shared L2 is released even if its owner died
+        :param fetch_poll_interval: Seconds between checks for a value that another process is fetching
+        """
+        super().__init__(name, max_size=max_size, eviction_policy=eviction_policy, max_bytes=max_bytes)
+        self.storage = storage
+        self.fetch_lock_ttl = fetch_lock_ttl
+        self.fetch_poll_interval = fetch_poll_interval
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.__pending_demotions: Set[asyncio.Task] = set()
+        # Keys of outdated items promoted from L2 with stale-while-revalidate, which still need a refresh
+        self.__stale_promotions: Set[Any] = set()
+        self.eviction_listener = self.__demote
+
+    def __demote(self, cache_item: CacheItem, reason: EEvictionReason):
+        if reason not in self.DEMOTED_REASONS:
+            return
+
+        entry = _L2Entry(cache_item.value, time.time() - cache_item.age)
+        task = self.loop.create_task(self.storage.set(cache_item.key, entry))
+        self.__pending_demotions.add(task)
+        task.add_done_callback(self.__demotion_done)
+
+    def __demotion_done(self, task: asyncio.Task):
+        self.__pending_demotions.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[{type(self).__name__}] Could not demote an item from cache {self.name}: {task.exception()}")
+
+    async def get_or_fetch(self, cache_key: Any, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Get an item from L1, or from L2 if it is not in L1, or fetch it if it is in neither. Items found from L2 are
+        added back into L1. See Cache.get_or_fetch().
+
+        :param cache_key: Key to be searched from cache
+        :param coro_factory: Function without arguments returning an awaitable that produces the value
+        :return: The cached or fetched value
+        """
+        if cache_key in self:
+            # Refreshes of outdated items must go past L2
+            if self.storage.shared:
+                return await super().get_or_fetch(cache_key, lambda: self.__refresh(cache_key, coro_factory))
+            return await super().get_or_fetch(cache_key, coro_factory)
+
+        value = await super().get_or_fetch(cache_key, lambda: self.__load(cache_key, coro_factory))
+        if cache_key in self.__stale_promotions:
+            self.__stale_promotions.discard(cache_key)
+            # Returns the outdated value and refreshes it in the background
+            return await self.get_or_fetch(cache_key, coro_factory)
+        return value
+
+    def __unpack(self, entry: Any) -> Tuple[Any, float]:
+        """
+        :return: The value of an L2 entry and its age in seconds. Entries stored before ages were kept are new.
+        """
+        if isinstance(entry, _L2Entry):
+            return entry.value, max(time.time() - entry.created_time, 0)
+        return entry, 0
+
+    def __promote(self, cache_key: Any, entry: Any) -> Tuple[Any, bool]:
+        """
+        Unpack an entry found from L2, and restore its age when it is added into L1.
+
+        :return: The value, and False if the value is outdated and must be fetched again before it is returned
+        """
+        value, age = self.__unpack(entry)
+        if self.max_age is not None and age >= self.max_age:
+            if not self.stale_while_revalidate:
+                return value, False
+            self.__stale_promotions.add(cache_key)
+        # Runs after Cache has added the returned value into L1
+        self.loop.call_soon(self.__restore_age, cache_key, time.monotonic() - age)
+        return value, True
+
+    def __restore_age(self, cache_key: Any, created_time: float):
+        try:
+            self._get_item(cache_key)._created_time = created_time
+        except KeyError:
+            pass
+
+    async def __store(self, cache_key: Any, value: Any):
+        """
+        Write a fetched value through into a shared L2, so other processes can use it.
+        """
+        try:
+            await self.storage.set(cache_key, _L2Entry(value, time.time()))
+        except CacheBackendError as e:
+            print(f"[{type(self).__name__}] Could not store a fetched item into cache {self.name}: {e}")
+
+    async def __refresh(self, cache_key: Any, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+        value = await coro_factory()
+        await self.__store(cache_key, value)
+        return value
+
+    async def __load(self, cache_key: Any, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.storage.shared:
+            try:
+                value, is_fresh = self.__promote(cache_key, await self.storage.get(cache_key))
+            except (KeyError, CacheBackendError):
+                return await coro_factory()
+            return value if is_fresh else await coro_factory()
+
+        try:
+            while True:
+                try:
+                    value, is_fresh = self.__promote(cache_key, await self.storage.get(cache_key))
+                    # An outdated value is fetched again like a missing one
+                    if is_fresh:
+                        return value
+                except KeyError:
+                    pass
+                if await self.storage.try_lock(cache_key, self.fetch_lock_ttl):
+                    break
+                # Another process is fetching the value. Its lock expires even if the process dies.
+                await asyncio.sleep(self.fetch_poll_interval)
+        except CacheBackendError:
+            return await coro_factory()
+
+        try:
+            value = await coro_factory()
+            await self.__store(cache_key, value)
+        finally:
+            try:
+                await self.storage.unlock(cache_key)
+            except CacheBackendError:
+                pass
+        return value
+
+    async def close(self):
+        """
+        Wait for pending demotions and close the L2 storage.
+        """
+        if self.__pending_demotions:
+            await asyncio.gather(*self.__pending_demotions, return_exceptions=True)
+        await self.storage.close()